@@ -0,0 +1,180 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import time
+
+
+class ADS1015:
+    """
+    Reads several single ended ADS1015 channels one after another.
+
+    Each channel's result is read as soon as its conversion is finished and only then the next channel's conversion
+    is started. If a conversion takes safely longer than reading the result (low data rates, see OSCILLATOR_TOLERANCE),
+    the next conversion is started first and the finished result is read while the ADC is converting
+    (the conversion register keeps the previous result until the new conversion is done).
+    After the last channel the first channel's conversion is started for the next call.
+    With the default i2c_read_time, 490 SPS is the highest data rate that is pipelined. At 1600 SPS (the default)
+    reads are not pipelined on purpose: converting and then reading each channel (4 x 1.1 ms) is still faster
+    than pipelined reads at 490 SPS (4 x 2 ms).
+
+    In continuous mode a conversion in progress when the channel is changed still finishes with the old channel,
+    so with more than one channel the first conversion after changing the channel is skipped.
+
+    End of conversion is detected with the ALERT/RDY pin if ready_event is supplied (alert_rdy_callback must
+    be called on its falling edge), otherwise by waiting for the longest conversion time measured from when
+    the conversion was started.
+
+    Based on https://github.com/pimoroni/explorer-hat/blob/master/library/explorerhat/ads1015.py
+    """
+
+    REG_CONV = 0x00
+    REG_CFG = 0x01
+    REG_LO_THRESH = 0x02
+    REG_HI_THRESH = 0x03
+
+    SAMPLES_PER_SECOND_MAP = {128: 0x0000, 250: 0x0020, 490: 0x0040, 920: 0x0060, 1600: 0x0080, 2400: 0x00A0, 3300: 0x00C0}
+    CHANNEL_MAP = {0: 0x4000, 1: 0x5000, 2: 0x6000, 3: 0x7000}
+    PROGRAMMABLE_GAIN_MAP = {6144: 0x0000, 4096: 0x0200, 2048: 0x0400, 1024: 0x0600, 512: 0x0800, 256: 0x0A00}
+
+    START_SINGLE_SHOT = 0x8000
+    MODE_SINGLE_SHOT = 0x0100
+    COMPARATOR_DISABLED = 0x0003  # comparator disabled, ALERT/RDY pin high impedance
+    COMPARATOR_RDY = 0x0000  # assert ALERT/RDY after every conversion (with thresholds set by enable_alert_rdy)
+
+    # Data rate of the internal oscillator varies by up to 10%
+    OSCILLATOR_TOLERANCE = 0.1
+
+    def __init__(self, i2c, address=0x48, channels=(0, 1, 2, 3), programmable_gain=6144, samples_per_second=1600,
+                 continuous=False, ready_event=None, i2c_read_time=0.0005, raw=False, clock=time.monotonic, sleep=time.sleep):
+        """
+        Constructor
+        :param i2c: SMBus (or compatible) object
+        :param address: I2C address of the ADC
+        :param channels: channels to read, in order they are returned by read_channels
+        :param programmable_gain: full scale range in mV
+        :param samples_per_second: ADC data rate
+        :param continuous: use continuous conversion mode instead of single shot conversions
+        :param ready_event: threading.Event set when ALERT/RDY pin signals end of conversion, or None to wait for conversion time
+        :param i2c_read_time: longest time reading the conversion register takes; reading overlaps the next conversion
+                              only if the fastest conversion takes at least twice as long, otherwise the next conversion
+                              could overwrite result before it is read
+        :param raw: return conversion register values (12 bit two's complement codes, as unsigned) instead of voltages
+        :param clock: monotonic clock returning seconds
+        :param sleep: function to sleep given number of seconds
+        """
+        self.i2c = i2c
+        self.address = address
+        self.channels = tuple(channels)
+        self.programmable_gain = programmable_gain
+        self.samples_per_second = samples_per_second
+        self.continuous = continuous
+        self.ready_event = ready_event
+        self.clock = clock
+        self.sleep = sleep
+
+        self.conversion_time = 1.0 / samples_per_second
+        self.max_conversion_time = self.conversion_time * (1 + ADS1015.OSCILLATOR_TOLERANCE)
+        min_conversion_time = self.conversion_time * (1 - ADS1015.OSCILLATOR_TOLERANCE)
+        # in continuous mode the ADC doesn't wait to be started - results have to be read after they are ready
+        self.pipelined = not continuous and min_conversion_time >= 2 * i2c_read_time
+        self.scale = 1 if raw else programmable_gain / 2048.0 / 1000.0
+
+        base_config = ADS1015.SAMPLES_PER_SECOND_MAP[samples_per_second] | ADS1015.PROGRAMMABLE_GAIN_MAP[programmable_gain]
+        base_config |= ADS1015.COMPARATOR_RDY if ready_event is not None else ADS1015.COMPARATOR_DISABLED
+        if not continuous:
+            base_config |= ADS1015.MODE_SINGLE_SHOT | ADS1015.START_SINGLE_SHOT
+        self._config_bytes = [[(c >> 8) & 0xFF, c & 0xFF] for c in [base_config | ADS1015.CHANNEL_MAP[channel] for channel in self.channels]]
+
+        # conversions that have to finish after a start before the result is of the started channel
+        self._conversions_needed = 2 if continuous and len(self.channels) > 1 else 1
+
+        self.values = [0.0] * len(self.channels)
+        self._pending = None
+        self._started_at = 0.0
+        self._ready_count = 0
+
+        self._samples = [0] * len(self.channels)
+        self._stats_since = clock()
+
+        if ready_event is not None:
+            self.enable_alert_rdy()
+
+    def enable_alert_rdy(self):
+        # Setting MSB of Hi_thresh and clearing MSB of Lo_thresh turns ALERT/RDY into conversion ready pin
+        self.i2c.write_i2c_block_data(self.address, ADS1015.REG_HI_THRESH, [0x80, 0x00])
+        self.i2c.write_i2c_block_data(self.address, ADS1015.REG_LO_THRESH, [0x00, 0x00])
+
+    def alert_rdy_callback(self, _pin):
+        self._ready_count += 1
+        self.ready_event.set()
+
+    def _start(self, index):
+        if self.ready_event is not None:
+            self.ready_event.clear()
+        self.i2c.write_i2c_block_data(self.address, ADS1015.REG_CFG, self._config_bytes[index])
+        self._pending = index
+        self._started_at = self.clock()
+        self._ready_count = 0
+
+    def _wait_ready(self):
+        needed = self._conversions_needed
+        if self.ready_event is not None:
+            # count is checked after the event is cleared, so an edge between the two is not lost
+            while self._ready_count < needed:
+                if not self.ready_event.wait(self.max_conversion_time * 2):
+                    break  # missed edge - fall through to timed wait
+                self.ready_event.clear()
+            else:
+                return
+        remaining = self._started_at + self.max_conversion_time * needed - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def _read_conversion(self):
+        data = self.i2c.read_i2c_block_data(self.address, ADS1015.REG_CONV, 2)
+        return (((data[0] << 8) | data[1]) >> 4) * self.scale
+
+    def read_channels(self):
+        """
+        Reads all channels
+        :return: list of voltages (or raw codes) in order of channels (the same list is updated on every call)
+        """
+        values = self.values
+        count = len(self.channels)
+
+        if count == 1 and self.continuous and self._pending is not None:
+            # Single channel in continuous mode: conversion register always holds the latest sample
+            values[0] = self._read_conversion()
+            self._samples[0] += 1
+            return values
+
+        if self._pending is None:
+            self._start(0)
+
+        for i in range(count):
+            self._wait_ready()
+            next_index = i + 1 if i + 1 < count else 0
+            if self.pipelined:
+                self._start(next_index)
+                values[i] = self._read_conversion()
+            else:
+                values[i] = self._read_conversion()
+                if count > 1 or not self.continuous:
+                    self._start(next_index)
+            self._samples[i] += 1
+
+        return values
+
+    def samples_per_second_achieved(self):
+        """
+        Returns achieved samples per second for each channel since last call
+        """
+        now = self.clock()
+        elapsed = now - self._stats_since
+        result = {channel: (self._samples[i] / elapsed if elapsed > 0 else 0.0) for i, channel in enumerate(self.channels)}
+        self._samples = [0] * len(self.channels)
+        self._stats_since = now
+        return result
@@ -8,15 +8,16 @@
 
 import os
 import sys
-import RPi.GPIO as GPIO
+import threading
 import time
 
-from smbus import SMBus
+from ads1015 import ADS1015
 from bt_joystick import Joystick
+from bt_joystick.conditioning import InputConditioner, default_calibration_path
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
 
 
 class ExplorerPHatJoystick(Joystick):
-    # Based on https://github.com/pimoroni/explorer-hat/blob/master/library/explorerhat/ads1015.py
 
     UP = 18
     DOWN = 27
@@ -38,103 +39,143 @@ class ExplorerPHatJoystick(Joystick):
     PGA_0_512V = 512
     PGA_0_256V = 256
 
-    REG_CONV = 0x00
-    REG_CFG = 0x01
-
-    def __init__(self):
-        self.address = 0x48
-        self.i2c = SMBus(1)
-
-        self.samples_per_second_map = {128: 0x0000, 250: 0x0020, 490: 0x0040, 920: 0x0060, 1600: 0x0080, 2400: 0x00A0, 3300: 0x00C0}
-        self.channel_map = {0: 0x4000, 1: 0x5000, 2: 0x6000, 3: 0x7000}
-        self.programmable_gain_map = {6144: 0x0000, 4096: 0x0200, 2048: 0x0400, 1024: 0x0600, 512: 0x0800, 256: 0x0A00}
+    # axis -> ADC channel, in order channels are read (which is order of axes in the report)
+    AXIS_CHANNELS = (('x', 2), ('y', 1), ('rx', 3), ('ry', 0))
+
+    # ADC codes for 0V, 2.5V and 5V at 6.144V full scale - calibration until the sticks are calibrated
+    DEFAULT_CALIBRATION = (0, 833, 1666)
+
+    BUTTON_PINS = {
+        'dpad_up': UP, 'dpad_down': DOWN, 'dpad_left': LEFT, 'dpad_right': RIGHT,
+        'thumbl': LB, 'thumbr': RB,
+        'trigger': TRIGGER, 'tl': TL, 'tr': TR, 'thumb': THUMB
+    }
+
+    # A press within this time after a release is contact bounce of the release and isn't latched as a new press
+    DEBOUNCE_MS = 5
+
+    def __init__(self, gpio=None, i2c=None, adc_rdy_pin=None, conditioner=None, clock=time.monotonic):
+        """
+        Constructor
+        :param gpio: GPIO module (RPi.GPIO or a fake with the same functions); RPi.GPIO if not supplied
+        :param i2c: SMBus for the ADC; SMBus(1) if not supplied
+        :param adc_rdy_pin: GPIO pin ADS1015 ALERT/RDY is wired to, if it is, so conversions are not waited for with sleeps
+        :param conditioner: InputConditioner for the ADC codes; auto calibrating one with small radial dead zones
+                            saved under 'explorer_phat' name if not supplied
+        :param clock: monotonic clock returning seconds, for debouncing
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        if i2c is None:
+            from smbus import SMBus
+            i2c = SMBus(1)
+        self.i2c = i2c
 
         self.axis = { 'x': 0.0, 'y': 0.0, 'rx': 0.0, 'ry': 0.0 }
         self.buttons = { 'trigger': False, 'tl': False, 'tr': False, 'thumb': False, 'dpad_up': False, 'dpad_down': False, 'dpad_left': False, 'dpad_right': False, 'thumbl': False, 'thumbr': False }
 
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-
-        GPIO.setup(ExplorerPHatJoystick.UP, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.DOWN, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.LEFT, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.RIGHT, GPIO.IN)
-
-        GPIO.setup(ExplorerPHatJoystick.LB, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.RB, GPIO.IN)
-
-        GPIO.setup(ExplorerPHatJoystick.TRIGGER, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.TR, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.TL, GPIO.IN)
-        GPIO.setup(ExplorerPHatJoystick.THUMB, GPIO.IN)
-
-    def _read_se_adc(self, channel=1, programmable_gain=6144, samples_per_second=1600):
-        # sane defaults
-        config = 0x0003 | 0x0100
-
-        config |= self.samples_per_second_map[samples_per_second]
-        config |= self.channel_map[channel]
-        config |= self.programmable_gain_map[programmable_gain]
-
-        # set "single shot" mode
-        config |= 0x8000
-
-        # write single conversion flag
-        self.i2c.write_i2c_block_data(self.address, ExplorerPHatJoystick.REG_CFG, [(config >> 8) & 0xFF, config & 0xFF])
-
-        delay = (1.0 / samples_per_second) + 0.0001
-        time.sleep(delay)
-
-        data = self.i2c.read_i2c_block_data(self.address, ExplorerPHatJoystick.REG_CONV)
-
-        return (((data[0] << 8) | data[1]) >> 4) * programmable_gain / 2048.0 / 1000.0
-
-    @staticmethod
-    def _fix(v):
-        r = int(((v - 2.5) / 2.5) * 127)
-        if r < 0:
-            r = 256 + r
-        elif r > 127:
-            r = 127
-
-        try:
-            c = chr(r)
-        except Exception as e:
-            print("Failed to convert " + str(v) + " got " + str(r))
-            r = 0
-
-        # print("Read joystick value as " + str(v) + " fixed it to " + str(r))
-        return r
+        # Buttons are captured by edge callbacks (running in GPIO library's thread) into bitmasks:
+        # _button_state is current state and _button_presses latches presses since last readButtons()
+        # so taps shorter than the read interval are not lost.
+        self.gpio = gpio
+        self.wake_event = threading.Event()
+        self._button_lock = threading.Lock()
+        self._button_names = list(self.buttons)
+        self.button_bit_names = self._button_names  # buttons are sent straight from readButtonBits()
+
+        self._remap_buttons = DEFAULT_JOYSTICK_DESCRIPTION.mapping().bit_remapper(self._button_names).remap
+        self._pin_bits = {pin: 1 << self._button_names.index(name) for name, pin in ExplorerPHatJoystick.BUTTON_PINS.items()}
+        self._button_state = 0
+        self._button_presses = 0
+        self._clock = clock
+        self._debounce = ExplorerPHatJoystick.DEBOUNCE_MS / 1000.0
+        self._released_at = {pin: None for pin in self._pin_bits}
+
+        gpio.setmode(gpio.BCM)
+        gpio.setwarnings(False)
+
+        for pin in self._pin_bits:
+            gpio.setup(pin, gpio.IN)
+
+        for pin, bit in self._pin_bits.items():
+            if not gpio.input(pin):
+                self._button_state |= bit
+            # no bouncetime - the library would drop a release coming within bouncetime after a press, leaving button pressed
+            gpio.add_event_detect(pin, gpio.BOTH, callback=self._button_edge)
+
+        adc_ready_event = threading.Event() if adc_rdy_pin is not None else None
+        # 1600 SPS is too fast for reads to overlap conversions, but reads all channels sooner than any pipelined data rate
+        self.adc = ADS1015(self.i2c, address=0x48, channels=[channel for _, channel in ExplorerPHatJoystick.AXIS_CHANNELS],
+                           programmable_gain=ExplorerPHatJoystick.PGA_6_144V, samples_per_second=1600, ready_event=adc_ready_event, raw=True)
+        if adc_rdy_pin is not None:
+            gpio.setup(adc_rdy_pin, gpio.IN)
+            gpio.add_event_detect(adc_rdy_pin, gpio.FALLING, callback=self.adc.alert_rdy_callback)
+
+        if conditioner is None:
+            conditioner = InputConditioner([axis for axis, _ in ExplorerPHatJoystick.AXIS_CHANNELS], ExplorerPHatJoystick.DEFAULT_CALIBRATION,
+                                           radial_pairs=(('x', 'y'), ('rx', 'ry')), radial_dead_zone=0.05,
+                                           path=default_calibration_path("explorer_phat"))
+        self.conditioner = conditioner
+        self._conditioned = [0] * len(ExplorerPHatJoystick.AXIS_CHANNELS)
+        if not conditioner.calibrated:
+            # sticks are expected to be at rest when started for the first time
+            conditioner.calibrate_centre(self.adc.read_channels())
+
+    def _button_edge(self, pin):
+        # Level is read again instead of relying on the edge: callbacks of a bouncing contact may come late
+        # or be missed, but the callback of the last edge always reads the settled level.
+        bit = self._pin_bits[pin]
+        pressed = not self.gpio.input(pin)
+        now = self._clock()
+        with self._button_lock:
+            if pressed:
+                released_at = self._released_at[pin]
+                if not self._button_state & bit and (released_at is None or now - released_at >= self._debounce):
+                    self._button_presses |= bit
+                self._button_state |= bit
+            else:
+                if self._button_state & bit:
+                    self._released_at[pin] = now
+                self._button_state &= ~bit
+        self.wake_event.set()
+
+    def readButtonBits(self):
+        """
+        Returns bitmask of buttons pressed now or pressed (even briefly) since last call;
+        bit order is the order of keys in self.buttons
+        """
+        with self._button_lock:
+            bits = self._button_state | self._button_presses
+            self._button_presses = 0
+        return bits
 
     def readAxis(self):
-        self.axis['rx'] = self._fix(self._read_se_adc(3))
-        self.axis['ry'] = self._fix(self._read_se_adc(0))
-        self.axis['x'] = self._fix(self._read_se_adc(2))
-        self.axis['y'] = self._fix(self._read_se_adc(1))
+        conditioned = self.conditioner.condition(self.adc.read_channels(), self._conditioned)
+        for i, (axis, _) in enumerate(ExplorerPHatJoystick.AXIS_CHANNELS):
+            self.axis[axis] = conditioned[i]
         return self.axis
 
     def readButtons(self):
-        self.buttons['dpad_up'] = not bool(GPIO.input(ExplorerPHatJoystick.UP))
-        self.buttons['dpad_down'] = not bool(GPIO.input(ExplorerPHatJoystick.DOWN))
-        self.buttons['dpad_left'] = not bool(GPIO.input(ExplorerPHatJoystick.LEFT))
-        self.buttons['dpad_right'] = not bool(GPIO.input(ExplorerPHatJoystick.RIGHT))
-
-        self.buttons['thumbl'] = not bool(GPIO.input(ExplorerPHatJoystick.LB))
-        self.buttons['thumbr'] = not bool(GPIO.input(ExplorerPHatJoystick.RB))
-
-        self.buttons['trigger'] = not bool(GPIO.input(ExplorerPHatJoystick.TRIGGER))
-        self.buttons['tl'] = not bool(GPIO.input(ExplorerPHatJoystick.TL))
-        self.buttons['tr'] = not bool(GPIO.input(ExplorerPHatJoystick.TR))
-        self.buttons['thumb'] = not bool(GPIO.input(ExplorerPHatJoystick.THUMB))
+        bits = self.readButtonBits()
+        for i, name in enumerate(self._button_names):
+            self.buttons[name] = bool(bits & (1 << i))
 
         return self.buttons
 
+    def readState(self, state):
+        """
+        Fills JoystickState in place; used instead of readAxis and readButtons so nothing is allocated on each read
+        """
+        self.conditioner.condition(self.adc.read_channels(), state.axes)
+        state.button_bits = self._remap_buttons(self.readButtonBits())
+
 
 if __name__ == "__main__":
     if not os.geteuid() == 0:
         sys.exit("Only root can run this script")
 
-    from bt_joystick import BluetoothJoystickDeviceMain
+    from bt_joystick import BackgroundAcquisition, BluetoothJoystickDeviceMain
 
-    bluetooth_joystick = BluetoothJoystickDeviceMain(ExplorerPHatJoystick())
+    # ADC is read (and filtered) in its own thread, so its conversion time doesn't delay reports
+    bluetooth_joystick = BluetoothJoystickDeviceMain(BackgroundAcquisition(ExplorerPHatJoystick(), rate=200, filter=BackgroundAcquisition.FILTER_MEDIAN, window=3))
     bluetooth_joystick.run()
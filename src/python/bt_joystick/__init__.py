@@ -1,17 +1,59 @@
-
 #
 # Copyright 2019 Games Creators Club
 #
 # MIT License
 #
 
+# Public names and submodules are imported only when first used, so pure Python parts
+# (descriptors, reports, SDP records) can be used without D-Bus and GLib being imported - or even installed.
+
+import importlib
+import sys
+
+_SUBMODULES = (
+    "acquisition", "async_bt_device", "bt_adapter", "bt_device", "bt_device_classes", "change_detector", "descriptor_cache",
+    "hid_device", "hid_report", "hid_report_descriptor", "hidp", "joystick_description", "main", "multi_device", "recording", "report_sender",
+    "scheduler", "sdp_record", "simulated_host", "stats", "transport"
+)
+
+_PUBLIC_NAMES = {
+    "BTDevice": "bt_device",
+    "HIDDevice": "hid_device",
+    "L2CAPTransport": "transport",
+    "LoopbackTransport": "transport",
+    "SimulatedHost": "simulated_host",
+    "AsyncBTDevice": "async_bt_device",
+    "BackgroundAcquisition": "acquisition",
+    "Joystick": "main",
+    "JoystickDescription": "joystick_description",
+    "Axis": "joystick_description",
+    "JoystickState": "joystick_description",
+    "BluetoothJoystickDeviceMain": "main",
+    "VirtualDevice": "multi_device",
+    "MultiDeviceMain": "multi_device",
+    "ReportRecorder": "recording",
+    "ReportReplayer": "recording",
+}
+
+__all__ = list(_PUBLIC_NAMES)
+
+
+def __getattr__(name):
+    if name in _PUBLIC_NAMES:
+        value = getattr(importlib.import_module("bt_joystick." + _PUBLIC_NAMES[name]), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module("bt_joystick." + name)
+    else:
+        raise AttributeError("module 'bt_joystick' has no attribute '" + name + "'")
+    globals()[name] = value
+    return value
 
 
-import bt_joystick.bt_device_classes
-import bt_joystick.bt_device
-import bt_joystick.hid_report_descriptor
-import bt_joystick.sdp_record
+def __dir__():
+    return sorted(list(globals()) + list(_PUBLIC_NAMES) + list(_SUBMODULES))
 
-from bt_joystick.bt_device import BTDevice
-from bt_joystick.main import Joystick, BluetoothJoystickDeviceMain
 
+if sys.version_info < (3, 7):
+    # module level __getattr__ (PEP 562) is not supported - everything is imported straight away
+    for _name in _PUBLIC_NAMES:
+        __getattr__(_name)
@@ -0,0 +1,219 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import threading
+import time
+
+from array import array
+
+from bt_joystick.main import joystick_description, state_reader
+from bt_joystick.scheduler import FixedRateScheduler
+
+
+class BackgroundAcquisition:
+    """
+    Reads a joystick in its own thread at its own rate, filters axis values over the last samples and publishes
+    the latest filtered state. It is a joystick itself (with readState), so it can be passed to BluetoothJoystickDeviceMain
+    or VirtualDevice instead of the joystick it reads - slow reads (I2C ADC, for instance) then don't delay reports
+    and axes can be sampled more often than reports are sent.
+
+    State is published through two JoystickState buffers: the acquisition thread fills the one readers don't use and
+    then swaps them. readState copies the published buffer without taking any lock and copies it again in the rare case
+    the buffers were swapped (and the buffer being copied possibly written to) while it was copying.
+
+    Button presses are latched until read, so a press shorter than the report period is still reported.
+    Hat switches are not filtered.
+    """
+    FILTER_NONE = "none"
+    FILTER_MEAN = "mean"  # average of the last window samples (oversampling)
+    FILTER_MEDIAN = "median"  # median of the last window samples - removes spikes
+    FILTER_EMA = "ema"  # exponential moving average with ema_alpha weight of the new sample
+
+    FILTERS = (FILTER_NONE, FILTER_MEAN, FILTER_MEDIAN, FILTER_EMA)
+
+    def __init__(self, joystick, rate=250, filter=FILTER_MEDIAN, window=5, ema_alpha=0.3, clock=time.monotonic, sleep=time.sleep, autostart=True):
+        """
+        Constructor
+        :param joystick: Joystick implementation to read - with readState or readAxis and readButtons
+        :param rate: how many times a second joystick is read
+        :param filter: one of FILTERS
+        :param window: number of samples mean and median are calculated over
+        :param ema_alpha: weight of new sample for exponential moving average (0..1]
+        :param clock: monotonic clock returning seconds
+        :param sleep: function to sleep given number of seconds
+        :param autostart: start acquisition thread on the first readState; if False, it must be started with start()
+                          (or samples taken with sample())
+        """
+        if filter not in BackgroundAcquisition.FILTERS:
+            raise ValueError("Filter must be one of " + str(BackgroundAcquisition.FILTERS) + " but got " + str(filter))
+        if window < 1:
+            raise ValueError("Window must be at least 1 but got " + str(window))
+        if not 0 < ema_alpha <= 1:
+            raise ValueError("EMA alpha must be in (0, 1] but got " + str(ema_alpha))
+
+        self.joystick = joystick
+        self.description = joystick_description(joystick)
+        self.filter = filter
+        self.window = window
+        self.ema_alpha = ema_alpha
+
+        # set whenever a sample changes buttons, so reports with button changes can be sent straight away
+        self.wake_event = threading.Event()
+
+        mapping = self.description.mapping()
+        self._read_state = state_reader(joystick, mapping)
+        self._sample = mapping.create_state()
+        self._buffers = (mapping.create_state(), mapping.create_state())
+        self._front = 0
+        self._generation = 0
+        self._read_generation = 0  # last generation readState returned - written by readers only
+        self._latched_buttons = 0
+
+        self._axis_count = mapping.axis_count
+        self._columns = [array("h", [0] * window) for _ in range(self._axis_count)]
+        self._slot = 0
+        self._ema = [0.0] * self._axis_count
+        self._primed = False
+
+        self.scheduler = FixedRateScheduler(rate, clock=clock, sleep=sleep)
+        self.scheduler.wake_event = getattr(joystick, 'wake_event', None)
+        self.samples = 0
+        self.errors = 0
+        self.retries = 0
+        self.failing = 0  # failed reads in a row
+        self.autostart = autostart
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts acquisition thread; also started by the first readState
+        """
+        if self._thread is None:
+            self.running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        self.scheduler.start()
+        while self.running:
+            self.scheduler.wait()
+            self.sample()
+
+    def sample(self):
+        """
+        Reads the joystick once and publishes filtered state - what acquisition thread does on every tick
+        :return: True if joystick was read
+        """
+        sample = self._sample
+        try:
+            self._read_state(sample)
+        except Exception as e:
+            # a failed read (I2C error, for instance) is skipped - the last published state stays.
+            # Only the first failure of a series is printed (and then recovery), not every failed read
+            self.errors += 1
+            if self.failing == 0:
+                print("Failed to read joystick " + str(e) + "; retrying")
+            self.failing += 1
+            return False
+        if self.failing > 0:
+            print("Reading joystick recovered after " + str(self.failing) + " failed reads")
+            self.failing = 0
+        self.samples += 1
+        self._publish(sample)
+        return True
+
+    def _filter(self, sample, values):
+        axes = sample.axes
+        count = self._axis_count
+        if not self._primed:
+            # the first sample fills the whole window
+            for i in range(count):
+                column = self._columns[i]
+                for slot in range(self.window):
+                    column[slot] = axes[i]
+                self._ema[i] = axes[i]
+            self._primed = True
+
+        if self.filter == BackgroundAcquisition.FILTER_NONE:
+            for i in range(count):
+                values[i] = axes[i]
+        elif self.filter == BackgroundAcquisition.FILTER_EMA:
+            ema = self._ema
+            alpha = self.ema_alpha
+            for i in range(count):
+                ema[i] += alpha * (axes[i] - ema[i])
+                values[i] = int(round(ema[i]))
+        else:
+            slot = self._slot
+            self._slot = slot + 1 if slot + 1 < self.window else 0
+            columns = self._columns
+            for i in range(count):
+                columns[i][slot] = axes[i]
+            if self.filter == BackgroundAcquisition.FILTER_MEDIAN:
+                middle = self.window // 2
+                for i in range(count):
+                    values[i] = sorted(columns[i])[middle]
+            else:
+                window = self.window
+                for i in range(count):
+                    values[i] = int(round(sum(columns[i]) / window))
+
+        # hat switches are copied as they are
+        for i in range(count, len(values)):
+            values[i] = sample.values[i]
+
+    def _publish(self, sample):
+        back = self._buffers[self._front ^ 1]
+        self._filter(sample, back.values)
+
+        button_bits = sample.button_bits
+        if self._read_generation != self._generation:
+            # previous state wasn't read yet - keep its presses
+            button_bits |= self._latched_buttons
+        self._latched_buttons = button_bits
+        changed_buttons = button_bits != self._buffers[self._front].button_bits
+        back.button_bits = button_bits
+
+        # generation is increased after buffers are swapped and before the next write to the buffer that was
+        # in front, so a reader still copying that buffer notices it was swapped
+        self._front ^= 1
+        self._generation += 1
+
+        if changed_buttons:
+            self.wake_event.set()
+
+    def readState(self, state):
+        """
+        Copies the latest filtered state; never blocks
+        :param state: JoystickState created by mapping of the same description
+        """
+        if self._thread is None and self.autostart:
+            self.start()
+
+        while True:
+            generation = self._generation
+            front = self._buffers[self._front]
+            state.values[:] = front.values
+            state.button_bits = front.button_bits
+            if self._generation == generation:
+                break
+            self.retries += 1
+        self._read_generation = generation
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "errors": self.errors,
+            "retries": self.retries,
+            "scheduler": self.scheduler.stats()
+        }
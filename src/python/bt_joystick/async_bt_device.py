@@ -0,0 +1,158 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import asyncio
+
+from bt_joystick.transport import ChannelPairer, L2CAPTransport, peer_address
+
+
+class AsyncBTDevice:
+    """
+    Asyncio variant of BTDevice's connection handling: accepting control and interrupt channels, sending reports
+    and receiving control channel messages are all done on non-blocking sockets in the event loop,
+    so reading sensors, handling control messages and sending can overlap.
+
+    It only handles the channels - the adapter and SDP record are still set up by BTDevice
+    (or anything else that registers the profile with BlueZ).
+    Any connection oriented sockets can be used instead of L2CAP ones (for instance UNIX sockets in tests).
+    """
+    CONTROL_MTU = 1024
+    CHANNEL_NAMES = ("control", "interrupt")
+
+    def __init__(self, scontrol, sinterrupt, report_encoder=None):
+        """
+        Constructor
+        :param scontrol: listening server socket for the control channel
+        :param sinterrupt: listening server socket for the interrupt channel
+        :param report_encoder: ReportEncoder used by send_values
+        """
+        self.scontrol = scontrol
+        self.sinterrupt = sinterrupt
+        self.scontrol.setblocking(False)
+        self.sinterrupt.setblocking(False)
+
+        self.report_encoder = report_encoder
+
+        self.ccontrol = None
+        self.cinterrupt = None
+        self.peer = None
+
+        self._pairer = ChannelPairer()
+
+    @classmethod
+    def from_transport(cls, transport, report_encoder=None, backlog=1):
+        scontrol, sinterrupt = transport.listen_sockets(backlog)
+        return cls(scontrol, sinterrupt, report_encoder=report_encoder)
+
+    @classmethod
+    def l2cap(cls, report_encoder=None, backlog=1):
+        return cls.from_transport(L2CAPTransport(), report_encoder=report_encoder, backlog=backlog)
+
+    async def listen(self, pair_timeout=5.0):
+        """
+        Waits for the host to connect control and interrupt channels. Channels are accepted in whichever order they arrive
+        and paired by peer address; a channel whose pair doesn't arrive within pair_timeout is closed.
+        :param pair_timeout: how long a channel waits for the other channel from the same peer
+        """
+        loop = asyncio.get_running_loop()
+        self.close_connection()
+
+        ready = asyncio.Event()
+        listening = (self.scontrol, self.sinterrupt)
+        for s in listening:
+            loop.add_reader(s, ready.set)
+        try:
+            while True:
+                wait = self._pairer.expire(loop.time(), pair_timeout)
+                try:
+                    await asyncio.wait_for(ready.wait(), wait)
+                except asyncio.TimeoutError:
+                    continue
+                ready.clear()
+
+                for channel, s in enumerate(listening):
+                    try:
+                        sock, info = s.accept()
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    sock.setblocking(False)
+                    address = peer_address(info)
+                    print("Got a connection on the " + AsyncBTDevice.CHANNEL_NAMES[channel] + " channel from " + str(address))
+
+                    paired = self._pairer.add(channel, sock, address, loop.time())
+                    if paired is not None:
+                        self.ccontrol, self.cinterrupt = paired
+                        self.peer = address
+                        return
+        finally:
+            for s in listening:
+                loop.remove_reader(s)
+
+    async def send(self, message):
+        await asyncio.get_running_loop().sock_sendall(self.cinterrupt, message)
+
+    async def send_control(self, message):
+        await asyncio.get_running_loop().sock_sendall(self.ccontrol, message)
+
+    async def send_values(self, button_bits, axis_values, hat_value):
+        """
+        Convenience function to send a message with button states, axis values and hat switch state - see BTDevice.send_values
+        """
+        encoder = self.report_encoder
+        if encoder is None:
+            raise ValueError("No report encoder supplied - cannot encode values")
+
+        encoder.set_buttons(button_bits)
+        encoder.set_axes(axis_values)
+        if len(encoder.layout.hat_switches) > 0:
+            encoder.set_hat_switch(hat_value)
+        # encoder's buffer is reused - another send_values could change it while this one waits for the socket
+        await self.send(bytes(encoder.encode()))
+
+    async def receive_control(self):
+        """
+        Receives next message from the control channel
+        :return: message bytes or None if the host closed the channel
+        """
+        data = await asyncio.get_running_loop().sock_recv(self.ccontrol, self.CONTROL_MTU)
+        return data if len(data) > 0 else None
+
+    async def serve_control(self, handler):
+        """
+        Answers control channel messages with the given handler until the host closes the channel
+        or unplugs the virtual cable. Meant to run as a task alongside the sender.
+        :param handler: HIDPControlHandler
+        """
+        async for message in self:
+            reply = handler.handle(message)
+            if reply is not None:
+                await self.send_control(reply)
+            if handler.unplugged:
+                self.close_connection()
+                break
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.receive_control()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def close_connection(self):
+        for s in (self.ccontrol, self.cinterrupt):
+            if s is not None:
+                s.close()
+        self.ccontrol = None
+        self.cinterrupt = None
+        self.peer = None
+
+    def close(self):
+        self.close_connection()
+        self._pairer.close()
+        self.scontrol.close()
+        self.sinterrupt.close()
@@ -0,0 +1,557 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Benchmarks of descriptor building, SDP record generation and the report hot path.
+#
+# Run with:
+#   python -m bt_joystick.bench [--iterations N] [--json FILE|-]
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bt_joystick import hid_report_descriptor
+from bt_joystick import sdp_record
+
+from bt_joystick.acquisition import BackgroundAcquisition
+from bt_joystick.change_detector import ChangeDetector
+from bt_joystick.conditioning import InputConditioner
+from bt_joystick.descriptor_cache import DescriptorCache
+from bt_joystick.hid_report import ReportEncoder
+from bt_joystick.hid_report_descriptor import Usage
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
+from bt_joystick.main import state_reader
+from bt_joystick.recording import ReportRecorder, ReportReplayer
+from bt_joystick.report_sender import CoalescingReportSender
+from bt_joystick.sdp_record import MinorDeviceClass
+
+
+ALL_AXES = (Usage.X, Usage.Y, Usage.Z, Usage.Rx, Usage.Ry, Usage.Rz, Usage.Slider, Usage.Dial)
+
+ENCODING_VARIANTS = ((8, 2), (14, 4), (16, 4), (32, 6), (64, 8))
+
+
+def _percentile(sorted_samples, percent):
+    if len(sorted_samples) == 0:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(percent / 100.0 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def measure(name, function, iterations, params=None):
+    """
+    Calls function given number of times, timing each call
+    :return: dictionary with throughput (calls per second) and p50/p99/max latency in microseconds
+    """
+    clock = time.perf_counter
+    samples = [0.0] * iterations
+
+    start = clock()
+    for i in range(iterations):
+        t = clock()
+        function()
+        samples[i] = clock() - t
+    total = clock() - start
+
+    return _result(name, samples, total, params)
+
+
+def _result(name, samples, total, params=None):
+    iterations = len(samples)
+    samples = sorted(samples)
+    return {
+        "name": name,
+        "params": params if params is not None else {},
+        "iterations": iterations,
+        "throughput": iterations / total if total > 0 else 0.0,
+        "p50_us": _percentile(samples, 50) * 1000000.0,
+        "p99_us": _percentile(samples, 99) * 1000000.0,
+        "max_us": samples[-1] * 1000000.0 if iterations > 0 else 0.0
+    }
+
+
+def bench_descriptor(iterations):
+    def build():
+        hid_report_descriptor._build_joystick_report_descriptor(Usage.Gamepad, (Usage.X, Usage.Y, Usage.Rx, Usage.Ry), True, 14)
+
+    def build_memoized():
+        hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), hat_switch=True, button_number=14)
+
+    descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), hat_switch=True, button_number=14)
+
+    return [measure("descriptor_build", build, iterations),
+            measure("descriptor_build_memoized", build_memoized, iterations),
+            measure("descriptor_hex", descriptor.hex, iterations)]
+
+
+def bench_sdp_record(iterations):
+    descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), button_number=14)
+
+    def generate():
+        sdp_record.create_simple_HID_SDP_Report("A Virtual Gamepad Controller", "Keyboard > BT Gamepad", "GCC", descriptor, subclass=MinorDeviceClass.Gamepad).xml()
+
+    record = sdp_record.create_simple_HID_SDP_Report("A Virtual Gamepad Controller", "Keyboard > BT Gamepad", "GCC", descriptor, subclass=MinorDeviceClass.Gamepad)
+
+    return [measure("sdp_record_xml", generate, iterations),
+            measure("sdp_record_encode", record.encode, iterations, {"size": record.encoded_size()})]
+
+
+def bench_descriptor_cache(iterations):
+    """
+    Generating descriptor, layout and SDP record for the default configuration versus loading them from the cache
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        def generate():
+            hid_report_descriptor._joystick_report_descriptors.clear()  # descriptor is generated too, not taken from memo
+            DescriptorCache(os.path.join(directory, "uncached")).joystick_configuration()
+            shutil.rmtree(os.path.join(directory, "uncached"))
+
+        cache = DescriptorCache(os.path.join(directory, "cached"))
+        cache.joystick_configuration()
+
+        return [measure("configuration_generate", generate, iterations),
+                measure("configuration_cached", cache.joystick_configuration, iterations)]
+
+
+# Importing pure Python modules (everything needed to generate descriptors and SDP records) in a fresh interpreter
+# must take less than this and must not import D-Bus
+IMPORT_BUDGET_MS = 50.0
+PURE_MODULES = ("bt_joystick.hid_report_descriptor", "bt_joystick.hid_report", "bt_joystick.sdp_record", "bt_joystick.descriptor_cache",
+                "bt_joystick.joystick_description", "bt_joystick.conditioning")
+
+_IMPORT_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import {modules}
+print(time.perf_counter() - started, 'dbus' in sys.modules)
+"""
+
+
+def bench_import(iterations):
+    """
+    Import time of pure Python modules, each sample in a new interpreter (so nothing is already imported)
+    """
+    script = _IMPORT_SCRIPT.format(modules=", ".join(PURE_MODULES))
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=path + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # installed modules are imported from cached bytecode - the first run (not measured) writes it if it is missing or stale
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    subprocess.check_output([sys.executable, "-c", script], env=environment)
+
+    samples = []
+    dbus_imported = False
+    for _ in range(iterations):
+        output = subprocess.check_output([sys.executable, "-c", script], env=environment, universal_newlines=True).split()
+        samples.append(float(output[0]))
+        dbus_imported = dbus_imported or output[1] == "True"
+
+    result = _result("pure_modules_import", samples, sum(samples), {"budget_ms": IMPORT_BUDGET_MS, "dbus_imported": dbus_imported})
+    result["within_budget"] = result["p50_us"] <= IMPORT_BUDGET_MS * 1000.0 and not dbus_imported
+    return [result]
+
+
+def bench_encoding(iterations):
+    results = []
+    for button_number, axis_number in ENCODING_VARIANTS:
+        descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=ALL_AXES[:axis_number], hat_switch=True, button_number=button_number)
+        encoder = ReportEncoder(descriptor)
+        axis_values = [0] * axis_number
+        state = [0]
+
+        def encode():
+            i = state[0] = state[0] + 1
+            for a in range(axis_number):
+                axis_values[a] = ((i + a) & 0xFF) - 128
+            encoder.set_buttons(i)
+            encoder.set_axes(axis_values)
+            encoder.set_hat_switch(i % 9)
+            encoder.encode()
+
+        results.append(measure("report_encode", encode, iterations, {"buttons": button_number, "axes": axis_number}))
+    return results
+
+
+def bench_mapping(iterations):
+    """
+    Joystick readings to report values: name by name lookups and branches versus JoystickMapping tables
+    """
+    description = DEFAULT_JOYSTICK_DESCRIPTION
+    mapping = description.mapping()
+    axis_names = [axis.name for axis in description.axes]
+    joystick_axis = {name: i * 70 for i, name in enumerate(axis_names)}
+    joystick_buttons = {name: i % 3 == 0 for i, name in enumerate(description.buttons)}
+    values = [0] * mapping.value_count
+    remapper = mapping.bit_remapper(tuple(reversed(description.buttons)))
+
+    def by_name():
+        for i, name in enumerate(axis_names):
+            value = joystick_axis[name]
+            values[i] = value - 256 if value > 127 else value
+        button_bits = 0
+        for i, name in enumerate(description.buttons):
+            if joystick_buttons[name]:
+                button_bits |= 1 << i
+        return button_bits
+
+    def by_table():
+        mapping.read_values(joystick_axis, values)
+        return mapping.button_bits(joystick_buttons)
+
+    def remap():
+        return remapper.remap(0x2a5)
+
+    return [measure("mapping_by_name", by_name, iterations),
+            measure("mapping_table", by_table, iterations),
+            measure("mapping_bit_remap", remap, iterations)]
+
+
+def _float_fix(v):
+    # Conditioning of ADC voltages as it was done in Explorer pHAT example before lookup tables
+    r = int(((v - 2.5) / 2.5) * 127)
+    if r < 0:
+        r = 256 + r
+    elif r > 127:
+        r = 127
+
+    try:
+        chr(r)
+    except Exception:
+        r = 0
+
+    return r
+
+
+def bench_conditioning(iterations):
+    """
+    Conditioning four ADC channels: float math per sample versus InputConditioner lookup tables
+    (with and without auto calibration check and radial dead zone)
+    """
+    volts = [0.4, 2.5, 3.1, 4.9]
+    codes = [int(v / 0.003) for v in volts]
+    out = [0] * len(codes)
+
+    def float_path():
+        for i in range(len(volts)):
+            out[i] = _float_fix(volts[i])
+
+    results = [measure("conditioning_float", float_path, iterations)]
+    for name, auto_calibrate, radial_pairs in (("conditioning_table", False, ()),
+                                               ("conditioning_table_auto", True, ()),
+                                               ("conditioning_table_radial", True, (("x", "y"), ("rx", "ry")))):
+        conditioner = InputConditioner(("x", "y", "rx", "ry"), (0, 833, 1666), dead_zone=0.05, curve=1.5,
+                                       radial_pairs=radial_pairs, radial_dead_zone=0.05, auto_calibrate=auto_calibrate)
+        results.append(measure(name, lambda: conditioner.condition(codes, out), iterations))
+    return results
+
+
+def bench_recording(iterations):
+    """
+    Recording a report in the send loop and reading recorded reports back through the memory mapped file
+    """
+    descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), button_number=14)
+    report = ReportEncoder(descriptor).encode()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "recording")
+        recorder = ReportRecorder(path)
+        record = measure("recording_record", lambda: recorder.record(report), iterations)
+        recorder.close()
+        record["params"] = {"syncs": recorder.syncs, "bytes": os.path.getsize(path)}
+
+        replayer = ReportReplayer(path)
+        try:
+            replay = measure("recording_replay", lambda: replayer.replay(len, speed=0), 10)
+            replay["params"] = {"reports": len(replayer)}
+        finally:
+            replayer.close()
+    return [record, replay]
+
+
+class _SyntheticJoystick:
+    # Joystick producing a slow ramp with some jitter on every read, like sticks being moved
+    def __init__(self):
+        self.count = 0
+        self.axis = {'x': 0, 'y': 0, 'rx': 0, 'ry': 0}
+        self.buttons = 0
+
+    def readAxis(self):
+        self.count += 1
+        ramp = (self.count >> 2) % 254 - 127
+        jitter = (self.count * 7) % 5 - 2
+        self.axis['x'] = ramp
+        self.axis['y'] = -ramp
+        self.axis['rx'] = jitter
+        self.axis['ry'] = ramp // 2 + jitter
+        return self.axis
+
+    def readButtons(self):
+        if self.count % 16 == 0:
+            self.buttons ^= 1 << ((self.count >> 4) % 14)
+        return self.buttons
+
+
+class _SyntheticStateJoystick(_SyntheticJoystick):
+    # The same readings filled straight into JoystickState
+    def readState(self, state):
+        self.count += 1
+        ramp = (self.count >> 2) % 254 - 127
+        jitter = (self.count * 7) % 5 - 2
+        axes = state.axes
+        axes[0] = ramp
+        axes[1] = -ramp
+        axes[2] = jitter
+        axes[3] = ramp // 2 + jitter
+        if self.count % 16 == 0:
+            self.buttons ^= 1 << ((self.count >> 4) % 14)
+        state.button_bits = self.buttons
+
+
+class _SyntheticDictJoystick(_SyntheticJoystick):
+    # The same readings returned as dictionary of button states
+    def __init__(self):
+        _SyntheticJoystick.__init__(self)
+        self.button_states = {name: False for name in DEFAULT_JOYSTICK_DESCRIPTION.buttons}
+
+    def readButtons(self):
+        bits = _SyntheticJoystick.readButtons(self)
+        for i, name in enumerate(DEFAULT_JOYSTICK_DESCRIPTION.buttons):
+            self.button_states[name] = bool(bits & (1 << i))
+        return self.button_states
+
+
+def bench_state(iterations):
+    """
+    Reading joystick into JoystickState: through DictJoystickAdapter versus driver's own readState
+    """
+    mapping = DEFAULT_JOYSTICK_DESCRIPTION.mapping()
+    results = []
+    for name, joystick in (("state_dict_adapter", _SyntheticDictJoystick()), ("state_direct", _SyntheticStateJoystick())):
+        state = mapping.create_state()
+        read_state = state_reader(joystick, mapping)
+        results.append(measure(name, lambda: read_state(state), iterations))
+    return results
+
+
+class _SlowJoystick(_SyntheticStateJoystick):
+    # Synthetic joystick taking as long to read as four ADS1015 conversions at 1600 samples per second
+    def readState(self, state):
+        time.sleep(0.0025)
+        _SyntheticStateJoystick.readState(self, state)
+
+
+def bench_acquisition(iterations):
+    """
+    Reading slow joystick in the report loop versus reading latest state published by BackgroundAcquisition
+    """
+    mapping = DEFAULT_JOYSTICK_DESCRIPTION.mapping()
+    state = mapping.create_state()
+
+    joystick = _SlowJoystick()
+    inline = measure("acquisition_inline", lambda: joystick.readState(state), max(1, iterations // 100))
+
+    acquisition = BackgroundAcquisition(_SlowJoystick(), rate=250)
+    acquisition.start()
+    try:
+        background = measure("acquisition_background", lambda: acquisition.readState(state), iterations)
+    finally:
+        acquisition.stop()
+    background["params"] = {"samples": acquisition.samples, "retries": acquisition.retries}
+    return [inline, background]
+
+
+def bench_end_to_end(iterations):
+    """
+    read -> change detection -> encode -> send loop over a local socket pair, with a thread draining the other end
+    """
+    descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), button_number=14)
+    encoder = ReportEncoder(descriptor)
+    joystick = _SyntheticJoystick()
+    detector = ChangeDetector(4)
+    axis = [0, 0, 0, 0]
+
+    device_socket, host_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    sender = CoalescingReportSender(device_socket)
+    received = [0]
+
+    def drain():
+        while True:
+            data = host_socket.recv(64)
+            if len(data) == 0:
+                break
+            received[0] += 1
+
+    drain_thread = threading.Thread(target=drain, daemon=True)
+    drain_thread.start()
+
+    def tick():
+        joystick_axis = joystick.readAxis()
+        axis[0] = joystick_axis['x']
+        axis[1] = joystick_axis['y']
+        axis[2] = joystick_axis['rx']
+        axis[3] = joystick_axis['ry']
+        if detector.update(axis, joystick.readButtons()):
+            encoder.set_buttons(detector.button_bits)
+            encoder.set_axes(detector.axis)
+            sender.submit(encoder.encode(), encoder.layout.report_id)
+        elif sender.pending:
+            sender.flush()
+
+    result = measure("end_to_end", tick, iterations)
+    device_socket.close()
+    drain_thread.join(1.0)
+    host_socket.close()
+
+    result["params"] = {"sent": sender.sent, "dropped": sender.dropped, "suppressed": detector.suppressed, "received": received[0]}
+    return [result]
+
+
+def run_multi_device(device_count=8, rate=250, duration=1.0):
+    """
+    Serves device_count virtual devices at rate from one MultiDeviceMain thread over loopback transports, with
+    a simulated host receiving reports of each. Joysticks change on every read, so every tick sends a report.
+    :return: dictionary with lowest rate reports were received at by a host and scheduler totals
+    """
+    from bt_joystick.multi_device import MultiDeviceMain, VirtualDevice
+    from bt_joystick.simulated_host import SimulatedHost
+    from bt_joystick.transport import LoopbackTransport
+
+    devices = [VirtualDevice("device" + str(i), _SyntheticStateJoystick(), LoopbackTransport(), rate=rate, deadband=0, hysteresis=0)
+               for i in range(device_count)]
+    main = MultiDeviceMain(devices)
+    thread = threading.Thread(target=main.run, daemon=True)
+    thread.start()
+    hosts = []
+    try:
+        for device in devices:
+            host = SimulatedHost(device.transport, device.report_layout)
+            hosts.append(host)
+            host.connect()
+            host.start()
+
+        counts = [len(host.reports) for host in hosts]
+        ticks = [device.scheduler.ticks for device in devices]
+        overruns = [device.scheduler.overruns for device in devices]
+        started = time.monotonic()
+        time.sleep(duration)
+        elapsed = time.monotonic() - started
+        rates = [(len(host.reports) - count) / elapsed for host, count in zip(hosts, counts)]
+        return {
+            "devices": device_count,
+            "rate": rate,
+            "seconds": elapsed,
+            "min_received_rate": min(rates),
+            "total_received_rate": sum(rates),
+            "ticks": sum(device.scheduler.ticks for device in devices) - sum(ticks),
+            "overruns": sum(device.scheduler.overruns for device in devices) - sum(overruns),
+            "max_lateness": max(device.scheduler.max_lateness for device in devices)
+        }
+    finally:
+        main.stop()
+        thread.join(5.0)
+        for host in hosts:
+            host.close()
+        for device in devices:
+            device.transport.close()
+
+
+def bench_multi_device(iterations):
+    """
+    Eight virtual devices at 250Hz in one event loop thread; within budget if every host receives at least
+    90% of the reports it should
+    """
+    rate = 250
+    result = run_multi_device(8, rate, iterations / float(rate))
+    return [{
+        "name": "multi_device",
+        "params": result,
+        "iterations": result["ticks"],
+        "throughput": result["total_received_rate"],
+        "p50_us": 0.0,
+        "p99_us": 0.0,
+        "max_us": result["max_lateness"] * 1000000.0,
+        "within_budget": result["min_received_rate"] >= rate * 0.9
+    }]
+
+
+# name, function, share of iterations it runs
+BENCHMARKS = [
+    ("descriptor", bench_descriptor, 0.1),
+    ("sdp", bench_sdp_record, 0.1),
+    ("descriptor_cache", bench_descriptor_cache, 0.1),
+    ("encode", bench_encoding, 1.0),
+    ("mapping", bench_mapping, 1.0),
+    ("conditioning", bench_conditioning, 1.0),
+    ("state", bench_state, 1.0),
+    ("acquisition", bench_acquisition, 1.0),
+    ("end_to_end", bench_end_to_end, 1.0),
+    ("recording", bench_recording, 1.0),
+    ("multi_device", bench_multi_device, 0.05),
+    ("import", bench_import, 0.001),
+]
+
+
+def run(iterations=10000, selected=None):
+    """
+    Runs benchmarks
+    :param iterations: iterations for the hot path benchmarks; others run the share of it given in BENCHMARKS -
+                       a tenth for generating descriptors and records, a twentieth for multi_device and a thousandth for import
+    :param selected: names of benchmarks to run or None for all
+    :return: dictionary with environment description and list of results
+    """
+    results = []
+    for name, benchmark, scale in BENCHMARKS:
+        if selected is None or name in selected:
+            results += benchmark(max(1, int(iterations * scale)))
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "node": platform.node(),
+        "timestamp": time.time(),
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks bt_joystick descriptor, SDP record and report hot path")
+    parser.add_argument("--iterations", type=int, default=10000, help="iterations for fast benchmarks (default 10000)")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON to the file ('-' for stdout)")
+    parser.add_argument("benchmarks", nargs="*", help="benchmarks to run: " + ", ".join(name for name, _, _ in BENCHMARKS))
+    args = parser.parse_args(argv)
+
+    report = run(args.iterations, args.benchmarks if len(args.benchmarks) > 0 else None)
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        if args.json is not None:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+
+        for result in report["results"]:
+            params = " ".join("{}={}".format(k, v) for k, v in result["params"].items())
+            print("{:<26} {:>12.0f}/s  p50 {:>9.2f}us  p99 {:>9.2f}us  max {:>9.2f}us  {}".format(
+                result["name"], result["throughput"], result["p50_us"], result["p99_us"], result["max_us"], params))
+
+    # benchmarks with a budget fail the run (for CI) when they are over it
+    over_budget = [result["name"] for result in report["results"] if not result.get("within_budget", True)]
+    if len(over_budget) > 0:
+        print("Over budget: " + ", ".join(over_budget), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
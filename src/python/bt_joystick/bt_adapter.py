@@ -0,0 +1,141 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import subprocess
+import time
+
+import dbus
+
+from gi.repository import GLib
+
+
+BLUEZ_SERVICE = "org.bluez"
+ADAPTER_INTERFACE = "org.bluez.Adapter1"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+OBJECT_MANAGER_INTERFACE = "org.freedesktop.DBus.ObjectManager"
+
+# Only major/minor device class and format bits can be checked - service class bits are managed by BlueZ
+DEVICE_CLASS_MASK = 0x001fff
+
+
+def find_adapter(bus, adapter=None):
+    """
+    Finds adapter object path through BlueZ object manager
+    :param bus: system bus (or bus BlueZ stand-in runs on)
+    :param adapter: adapter name ('hci0') or address; first adapter if not supplied
+    :return: adapter object path
+    """
+    manager = dbus.Interface(bus.get_object(BLUEZ_SERVICE, "/"), OBJECT_MANAGER_INTERFACE)
+    for path, interfaces in sorted(manager.GetManagedObjects().items()):
+        properties = interfaces.get(ADAPTER_INTERFACE)
+        if properties is None:
+            continue
+        if adapter is None or path.endswith("/" + adapter) or str(properties.get("Address", "")).upper() == adapter.upper():
+            return path
+
+    raise ValueError("No Bluetooth adapter " + (adapter if adapter is not None else "") + " found")
+
+
+class BluetoothAdapter:
+    """
+    Configures Bluetooth adapter through org.bluez.Adapter1 D-Bus properties. Each property is set and
+    then confirmed with its PropertiesChanged signal (so the adapter is known to be ready without arbitrary sleeps).
+
+    Signals are received through GLib main loop integration, so DBusGMainLoop must be set as default
+    before the bus is created.
+    """
+    def __init__(self, bus=None, adapter=None, clock=time.monotonic):
+        """
+        Constructor
+        :param bus: bus BlueZ is on; system bus if not supplied
+        :param adapter: adapter name ('hci0') or address; first adapter if not supplied
+        :param clock: monotonic clock returning seconds
+        """
+        self.bus = bus if bus is not None else dbus.SystemBus()
+        self.clock = clock
+        self.path = find_adapter(self.bus, adapter)
+        self.name = self.path.split("/")[-1]
+        self.properties = dbus.Interface(self.bus.get_object(BLUEZ_SERVICE, self.path), PROPERTIES_INTERFACE)
+        self.address = str(self.get("Address"))
+
+    def get(self, name):
+        return self.properties.Get(ADAPTER_INTERFACE, name)
+
+    def set(self, name, value, timeout=5.0):
+        """
+        Sets adapter property and waits until BlueZ signals it has changed
+        :param name: property name
+        :param value: new value (as dbus type)
+        :param timeout: how long to wait for PropertiesChanged signal in seconds
+        """
+        if self.get(name) == value:
+            return
+
+        changed = {}
+
+        def properties_changed(interface, changed_properties, _invalidated):
+            if interface == ADAPTER_INTERFACE:
+                changed.update(changed_properties)
+
+        timed_out = []
+
+        def timeout_expired():
+            timed_out.append(True)
+            return False
+
+        # receiver is added before setting the property so the signal can't be missed
+        match = self.bus.add_signal_receiver(properties_changed,
+                                             signal_name="PropertiesChanged",
+                                             dbus_interface=PROPERTIES_INTERFACE,
+                                             bus_name=BLUEZ_SERVICE,
+                                             path=self.path)
+        timeout_source = GLib.timeout_add(int(timeout * 1000), timeout_expired)
+        try:
+            self.properties.Set(ADAPTER_INTERFACE, name, value)
+
+            context = GLib.MainContext.default()
+            while changed.get(name) != value and len(timed_out) == 0:
+                context.iteration(True)
+        finally:
+            match.remove()
+            if len(timed_out) == 0:
+                GLib.source_remove(timeout_source)
+
+        if changed.get(name) != value:
+            raise TimeoutError("Adapter " + self.name + " didn't change " + name + " to " + str(value) + " in " + str(timeout) + "s")
+
+    def configure(self, alias, device_class, discoverable=True, timeout=5.0):
+        """
+        Powers adapter up and sets its name, device class and discoverability
+        :param alias: name the adapter is seen under
+        :param device_class: Bluetooth class of device
+        :param discoverable: should the adapter be discoverable and pairable (without timeout)
+        :param timeout: how long to wait for each property change in seconds
+        :return: time in seconds it took
+        """
+        started = self.clock()
+
+        self.set("Powered", dbus.Boolean(True), timeout)
+        self.set("Alias", dbus.String(alias), timeout)
+        self.set_device_class(device_class)
+        if discoverable:
+            self.set("DiscoverableTimeout", dbus.UInt32(0), timeout)
+            self.set("PairableTimeout", dbus.UInt32(0), timeout)
+            self.set("Pairable", dbus.Boolean(True), timeout)
+        self.set("Discoverable", dbus.Boolean(discoverable), timeout)
+
+        return self.clock() - started
+
+    def set_device_class(self, device_class):
+        """
+        Adapter1.Class is read only - BlueZ takes the class from main.conf. Only if major/minor class
+        doesn't already match, it is set with hciconfig (which BlueZ then reports back through the Class property).
+        """
+        if int(self.get("Class")) & DEVICE_CLASS_MASK == device_class & DEVICE_CLASS_MASK:
+            return
+
+        print("Adapter " + self.name + " class is 0x{:06x}; setting it to 0x{:06x} with hciconfig (set Class in /etc/bluetooth/main.conf to avoid it)".format(int(self.get("Class")), device_class))
+        subprocess.call(["hciconfig", self.name, "class", "0x{:06x}".format(device_class)])
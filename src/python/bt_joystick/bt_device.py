@@ -10,66 +10,182 @@
 
 import os
 import sys
+import threading
 import time
-import socket
 
 import dbus.service
-from dbus.mainloop.glib import DBusGMainLoop
 
-from bt_joystick import sdp_record
-from bt_joystick import hid_report_descriptor
+from gi.repository import GLib
 
+from bt_joystick.bt_adapter import BluetoothAdapter
 from bt_joystick.bt_device_classes import LIMITED_DISCOVERABLE_MODE, PERIPHERAL, GAMEPAD
-from bt_joystick.hid_report_descriptor import Usage
-from bt_joystick.sdp_record import MinorDeviceClass
+from bt_joystick.hid_device import HIDDevice
+from bt_joystick.hid_report_descriptor import parse_report_descriptor
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
+from bt_joystick.sdp_record import HIDDescriptorList
+from bt_joystick.transport import L2CAPTransport
+
+
+HID_PROFILE_UUID = "00001124-0000-1000-8000-00805f9b34fb"
+
+
+def register_profile(path, service_record, uuid=HID_PROFILE_UUID, bus=None):
+    """
+    Registers BlueZ profile publishing given SDP record. BlueZ publishes records of all profiles on all adapters;
+    the profile doesn't listen on HID PSMs itself - the device binds them.
+    :param path: dbus path of the profile - unique per profile
+    :param service_record: SDPRecord
+    :param uuid: profile UUID
+    :param bus: system bus; new connection if not supplied
+    """
+    opts = {
+        "ServiceRecord": service_record.xml(),
+        "Role": "server",
+        "RequireAuthentication": False,
+        "RequireAuthorization": False
+    }
+
+    if bus is None:
+        bus = dbus.SystemBus()
+    manager = dbus.Interface(bus.get_object("org.bluez", "/org/bluez"), "org.bluez.ProfileManager1")
+
+    manager.RegisterProfile(path, uuid, opts)
+
+
+def unregister_profile(path, bus=None):
+    if bus is None:
+        bus = dbus.SystemBus()
+    manager = dbus.Interface(bus.get_object("org.bluez", "/org/bluez"), "org.bluez.ProfileManager1")
+
+    manager.UnregisterProfile(path)
+
+
+class PipelineStatsService(dbus.service.Object):
+    """
+    D-Bus methods returning and resetting send pipeline stats of the object's stats attribute.
+    Method calls are dispatched only while GLib main loop runs - see start_dbus_dispatch.
+    """
+    DBUS_INTERFACE = "org.gcc.btservice"
+
+    def __init__(self, bus_name, object_path):
+        dbus.service.Object.__init__(self, bus_name, object_path)
+        self._main_loop_thread = None
+
+    @dbus.service.method(DBUS_INTERFACE, in_signature="", out_signature="s")
+    def GetStats(self):
+        """
+        Returns send pipeline stats (counters and latency histograms) as JSON
+        """
+        return self.stats.json()
+
+    @dbus.service.method(DBUS_INTERFACE, in_signature="", out_signature="")
+    def ResetStats(self):
+        self.stats.reset()
+
+    def start_dbus_dispatch(self):
+        """
+        Starts dispatching D-Bus method calls (GetStats, ResetStats) in a GLib main loop thread;
+        the adapter is configured by then, so the main context is not iterated anywhere else
+        """
+        if self._main_loop_thread is None:
+            self._main_loop_thread = GLibMainLoopThread().start()
+
+    def stop_dbus_dispatch(self):
+        if self._main_loop_thread is not None:
+            self._main_loop_thread.stop()
+            self._main_loop_thread = None
+
+
+class GLibMainLoopThread:
+    """
+    Runs GLib main loop in a daemon thread, so D-Bus method calls are dispatched while the main thread sends reports.
+    DBusGMainLoop must be set as default before the bus is created. Nothing else may iterate the default main context
+    (BluetoothAdapter.set does) while the loop runs.
+    """
+    def __init__(self):
+        self.loop = GLib.MainLoop()
+        self.thread = threading.Thread(target=self.loop.run, name="glib-main-loop", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.loop.quit()
+        self.thread.join(1.0)
 
 
-class BTDevice(dbus.service.Object):
-    P_CTRL = 17  # Service port - must match port configured in SDP record
-    P_INTR = 19  # Service port - must match port configured in SDP record#Interrrupt port
-    PROFILE_DBUS_PATH = "/bluez/gcc/gcc_joy_profile"  # dbus path of  the bluez profile we will create
+class BTDevice(HIDDevice, PipelineStatsService):
+    P_CTRL = L2CAPTransport.P_CTRL  # Service port - must match port configured in SDP record
+    P_INTR = L2CAPTransport.P_INTR  # Service port - must match port configured in SDP record#Interrrupt port
+    PROFILE_DBUS_PATH = "/bluez/gcc/gcc_joy_profile"  # dbus path of the bluez profile we will create
 
     def __init__(self, device_name='gcc-bt-joystick',
                  device_class=LIMITED_DISCOVERABLE_MODE | PERIPHERAL | GAMEPAD,
-                 uuid="00001124-0000-1000-8000-00805f9b34fb",
+                 uuid=HID_PROFILE_UUID,
                  service_name='org.gcc.btservice',
                  service_record=None,
-                 hid_descriptor=None):
+                 hid_descriptor=None,
+                 transport=None,
+                 reconnect_initiate=False,
+                 adapter=None,  # adapter name ('hci0') or address; first adapter if not supplied
+                 use_descriptor_cache=True,
+                 description=None,  # JoystickDescription descriptor and SDP record are made from; default gamepad if not supplied
+                 recorder=None):  # ReportRecorder sent reports are recorded to
+        started = time.monotonic()
 
         self.device_name = device_name
         self.device_class = device_class
         self.uuid = uuid
         self.service_name = service_name
 
-        self.scontrol = None
-        self.ccontrol = None
-        self.sinterrupt = None
-        self.cinterrupt = None
+        # create default HID descriptor and SDP record if not specified; if only SDP record is specified
+        # descriptor is parsed back from it so reports match what the record advertises
+        if service_record is not None and hid_descriptor is None:
+            descriptor_lists = [a for a in service_record.attributes if isinstance(a, HIDDescriptorList) and a.kind == HIDDescriptorList.Report]
+            if len(descriptor_lists) > 0 and descriptor_lists[0].encoding == "hex":
+                hid_descriptor = parse_report_descriptor(descriptor_lists[0].descriptor)
+
+        if description is None:
+            description = DEFAULT_JOYSTICK_DESCRIPTION
+
+        report_layout = None
+        if hid_descriptor is None and service_record is None and use_descriptor_cache:
+            # descriptor, its layout and SDP record are only generated on the first start
+            configuration = description.configuration(reconnect_initiate=reconnect_initiate)
+            hid_descriptor = configuration.descriptor
+            report_layout = configuration.layout
+            service_record = configuration.service_record
+
+        if hid_descriptor is None:
+            hid_descriptor = description.hid_descriptor()
 
-        # create default HID descriptor and SDP record if not specified
         if service_record is not None:
             self.service_record = service_record
         else:
-            if hid_descriptor is None:
-                hid_descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), button_number=14)
-            self.service_record = sdp_record.create_simple_HID_SDP_Report("A Virtual Gamepad Controller", "Keyboard > BT Gamepad", "GCC", hid_descriptor, subclass=MinorDeviceClass.Gamepad)
+            self.service_record = description.service_record(hid_descriptor, reconnect_initiate=reconnect_initiate)
+
+        self.adapter = BluetoothAdapter(adapter=adapter)
+        if transport is None:
+            transport = L2CAPTransport(address=self.adapter.address)
+
+        # stats are retrievable with GetStats D-Bus method
+        HIDDevice.__init__(self, hid_descriptor, transport, recorder, report_layout)
 
         self.init_device()
         self.init_profile()
         self.ensure_dbus_conf_file()
 
         bus_name = dbus.service.BusName("org.gcc.btservice", bus=dbus.SystemBus())
-        dbus.service.Object.__init__(self, bus_name, "/org/gcc/btservice")
+        PipelineStatsService.__init__(self, bus_name, "/org/gcc/btservice")
+
+        self.startup_time = time.monotonic() - started
+        print("Bluetooth device started in {:.3f}s (adapter configured in {:.3f}s)".format(self.startup_time, self.adapter_setup_time))
 
     # configure the bluetooth hardware device
     def init_device(self):
-        print("Bringing hcio up")
-        os.system("hciconfig hcio up")
-        time.sleep(1)  # Waiting for BT device to be brought up - it would be nicer to find better way than arbitrary wait
-
-        os.system("hciconfig hcio class 0x{:06x}".format(self.device_class))
-        os.system("hciconfig hcio name " + self.device_name)
-        os.system("hciconfig hcio piscan")
+        print("Configuring adapter " + self.adapter.name)
+        self.adapter_setup_time = self.adapter.configure(self.device_name, self.device_class)
 
     def ensure_dbus_conf_file(self):
         def compare_old_and_new(old_content):
@@ -101,44 +217,4 @@ class BTDevice(dbus.service.Object):
                 sys.exit("Failed to create/replace " + self.service_name + ".conf in /etc/dbus-1/system.d/;" + str(e1))
 
     def init_profile(self):
-        opts = {
-            "ServiceRecord": self.service_record.xml(),
-            "Role": "server",
-            "RequireAuthentication": False,
-            "RequireAuthorization": False
-        }
-
-        bus = dbus.SystemBus()
-        manager = dbus.Interface(bus.get_object("org.bluez", "/org/bluez"), "org.bluez.ProfileManager1")
-
-        manager.RegisterProfile(BTDevice.PROFILE_DBUS_PATH, self.uuid, opts)
-
-    def listen(self):
-        self.scontrol = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
-        self.sinterrupt = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
-
-        self.scontrol.bind((socket.BDADDR_ANY, self.P_CTRL))
-        self.sinterrupt.bind((socket.BDADDR_ANY, self.P_INTR))
-
-        # Start listening on the server sockets
-        self.scontrol.listen(1)  # Limit of 1 connection
-        self.sinterrupt.listen(1)
-
-        self.ccontrol, cinfo = self.scontrol.accept()
-        print("Got a connection on the control channel from " + cinfo[0])
-
-        self.cinterrupt, cinfo = self.sinterrupt.accept()
-        print("Got a connection on the interrupt channel from " + cinfo[0])
-
-    def send_message(self, message):
-        self.cinterrupt.send(message)
-
-    def send_values(self, button_bits, axis_values, hat_value):
-        """
-        Convenience function to send a message with button states, axis values and hat switch state
-        :param button_bits: bitmap for the button states, an integer with at most 16 bits
-        :param axis_values: list of axis values (each in -127..127)
-        :param hat_value: value for the hat switch: 1..8 for top, top right, right, ..., top left, or 9 for the middle (not pressed) position
-        """
-        self.send_message(bytes((0xA1, 0x01, button_bits & 255, button_bits >> 8, *[v if v >= 0 else v + 256 for v in axis_values], hat_value)))
-
+        register_profile(BTDevice.PROFILE_DBUS_PATH, self.service_record, self.uuid)
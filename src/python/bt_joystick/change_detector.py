@@ -0,0 +1,126 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import time
+
+from bt_joystick.stats import PipelineStats
+
+
+def per_axis(value, axis_count):
+    """
+    Expands setting given as single value or one value per axis to a list of one value per axis
+    """
+    if isinstance(value, (list, tuple)):
+        if len(value) != axis_count:
+            raise ValueError("Expected " + str(axis_count) + " values but got " + str(len(value)))
+        return list(value)
+    return [value] * axis_count
+
+
+class ChangeDetector:
+    """
+    Decides if a new report needs to be sent, ignoring axis jitter.
+
+    An axis at rest is reported only when it moves more than its deadband away from the last reported value;
+    while it is moving, any change bigger than its hysteresis is reported (so slow, deliberate movement is smooth).
+    Button changes are always reported immediately. Axis-only changes are not sent more often than min_interval;
+    a change held back because of it stays pending and is reported on a later update.
+    """
+    def __init__(self, axis_count, deadband=2, hysteresis=1, min_interval=0.0, clock=time.monotonic, stats=None):
+        """
+        Constructor
+        :param axis_count: number of axes
+        :param deadband: change ignored for an axis at rest - single value or one per axis
+        :param hysteresis: change ignored for a moving axis - single value or one per axis
+        :param min_interval: minimum time in seconds between two reports with only axis changes
+        :param clock: monotonic clock returning seconds
+        :param stats: PipelineStats to count suppressed reports in
+        """
+        self.deadband = per_axis(deadband, axis_count)
+        self.hysteresis = per_axis(hysteresis, axis_count)
+        self.min_interval = min_interval
+        self.clock = clock
+        self.stats = stats
+
+        self.axis = [0] * axis_count  # last reported axis values
+        self.button_bits = 0  # last reported buttons
+        self._moving = [False] * axis_count
+        self._pending = False
+        self._last_sent = None
+
+        self.sent = 0
+        self.suppressed = 0
+
+    def update(self, axis_values, button_bits):
+        """
+        Checks new values against the last reported ones; if they should be reported they become the last reported values
+        :param axis_values: new (signed) axis values
+        :param button_bits: new button bitmap
+        :return: True if report should be sent (with values in self.axis and self.button_bits)
+        """
+        axis = self.axis
+        moving = self._moving
+        deadband = self.deadband
+        hysteresis = self.hysteresis
+
+        axis_changed = self._pending
+        differs = False
+        for i, value in enumerate(axis_values):
+            delta = value - axis[i]
+            if delta != 0:
+                differs = True
+                if delta < 0:
+                    delta = -delta
+                if delta > (hysteresis[i] if moving[i] else deadband[i]):
+                    axis_changed = True
+                    moving[i] = True
+                    continue
+            moving[i] = False
+
+        buttons_changed = button_bits != self.button_bits
+
+        now = self.clock()
+        if axis_changed and not buttons_changed and self._last_sent is not None and now - self._last_sent < self.min_interval:
+            self._pending = True
+            self._suppressed()
+            return False
+
+        if not axis_changed and not buttons_changed:
+            if differs:
+                self._suppressed()
+            return False
+
+        for i, value in enumerate(axis_values):
+            if moving[i] or self._pending:
+                axis[i] = value
+        self.button_bits = button_bits
+        self._pending = False
+        self._last_sent = now
+        self.sent += 1
+        return True
+
+    def reset(self, axis_values, button_bits):
+        """
+        Makes given values the last reported ones - for reports sent regardless of changes (after reconnecting, for instance)
+        """
+        axis = self.axis
+        for i, value in enumerate(axis_values):
+            axis[i] = value
+            self._moving[i] = False
+        self.button_bits = button_bits
+        self._pending = False
+        self._last_sent = self.clock()
+
+    def _suppressed(self):
+        self.suppressed += 1
+        if self.stats is not None:
+            self.stats.increment(PipelineStats.REPORTS_SUPPRESSED)
+
+    def counters(self):
+        return {
+            "sent": self.sent,
+            "suppressed": self.suppressed
+        }
@@ -0,0 +1,349 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Input conditioning for joystick implementations reading raw ADC codes: per axis calibration (minimum, centre, maximum),
+# dead zones and response curves are baked into integer lookup tables, so conditioning a sample is one table index.
+# Tables are regenerated only when calibration (or settings) change.
+
+import json
+import math
+import os
+
+from array import array
+
+from bt_joystick.change_detector import per_axis
+
+
+CALIBRATION_VERSION = 1
+
+# Conditioned values are in report's axis range
+OUTPUT_MAXIMUM = 127
+
+
+def default_calibration_path(name):
+    config_home = os.environ.get("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(config_home, "bt_joystick", name + ".calibration.json")
+
+
+def response_curve(curve):
+    """
+    Returns response curve function mapping 0..1 to 0..1
+    :param curve: exponent (1 for linear, 2 for quadratic - finer control around centre, ...) or function
+    """
+    if callable(curve):
+        return curve
+    if curve <= 0:
+        raise ValueError("Response curve exponent must be positive but got " + str(curve))
+    if curve == 1:
+        return lambda a: a
+    return lambda a: a ** curve
+
+
+def _clamp(value):
+    return -OUTPUT_MAXIMUM if value < -OUTPUT_MAXIMUM else OUTPUT_MAXIMUM if value > OUTPUT_MAXIMUM else value
+
+
+class AxisCalibration:
+    """
+    Raw codes an axis reads at its minimum, at rest and at its maximum
+    """
+    def __init__(self, minimum, centre, maximum):
+        if not minimum <= centre <= maximum or minimum == maximum:
+            raise ValueError("Calibration must have minimum <= centre <= maximum and minimum < maximum but got {}, {}, {}".format(minimum, centre, maximum))
+        self.minimum = minimum
+        self.centre = centre
+        self.maximum = maximum
+
+    def normalise(self, code):
+        """
+        :return: code as -1.0..1.0, 0 being centre
+        """
+        if code < self.centre:
+            return max(-1.0, (code - self.centre) / max(1, self.centre - self.minimum))
+        return min(1.0, (code - self.centre) / max(1, self.maximum - self.centre))
+
+    def to_json(self):
+        return [self.minimum, self.centre, self.maximum]
+
+    def __eq__(self, other):
+        return isinstance(other, AxisCalibration) and self.to_json() == other.to_json()
+
+    def __repr__(self):
+        return "AxisCalibration({}, {}, {})".format(self.minimum, self.centre, self.maximum)
+
+
+def build_axis_table(calibration, bits, signed=True, dead_zone=0.0, curve=1.0):
+    """
+    Builds lookup table of conditioned values (-127..127) for every raw code
+    :param calibration: AxisCalibration
+    :param bits: resolution of raw codes; table has 2**bits entries
+    :param signed: raw codes are two's complement - negative codes index the table from its end (as python does),
+                   so both signed codes and unsigned register values can be used as index
+    :param dead_zone: fraction of half range around centre that reads as 0; rest of the range is scaled to full output
+    :param curve: response curve - see response_curve
+    :return: array('b') table
+    """
+    curve = response_curve(curve)
+    size = 1 << bits
+    table = array("b", bytes(size))
+    for index in range(size):
+        code = index - size if signed and index >= size >> 1 else index
+        normalised = calibration.normalise(code)
+        magnitude = abs(normalised)
+        if magnitude <= dead_zone:
+            continue
+        magnitude = curve((magnitude - dead_zone) / (1.0 - dead_zone))
+        table[index] = _clamp(int(round(math.copysign(magnitude, normalised) * OUTPUT_MAXIMUM)))
+    return table
+
+
+def build_radial_tables(dead_zone=0.0, curve=1.0):
+    """
+    Builds lookup tables applying radial dead zone (and response curve over distance from centre) to a pair of conditioned axes.
+    Both tables are indexed with ((x & 0xff) << 8) | (y & 0xff)
+    :return: (array('b') table of x values, array('b') table of y values)
+    """
+    curve = response_curve(curve)
+    table_x = array("b", bytes(0x10000))
+    table_y = array("b", bytes(0x10000))
+    for x in range(-OUTPUT_MAXIMUM, OUTPUT_MAXIMUM + 1):
+        for y in range(-OUTPUT_MAXIMUM, OUTPUT_MAXIMUM + 1):
+            magnitude = math.sqrt(x * x + y * y) / OUTPUT_MAXIMUM
+            if magnitude <= dead_zone:
+                continue
+            scale = curve(min(1.0, (magnitude - dead_zone) / (1.0 - dead_zone))) / min(1.0, magnitude)
+            index = ((x & 0xff) << 8) | (y & 0xff)
+            table_x[index] = _clamp(int(round(x * scale)))
+            table_y[index] = _clamp(int(round(y * scale)))
+    return table_x, table_y
+
+
+class InputConditioner:
+    """
+    Conditions raw ADC codes of a joystick's axes in order: calibration, axial dead zone and response curve
+    (one lookup table per axis) and then, for pairs of axes of one stick, radial dead zone (lookup tables shared by pairs).
+    Axes in radial pairs should normally have no axial dead zone and linear curve - radial curve is applied instead.
+
+    With auto calibration, codes outside the calibrated range widen it. Table of the axis is regenerated
+    (and calibration saved) only when the range grows by more than recalibration_threshold; until then codes
+    beyond calibrated range read as full deflection. Conditioning only records the widened range - a short lived
+    updater thread regenerates the table, swaps it in and saves calibration, so conditioning never waits for
+    table generation or the disk. Until the new table is swapped in, the old one is used.
+
+    Codes outside of what bits can hold (a glitch on the bus, for instance) are clamped to the nearest code that fits.
+    """
+    def __init__(self, axis_names, default_calibration, bits=12, signed=True, dead_zone=0.0, curve=1.0,
+                 radial_pairs=(), radial_dead_zone=0.0, radial_curve=1.0,
+                 path=None, auto_calibrate=True, recalibration_threshold=0.02):
+        """
+        Constructor
+        :param axis_names: names of axes, in order raw codes are passed to condition
+        :param default_calibration: AxisCalibration (or (minimum, centre, maximum)) used when there is no saved calibration - single value or one per axis
+        :param bits: resolution of raw codes
+        :param signed: are raw codes two's complement (see build_axis_table)
+        :param dead_zone: axial dead zone (fraction of half range) - single value or one per axis
+        :param curve: axial response curve (see response_curve) - single value or one per axis
+        :param radial_pairs: pairs of axis names - ('x', 'y'), for instance - radial dead zone is applied to
+        :param radial_dead_zone: radial dead zone (fraction of full deflection)
+        :param radial_curve: response curve over distance from centre
+        :param path: file calibration is loaded from and saved to; not saved if None - see default_calibration_path
+        :param auto_calibrate: widen calibration with codes read outside of it
+        :param recalibration_threshold: fraction of range calibration has to grow by before tables are regenerated
+        """
+        self.axis_names = tuple(axis_names)
+        count = len(self.axis_names)
+        self.bits = bits
+        self.signed = signed
+        self.dead_zone = per_axis(dead_zone, count)
+        self.curve = per_axis(curve, count)
+        self.radial_dead_zone = radial_dead_zone
+        self.radial_curve = radial_curve
+        self.path = path
+        self.auto_calibrate = auto_calibrate
+        self.recalibration_threshold = recalibration_threshold
+
+        if isinstance(default_calibration, AxisCalibration) or not isinstance(default_calibration[0], (AxisCalibration, list, tuple)):
+            default_calibration = [default_calibration] * count
+        self.calibrations = [c if isinstance(c, AxisCalibration) else AxisCalibration(*c) for c in per_axis(default_calibration, count)]
+        self.calibrated = self.load()  # False while default calibration is used
+
+        self._count = count
+        size = 1 << bits
+        self._size = size
+        self._half = size >> 1 if signed else size  # codes from here on are negative (unsigned register values of signed codes)
+        # valid codes (both signed and unsigned register values if signed) and what codes outside of them are clamped to
+        self._code_range = (-(size >> 1), size - 1) if signed else (0, size - 1)
+        self._clamp_range = (-(size >> 1), (size >> 1) - 1) if signed else (0, size - 1)
+
+        self._tables = [None] * count
+        for i in range(count):
+            self._build_table(i)
+
+        # raw codes within these don't change calibration
+        self._lower = [0] * count
+        self._upper = [0] * count
+        for i in range(count):
+            self._set_limits(i)
+
+        self._radial_pairs = tuple((self.axis_names.index(x), self.axis_names.index(y)) for x, y in radial_pairs)
+        if len(self._radial_pairs) > 0:
+            self._radial_x, self._radial_y = build_radial_tables(radial_dead_zone, radial_curve)
+
+        self.table_builds = 0
+
+        self._update_lock = None  # created by the first update in background - threading is not imported until then
+        self._pending_tables = set()  # indices of axes whose tables are to be regenerated
+        self._updater = None
+
+    def _build_table(self, i):
+        self._tables[i] = build_axis_table(self.calibrations[i], self.bits, self.signed, self.dead_zone[i], self.curve[i])
+
+    def _set_limits(self, i):
+        calibration = self.calibrations[i]
+        margin = int((calibration.maximum - calibration.minimum) * self.recalibration_threshold)
+        self._lower[i] = calibration.minimum - margin
+        self._upper[i] = calibration.maximum + margin
+
+    def _signed_code(self, code):
+        return code - self._size if code >= self._half else code
+
+    def condition(self, raw_values, out):
+        """
+        Conditions raw codes
+        :param raw_values: raw codes in order of axis_names
+        :param out: list (or JoystickState.axes) to store conditioned -127..127 values in, in the same order
+        :return: out
+        """
+        tables = self._tables
+        auto_calibrate = self.auto_calibrate
+        lower = self._lower
+        upper = self._upper
+        minimum, maximum = self._code_range
+        half = self._half
+        size = self._size
+        for i in range(self._count):
+            code = raw_values[i]
+            if code < minimum or code > maximum:
+                clamp_minimum, clamp_maximum = self._clamp_range
+                code = clamp_minimum if code < minimum else clamp_maximum
+            elif code >= half:
+                code -= size  # unsigned register value of negative code
+            if auto_calibrate and (code < lower[i] or code > upper[i]):
+                self._widen(i, code)
+            out[i] = tables[i][code]  # negative codes index the table from its end
+
+        if len(self._radial_pairs) > 0:
+            table_x = self._radial_x
+            table_y = self._radial_y
+            for xi, yi in self._radial_pairs:
+                index = ((out[xi] & 0xff) << 8) | (out[yi] & 0xff)
+                out[xi] = table_x[index]
+                out[yi] = table_y[index]
+
+        return out
+
+    def _widen(self, i, code):
+        calibration = self.calibrations[i]
+
+        self.calibrations[i] = AxisCalibration(min(code, calibration.minimum), calibration.centre, max(code, calibration.maximum))
+        self._set_limits(i)
+        self._update_later(i)
+
+    def _update_later(self, i):
+        import threading
+
+        if self._update_lock is None:
+            self._update_lock = threading.Lock()
+        with self._update_lock:
+            self._pending_tables.add(i)
+            if self._updater is None:
+                # not a daemon thread - the interpreter waits for calibration to be written before it exits
+                self._updater = threading.Thread(target=self._update_pending, name="calibration-updater")
+                self._updater.start()
+
+    def _update_pending(self):
+        while True:
+            with self._update_lock:
+                if len(self._pending_tables) == 0:
+                    self._updater = None
+                    return
+                pending = self._pending_tables
+                self._pending_tables = set()
+
+            for i in pending:
+                calibration = self.calibrations[i]
+                table = build_axis_table(calibration, self.bits, self.signed, self.dead_zone[i], self.curve[i])
+                # calibrate_centre may have replaced calibration (and built its table) meanwhile;
+                # calibration widened again meanwhile is pending again
+                if self.calibrations[i] is calibration:
+                    self._tables[i] = table  # conditioning picks up the new table with its next sample
+                    self.table_builds += 1
+            self.save()
+
+    def wait_saved(self):
+        """
+        Waits until tables of calibration widened while conditioning are regenerated and calibration is saved
+        """
+        updater = self._updater
+        if updater is not None:
+            updater.join()
+
+    def calibrate_centre(self, raw_values):
+        """
+        Takes current raw codes as centres (sticks must be at rest) and regenerates tables
+        """
+        for i in range(self._count):
+            code = self._signed_code(raw_values[i])
+            calibration = self.calibrations[i]
+            self.calibrations[i] = AxisCalibration(min(code, calibration.minimum), code, max(code, calibration.maximum))
+            self._set_limits(i)
+            self._build_table(i)
+        self.table_builds += 1
+        self.calibrated = True
+        self.save()
+
+    def load(self):
+        """
+        Loads saved calibration of axes with the same names
+        :return: True if calibration was loaded
+        """
+        if self.path is None:
+            return False
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+            if saved["version"] != CALIBRATION_VERSION:
+                return False
+            calibrations = [AxisCalibration(*saved["axes"][name]) if name in saved["axes"] else self.calibrations[i] for i, name in enumerate(self.axis_names)]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+
+        self.calibrations = calibrations
+        return True
+
+    def save(self):
+        """
+        Saves calibration; it is written to a temporary file and renamed, so a half written calibration is never loaded.
+        Failing to write only means calibration is not kept.
+        """
+        if self.path is None:
+            return
+        content = {
+            "version": CALIBRATION_VERSION,
+            "axes": {name: self.calibrations[i].to_json() for i, name in enumerate(self.axis_names)}
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + "." + str(os.getpid()) + ".tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump(content, f)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            print("Cannot save calibration to " + self.path + "; " + str(e))
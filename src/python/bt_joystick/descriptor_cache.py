@@ -0,0 +1,174 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Caches generated HID report descriptor bytes, compiled report layout and SDP record XML on disk,
+# so they don't need to be built again on every start. Entries are keyed by hash of the configuration
+# they were generated from and validated by hash of their content when loaded.
+
+import hashlib
+import json
+import os
+
+from bt_joystick import hid_report
+from bt_joystick import hid_report_descriptor
+from bt_joystick import sdp_record
+
+from bt_joystick.hid_report import ReportField, ReportLayout, compile_report_layout
+from bt_joystick.hid_report_descriptor import Usage
+from bt_joystick.sdp_record import MinorDeviceClass, PrecompiledSDPRecord
+
+
+# Increase when format of cache entries changes. Changes of code generating descriptor, layout or SDP record
+# are picked up by generator_version() without it.
+CACHE_VERSION = 2
+
+# Modules generating what is cached - entries generated by other versions of them are not used
+_GENERATOR_MODULES = (hid_report_descriptor, sdp_record, hid_report)
+
+_generator_version = None
+
+
+def default_cache_directory():
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "bt_joystick")
+
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def sources_hash(paths):
+    """
+    :return: hash of content of given files
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def generator_version():
+    """
+    Hash of sources of modules generating descriptor, layout and SDP record (computed once per process)
+    """
+    global _generator_version
+    if _generator_version is None:
+        _generator_version = sources_hash([module.__file__ for module in _GENERATOR_MODULES])
+    return _generator_version
+
+
+def _layout_to_json(layout):
+    return {
+        "report_id": layout.report_id,
+        "fields": [[f.name, f.usage_page, f.usage, f.bit_offset, f.bit_size, f.logical_minimum, f.logical_maximum, f.flags] for f in layout.fields]
+    }
+
+
+def _layout_from_json(value):
+    return ReportLayout(value["report_id"], [ReportField(*f) for f in value["fields"]])
+
+
+class CachedConfiguration:
+    """
+    Everything generated for one configuration: descriptor bytes, compiled layout of its input report
+    and SDP record - pass descriptor and layout to HIDDevice (or BTDevice) as hid_descriptor and report_layout.
+    """
+    def __init__(self, descriptor, layout, sdp_xml):
+        self.descriptor = descriptor
+        self.layout = layout
+        self.service_record = PrecompiledSDPRecord(sdp_xml, descriptor)
+
+
+class DescriptorCache:
+    """
+    Content addressed on-disk cache of CachedConfiguration entries - one JSON file per configuration hash.
+    """
+    def __init__(self, directory=None):
+        """
+        Constructor
+        :param directory: directory cache entries are stored in; default_cache_directory() if not supplied
+        """
+        self.directory = directory if directory is not None else default_cache_directory()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key):
+        """
+        Loads entry with given key
+        :return: CachedConfiguration or None if there is no entry, or it is unreadable or doesn't match its hash
+        """
+        try:
+            with open(self.path(key), "r") as f:
+                entry = json.load(f)
+            content = entry["content"]
+            if entry["sha256"] != _hash(content):
+                print("Ignoring corrupted descriptor cache entry " + self.path(key))
+                return None
+            return CachedConfiguration(bytes.fromhex(content["descriptor"]), _layout_from_json(content["layout"]), content["sdp_xml"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def store(self, key, configuration):
+        """
+        Stores configuration under given key. Entry is written to a temporary file and renamed, so a half written entry
+        is never seen. Failing to write (read only file system, for instance) only means nothing is cached.
+        """
+        content = {
+            "descriptor": configuration.descriptor.hex(),
+            "layout": _layout_to_json(configuration.layout),
+            "sdp_xml": configuration.service_record.xml()
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self.path(key) + "." + str(os.getpid()) + ".tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump({"sha256": _hash(content), "content": content}, f)
+                os.replace(temp_path, self.path(key))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            print("Cannot write descriptor cache entry to " + self.directory + "; " + str(e))
+
+    def joystick_configuration(self, kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), hat_switch=False, button_number=14,
+                               service_name="A Virtual Gamepad Controller", service_description="Keyboard > BT Gamepad", provider_name="GCC",
+                               subclass=MinorDeviceClass.Gamepad, reconnect_initiate=False):
+        """
+        Returns descriptor, layout and SDP record for given configuration, generating (and caching) them only if not already cached.
+        See hid_report_descriptor.create_joystick_report_descriptor and sdp_record.create_simple_HID_SDP_Report for parameters.
+        :return: CachedConfiguration
+        """
+        key = _hash({
+            "version": CACHE_VERSION,
+            "generator": generator_version(),
+            "kind": kind,
+            "axes": list(axes) if axes is not None else None,
+            "hat_switch": hat_switch,
+            "button_number": button_number,
+            "service_name": service_name,
+            "service_description": service_description,
+            "provider_name": provider_name,
+            "subclass": subclass,
+            "reconnect_initiate": reconnect_initiate
+        })
+
+        configuration = self.load(key)
+        if configuration is not None:
+            self.hits += 1
+            return configuration
+
+        self.misses += 1
+        descriptor = hid_report_descriptor.create_joystick_report_descriptor(kind=kind, axes=axes, hat_switch=hat_switch, button_number=button_number)
+        record = sdp_record.create_simple_HID_SDP_Report(service_name, service_description, provider_name, descriptor,
+                                                         subclass=subclass, reconnect_reinitiate=reconnect_initiate)
+        configuration = CachedConfiguration(bytes(descriptor), compile_report_layout(descriptor), record.xml())
+        self.store(key, configuration)
+        return configuration
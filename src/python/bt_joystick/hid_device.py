@@ -0,0 +1,214 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import selectors
+import socket
+import time
+
+from bt_joystick import hid_report_descriptor
+
+from bt_joystick.hid_report import ReportEncoder, compile_report_layout
+from bt_joystick.hid_report_descriptor import Usage
+from bt_joystick.stats import PipelineStats
+from bt_joystick.transport import ChannelPairer, L2CAPTransport, peer_address
+
+
+def create_default_hid_descriptor():
+    return hid_report_descriptor.create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), button_number=14)
+
+
+class HIDDevice:
+    """
+    HID device side of the control and interrupt channels, independent of how the channels are transported.
+    BTDevice adds Bluetooth adapter and BlueZ profile set up on top of it.
+    """
+    CONTROL_MTU = 1024
+    CHANNEL_NAMES = ("control", "interrupt")
+
+    def __init__(self, hid_descriptor=None, transport=None, recorder=None, report_layout=None):
+        """
+        Constructor
+        :param hid_descriptor: USBHIDReportDescriptor (or its bytes) the device advertises; default gamepad descriptor if not supplied
+        :param transport: Transport to listen on; L2CAPTransport if not supplied
+        :param recorder: ReportRecorder every sent report is recorded to; nothing recorded if None
+        :param report_layout: ReportLayout of the descriptor's input report (from DescriptorCache, for instance);
+                              compiled from hid_descriptor if not supplied
+        """
+        if hid_descriptor is None:
+            hid_descriptor = create_default_hid_descriptor()
+        if report_layout is None:
+            if isinstance(hid_descriptor, (bytes, bytearray)):
+                hid_descriptor = hid_report_descriptor.parse_report_descriptor(hid_descriptor)
+            report_layout = compile_report_layout(hid_descriptor)
+
+        self.transport = transport if transport is not None else L2CAPTransport()
+
+        self.scontrol = None
+        self.ccontrol = None
+        self.sinterrupt = None
+        self.cinterrupt = None
+        self.host_address = None  # address of the last connected host, for device initiated reconnection
+
+        self._selector = None
+        self._pairer = ChannelPairer()
+
+        # report encoder is compiled once from the descriptor so reports always match what was advertised
+        self.hid_descriptor = hid_descriptor
+        self.report_layout = report_layout
+        self.report_encoder = ReportEncoder(report_layout)
+
+        # latency histograms and counters of the send pipeline
+        self.stats = PipelineStats()
+
+        self.recorder = recorder
+
+    def listen(self, timeout=None, pair_timeout=5.0, clock=time.monotonic):
+        """
+        Waits for the host to connect control and interrupt channels. Listening sockets are created on the first call
+        and kept for all following connections. Channels are accepted in whichever order they arrive and paired
+        by peer address; a channel whose pair doesn't arrive within pair_timeout is closed.
+        :param timeout: how long to wait in seconds; None to wait until connected
+        :param pair_timeout: how long a channel waits for the other channel from the same peer
+        :param clock: monotonic clock returning seconds
+        :return: True if connected, False if timed out
+        """
+        self.close_connection()
+        if self._selector is None:
+            self.scontrol, self.sinterrupt = self.transport.listen_sockets()
+            self._selector = selectors.DefaultSelector()
+            for channel, s in enumerate((self.scontrol, self.sinterrupt)):
+                s.setblocking(False)
+                self._selector.register(s, selectors.EVENT_READ, channel)
+
+        deadline = None if timeout is None else clock() + timeout
+        while True:
+            now = clock()
+            wait = None if deadline is None else max(deadline - now, 0.0)
+            expires = self._pairer.expire(now, pair_timeout)
+            if expires is not None and (wait is None or expires < wait):
+                wait = expires
+
+            for key, _ in self._selector.select(wait):
+                try:
+                    sock, info = key.fileobj.accept()
+                except (BlockingIOError, InterruptedError):
+                    continue
+                sock.setblocking(True)
+                address = peer_address(info)
+                channel = key.data
+                print("Got a connection on the " + HIDDevice.CHANNEL_NAMES[channel] + " channel from " + str(address))
+
+                paired = self._pairer.add(channel, sock, address, clock())
+                if paired is not None:
+                    self.ccontrol, self.cinterrupt = paired
+                    self.host_address = address
+                    return True
+
+            if deadline is not None and clock() >= deadline:
+                return False
+
+    def connect(self, address=None, timeout=None):
+        """
+        Connects control and interrupt channels to the host (device initiated connection)
+        :param address: host address; the last connected host if not supplied
+        :param timeout: timeout in seconds for establishing each channel
+        """
+        if address is None:
+            address = self.host_address
+        self.close_connection()
+        self.ccontrol, self.cinterrupt = self.transport.connect_sockets(address, timeout)
+        self.host_address = address
+        print("Connected to " + str(address))
+
+    def reconnect(self, timeout=1.0, initial_backoff=0.01, max_backoff=0.2, clock=time.monotonic, sleep=time.sleep):
+        """
+        Tries to connect to the last connected host, retrying with exponential backoff
+        :param timeout: how long to keep trying in seconds
+        :param initial_backoff: wait after the first failed attempt; doubled after each further failure
+        :param max_backoff: longest wait between attempts
+        :return: True if connected
+        """
+        if self.host_address is None:
+            return False
+
+        deadline = clock() + timeout
+        backoff = initial_backoff
+        while True:
+            remaining = deadline - clock()
+            try:
+                self.connect(timeout=max(remaining, 0.001))
+                return True
+            except OSError as e:
+                print("Failed to reconnect to " + str(self.host_address) + "; " + str(e))
+            if clock() + backoff > deadline:
+                return False
+            sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+    def close_connection(self):
+        for s in (self.ccontrol, self.cinterrupt):
+            if s is not None:
+                try:
+                    s.shutdown(socket.SHUT_RDWR)  # wakes up thread serving control channel
+                except OSError:
+                    pass
+                s.close()
+        self.ccontrol = None
+        self.cinterrupt = None
+
+    def close(self):
+        """
+        Closes connection, half open channels and listening sockets
+        """
+        self.close_connection()
+        self._pairer.close()
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+            self.scontrol.close()
+            self.sinterrupt.close()
+            self.scontrol = None
+            self.sinterrupt = None
+
+    def serve_control(self, handler):
+        """
+        Answers control channel messages with the given handler until the host closes the channel
+        or unplugs the virtual cable. Blocks, so it is meant to be run in its own thread alongside the sender.
+        :param handler: HIDPControlHandler
+        """
+        ccontrol = self.ccontrol
+        while not handler.unplugged:
+            try:
+                message = ccontrol.recv(self.CONTROL_MTU)
+            except OSError as e:
+                print("Control channel closed " + str(e))
+                break
+            if len(message) == 0:
+                break
+
+            reply = handler.handle(message)
+            if reply is not None:
+                ccontrol.send(reply)
+
+    def send_message(self, message):
+        self.cinterrupt.send(message)
+        if self.recorder is not None:
+            self.recorder.record(message)
+
+    def send_values(self, button_bits, axis_values, hat_value):
+        """
+        Convenience function to send a message with button states, axis values and hat switch state
+        :param button_bits: bitmap for the button states, bit 0 being the first button
+        :param axis_values: list of axis values (each in -127..127)
+        :param hat_value: value for the hat switch: 1..8 for top, top right, right, ..., top left, or 9 for the middle (not pressed) position;
+                          ignored if descriptor doesn't define hat switch
+        """
+        encoder = self.report_encoder
+        encoder.set_buttons(button_bits)
+        encoder.set_axes(axis_values)
+        if len(encoder.layout.hat_switches) > 0:
+            encoder.set_hat_switch(hat_value)
+        self.send_message(encoder.encode())
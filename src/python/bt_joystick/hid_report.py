@@ -0,0 +1,480 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Compiles USB HID report descriptors into report layouts (bit offset/size of every field)
+# and packs/unpacks report values according to such layouts.
+
+import struct
+
+from bt_joystick.hid_report_descriptor import _Elements, _SimpleElement, Collection, Usage, UsagePage
+
+
+HIDP_DATA_INPUT = 0xA1  # HIDP transaction header: DATA | Input report
+
+_STRUCT_CODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def _snake_case(name):
+    # 'HatSwitch' -> 'hat_switch', 'Rx' -> 'rx' (re is not used to keep import time low)
+    result = []
+    for i, c in enumerate(name):
+        if c.isupper() and i > 0 and (name[i - 1].islower() or name[i - 1].isdigit()):
+            result.append("_")
+        result.append(c.lower())
+    return "".join(result)
+
+
+def _usage_names():
+    names = {}
+    for attr_name, value in vars(Usage).items():
+        if not attr_name.startswith("_") and isinstance(value, int) and value not in names:
+            names[value] = _snake_case(attr_name)
+    return names
+
+
+# Generic desktop usage -> field name ('x', 'rx', 'hat_switch', ...)
+GENERIC_DESKTOP_USAGE_NAMES = _usage_names()
+
+
+def _signed_value(element):
+    return element.signed_value()
+
+
+def _unsigned_value(element):
+    return 0 if element.value is None else element.value
+
+
+def null_value(field):
+    """
+    Value outside of field's logical range - reported by fields with null state (hat switches) when nothing is pressed
+    """
+    largest = (1 << (field.bit_size - 1)) - 1 if field.signed else (1 << field.bit_size) - 1
+    if field.logical_maximum < largest:
+        return field.logical_maximum + 1
+    return field.logical_minimum - 1
+
+
+def field_name(usage_page, usage):
+    if usage_page == UsagePage.Button:
+        return "button_{}".format(usage)
+    if usage_page == UsagePage.GenericDesktopCtrls and usage in GENERIC_DESKTOP_USAGE_NAMES:
+        return GENERIC_DESKTOP_USAGE_NAMES[usage]
+    return "usage_{:02x}_{:02x}".format(usage_page, usage)
+
+
+class ReportField:
+    """
+    One field of a HID report: where it is in the report (bits after the report ID) and how its value is interpreted.
+    """
+    def __init__(self, name, usage_page, usage, bit_offset, bit_size, logical_minimum, logical_maximum, flags):
+        self.name = name
+        self.usage_page = usage_page
+        self.usage = usage
+        self.bit_offset = bit_offset
+        self.bit_size = bit_size
+        self.logical_minimum = logical_minimum
+        self.logical_maximum = logical_maximum
+        self.flags = flags
+        self.constant = bool(flags & 0x01)
+        self.variable = bool(flags & 0x02)
+        self.signed = logical_minimum < 0
+
+    def __repr__(self):
+        return "ReportField({}, bit_offset={}, bit_size={})".format(self.name, self.bit_offset, self.bit_size)
+
+
+class ReportLayout:
+    """
+    Layout of one input report: report ID and all fields (including constant padding) in report order.
+    """
+    def __init__(self, report_id, fields):
+        self.report_id = report_id
+        self.fields = fields
+        self.bit_size = sum(f.bit_size for f in fields)
+        self.size = (self.bit_size + 7) // 8
+
+        data_fields = [f for f in fields if not f.constant and f.name is not None]
+        self.buttons = sorted([f for f in data_fields if f.usage_page == UsagePage.Button], key=lambda f: f.usage)
+        self.axes = [f for f in data_fields if f.usage_page == UsagePage.GenericDesktopCtrls and f.usage != Usage.HatSwitch]
+        self.hat_switches = [f for f in data_fields if f.usage_page == UsagePage.GenericDesktopCtrls and f.usage == Usage.HatSwitch]
+        self.fields_by_name = {f.name: f for f in data_fields}
+
+    def field(self, name):
+        return self.fields_by_name[name]
+
+
+def compile_report_layouts(descriptor):
+    """
+    Walks USB HID report descriptor and returns layouts of all input reports it defines.
+    :param descriptor: USBHIDReportDescriptor (or any other tree of _Element objects)
+    :return: dictionary of report ID (None if descriptor doesn't use report IDs) to ReportLayout
+    """
+    state = {"usage_page": 0, "logical_minimum": 0, "logical_maximum": 0, "report_size": 0, "report_count": 0, "report_id": None}
+    usages = []
+    usage_range = [None, None]
+    report_fields = {}
+
+    def input_item(flags):
+        report_id = state["report_id"]
+        fields = report_fields.setdefault(report_id, [])
+        bit_offset = sum(f.bit_size for f in fields)
+        count = state["report_count"]
+        size = state["report_size"]
+
+        item_usages = list(usages)
+        if usage_range[0] is not None and usage_range[1] is not None:
+            item_usages += range(usage_range[0], usage_range[1] + 1)
+
+        if flags & 0x01:
+            fields.append(ReportField(None, state["usage_page"], 0, bit_offset, size * count,
+                                      state["logical_minimum"], state["logical_maximum"], flags))
+            return
+
+        for i in range(count):
+            if not flags & 0x02:
+                name = "array_{}_{}".format(len(fields), i)
+                usage = item_usages[0] if len(item_usages) > 0 else 0
+            elif len(item_usages) > 0:
+                usage = item_usages[min(i, len(item_usages) - 1)]
+                name = field_name(state["usage_page"], usage)
+            else:
+                usage = 0
+                name = None
+            fields.append(ReportField(name, state["usage_page"], usage, bit_offset + i * size, size,
+                                      state["logical_minimum"], state["logical_maximum"], flags))
+
+    def walk(elements):
+        for element in elements:
+            if isinstance(element, Collection):
+                del usages[:]
+                usage_range[0] = usage_range[1] = None
+                walk(element.elements)
+            elif isinstance(element, _Elements):
+                walk(element.elements)
+            elif isinstance(element, _SimpleElement):
+                code = element.code
+                if code == _SimpleElement.UsagePage:
+                    state["usage_page"] = _unsigned_value(element)
+                elif code == _SimpleElement.Usage:
+                    usages.append(_unsigned_value(element))
+                elif code == _SimpleElement.UsageMinimum:
+                    usage_range[0] = _unsigned_value(element)
+                elif code == _SimpleElement.UsageMaximum:
+                    usage_range[1] = _unsigned_value(element)
+                elif code == _SimpleElement.LogicalMinimum:
+                    state["logical_minimum"] = _signed_value(element)
+                elif code == _SimpleElement.LogicalMaximum:
+                    # as Linux does, a maximum with sign bit set after a non-negative minimum is read as unsigned ('15 00 25 ff' is 0..255)
+                    state["logical_maximum"] = _signed_value(element) if state["logical_minimum"] < 0 else _unsigned_value(element)
+                elif code == _SimpleElement.ReportSize:
+                    state["report_size"] = _unsigned_value(element)
+                elif code == _SimpleElement.ReportCount:
+                    state["report_count"] = _unsigned_value(element)
+                elif code == _SimpleElement.ReportID:
+                    state["report_id"] = _unsigned_value(element)
+                elif code in (_SimpleElement.Input, _SimpleElement.Output, _SimpleElement.Feature):
+                    if code == _SimpleElement.Input:
+                        input_item(_unsigned_value(element))
+                    del usages[:]
+                    usage_range[0] = usage_range[1] = None
+
+    walk([descriptor])
+
+    return {report_id: ReportLayout(report_id, fields) for report_id, fields in report_fields.items()}
+
+
+def compile_report_layout(descriptor, report_id=None):
+    """
+    Returns layout of a single input report from the descriptor.
+    :param descriptor: USBHIDReportDescriptor
+    :param report_id: report ID to return layout for; if None, the first report defined in the descriptor
+    """
+    layouts = compile_report_layouts(descriptor)
+    if len(layouts) == 0:
+        raise ValueError("Descriptor does not define any input reports")
+    if report_id is None:
+        return next(iter(layouts.values()))
+    return layouts[report_id]
+
+
+class _Segment:
+    # Byte aligned part of the report packed with a single struct code (or several 'B's if it has an odd size)
+    def __init__(self, byte_offset, fields):
+        self.byte_offset = byte_offset
+        self.fields = fields
+        self.size = sum(f.bit_size for f in fields) // 8
+
+
+def _segments(layout):
+    segments = []
+    pending = []
+    bits = 0
+    for f in layout.fields:
+        pending.append(f)
+        bits += f.bit_size
+        if bits % 8 == 0:
+            segments.append(_Segment(pending[0].bit_offset // 8, pending))
+            pending = []
+            bits = 0
+    if len(pending) > 0:
+        raise ValueError("Report size of {} bits is not a whole number of bytes".format(layout.bit_size))
+
+    # Bit fields (like buttons) that spill over several segments are packed as one wider integer where possible
+    merged = []
+    for segment in segments:
+        if len(merged) > 0:
+            previous = merged[-1]
+            shares_bit_field = any(f.bit_size % 8 != 0 for f in previous.fields) and any(f.bit_size % 8 != 0 for f in segment.fields)
+            if shares_bit_field and previous.size + segment.size in (2, 4, 8):
+                merged[-1] = _Segment(previous.byte_offset, previous.fields + segment.fields)
+                continue
+        merged.append(segment)
+    return merged
+
+
+class ReportEncoder:
+    """
+    Packs values into a preallocated report buffer according to the report layout compiled from the descriptor.
+
+    Setters only update integers in a preallocated list and encode() packs them into the same bytearray
+    every time, so no new bytes/list objects are created per report. Note that the returned buffer is reused:
+    copy it if it needs to be kept around.
+    """
+    def __init__(self, layout, hidp_header=True):
+        """
+        Constructor
+        :param layout: ReportLayout or USBHIDReportDescriptor (in which case first input report's layout is used)
+        :param hidp_header: should HIDP transaction header (0xA1) be prepended to the report
+        """
+        if not isinstance(layout, ReportLayout):
+            layout = compile_report_layout(layout)
+        self.layout = layout
+
+        prefix = []
+        if hidp_header:
+            prefix.append(HIDP_DATA_INPUT)
+        if layout.report_id is not None:
+            prefix.append(layout.report_id)
+        self._payload_offset = len(prefix)
+
+        self.report = bytearray(self._payload_offset + layout.size)
+        self.report[0:self._payload_offset] = bytes(prefix)
+
+        segments = _segments(layout)
+        self._segment_values = [0] * len(segments)
+
+        # Segments of odd sizes (3, 5, 6 or 7 bytes) are packed byte by byte: (segment, first argument, size or 0)
+        codes = "<"
+        self._arguments = []
+        arg_index = 0
+        for i, segment in enumerate(segments):
+            if segment.size in _STRUCT_CODES:
+                codes += _STRUCT_CODES[segment.size]
+                self._arguments.append((i, arg_index, 0))
+                arg_index += 1
+            else:
+                codes += "B" * segment.size
+                self._arguments.append((i, arg_index, segment.size))
+                arg_index += segment.size
+        self._struct = struct.Struct(codes)
+        self._split = any(size > 0 for _, _, size in self._arguments)
+        self._args = [0] * arg_index if self._split else self._segment_values
+
+        # (segment index, shift in segment, mask, mask of bits to keep) for each field
+        self._field_slots = {}
+        for i, segment in enumerate(segments):
+            for f in segment.fields:
+                shift = f.bit_offset - segment.byte_offset * 8
+                mask = (1 << f.bit_size) - 1
+                keep = ((1 << (segment.size * 8)) - 1) ^ (mask << shift)
+                self._field_slots[f] = (i, shift, mask, keep)
+
+        self._axes = [self._field_slots[f] for f in layout.axes]
+        self._hat_switches = [self._field_slots[f] for f in layout.hat_switches]
+        self._fields_by_name = {name: self._field_slots[f] for name, f in layout.fields_by_name.items()}
+
+        # Consecutive buttons in the same segment are set with one operation: (segment, shift, first button, mask, keep)
+        self._button_parts = []
+        for button_index, f in enumerate(layout.buttons):
+            segment_index, shift, _, _ = self._field_slots[f]
+            if len(self._button_parts) > 0:
+                p_segment, p_shift, p_first, p_mask, p_keep = self._button_parts[-1]
+                p_count = p_mask.bit_length()
+                if p_segment == segment_index and p_shift + p_count == shift and f.bit_size == 1:
+                    mask = (p_mask << 1) | 1
+                    self._button_parts[-1] = (p_segment, p_shift, p_first, mask, p_keep ^ (1 << shift))
+                    continue
+            segment_bits = (1 << (segments[segment_index].size * 8)) - 1
+            self._button_parts.append((segment_index, shift, button_index, 1, segment_bits ^ (1 << shift)))
+
+        # Hat switches start in their null state (no direction pressed) - a value outside of the logical range
+        self.hat_switch_nulls = [null_value(f) for f in layout.hat_switches]
+        for hat_switch, value in zip(self._hat_switches, self.hat_switch_nulls):
+            self._set(hat_switch, value)
+        self.encode()
+
+    def _set(self, slot, value):
+        segment_index, shift, mask, keep = slot
+        values = self._segment_values
+        values[segment_index] = (values[segment_index] & keep) | ((value & mask) << shift)
+
+    def set_buttons(self, button_bits):
+        """
+        Sets state of all buttons at once
+        :param button_bits: bitmap of button states: bit 0 is the first button (Button usage 1), etc.
+        """
+        values = self._segment_values
+        for segment_index, shift, first, mask, keep in self._button_parts:
+            values[segment_index] = (values[segment_index] & keep) | (((button_bits >> first) & mask) << shift)
+
+    def set_axis(self, index, value):
+        self._set(self._axes[index], value)
+
+    def set_axes(self, axis_values):
+        """
+        Sets axis values in order axes are defined in the descriptor
+        :param axis_values: sequence of axis values; negative values are stored in two's complement
+        """
+        values = self._segment_values
+        for (segment_index, shift, mask, keep), value in zip(self._axes, axis_values):
+            values[segment_index] = (values[segment_index] & keep) | ((value & mask) << shift)
+
+    def set_hat_switch(self, value, index=0):
+        self._set(self._hat_switches[index], value)
+
+    def set_field(self, name, value):
+        self._set(self._fields_by_name[name], value)
+
+    def encode(self):
+        """
+        Packs current values into the report buffer
+        :return: report buffer (the same bytearray on every call)
+        """
+        if self._split:
+            args = self._args
+            values = self._segment_values
+            for segment_index, arg_index, size in self._arguments:
+                value = values[segment_index]
+                if size == 0:
+                    args[arg_index] = value
+                else:
+                    for i in range(size):
+                        args[arg_index + i] = (value >> (i * 8)) & 255
+        self._struct.pack_into(self.report, self._payload_offset, *self._args)
+        return self.report
+
+
+class ReportDecoder:
+    """
+    Unpacks reports (as sent by ReportEncoder or captured from the interrupt channel) into named field values.
+    """
+    def __init__(self, layout, hidp_header=True):
+        """
+        Constructor
+        :param layout: ReportLayout or USBHIDReportDescriptor (in which case first input report's layout is used)
+        :param hidp_header: do reports start with HIDP transaction header (0xA1)
+        """
+        if not isinstance(layout, ReportLayout):
+            layout = compile_report_layout(layout)
+        self.layout = layout
+
+        prefix = []
+        if hidp_header:
+            prefix.append(HIDP_DATA_INPUT)
+        if layout.report_id is not None:
+            prefix.append(layout.report_id)
+        self._prefix = bytes(prefix)
+        self.record_size = len(prefix) + layout.size
+
+        segments = _segments(layout)
+        codes = "<" + "x" * len(prefix)
+        # (first struct value, number of bytes or 0 if segment is a single struct value)
+        self._segment_values = []
+        value_index = 0
+        for segment in segments:
+            if segment.size in _STRUCT_CODES:
+                codes += _STRUCT_CODES[segment.size]
+                self._segment_values.append((value_index, 0))
+                value_index += 1
+            else:
+                codes += "B" * segment.size
+                self._segment_values.append((value_index, segment.size))
+                value_index += segment.size
+        self._struct = struct.Struct(codes)
+        self._value_count = value_index
+
+        # (name, segment index, shift, mask, sign bit or 0, is field whole segment) for every named field
+        self._fields = []
+        for i, segment in enumerate(segments):
+            for f in segment.fields:
+                if f.constant or f.name is None:
+                    continue
+                shift = f.bit_offset - segment.byte_offset * 8
+                sign_bit = 1 << (f.bit_size - 1) if f.signed else 0
+                self._fields.append((f.name, i, shift, (1 << f.bit_size) - 1, sign_bit, f.bit_size == segment.size * 8))
+
+    def decode(self, report):
+        """
+        Decodes a single report
+        :param report: report bytes
+        :return: dictionary of field name to value
+        """
+        if len(report) < self.record_size:
+            raise ValueError("Expected report of {} bytes but got {}".format(self.record_size, len(report)))
+        if report[0:len(self._prefix)] != self._prefix:
+            raise ValueError("Report doesn't start with {}".format(self._prefix.hex()))
+        values = self._struct.unpack_from(report)
+
+        segments = []
+        for value_index, size in self._segment_values:
+            if size == 0:
+                segments.append(values[value_index])
+            else:
+                segments.append(int.from_bytes(bytes(values[value_index:value_index + size]), "little"))
+
+        result = {}
+        for name, segment_index, shift, mask, sign_bit, _ in self._fields:
+            value = (segments[segment_index] >> shift) & mask
+            if sign_bit and value & sign_bit:
+                value -= mask + 1
+            result[name] = value
+        return result
+
+    def decode_many(self, buffer):
+        """
+        Decodes buffer of back to back captured reports all at once
+        :param buffer: bytes-like object with reports of this layout one after another; trailing partial report is ignored
+        :return: dictionary of field name to list of values (one per report)
+        """
+        buffer = memoryview(buffer).cast("B")
+        count = len(buffer) // self.record_size
+        buffer = buffer[:count * self.record_size]
+        for i, b in enumerate(self._prefix):
+            if bytes(buffer[i::self.record_size]) != bytes((b, )) * count:
+                raise ValueError("Not all reports start with {}".format(self._prefix.hex()))
+
+        columns = list(zip(*self._struct.iter_unpack(buffer))) if count > 0 else [()] * self._value_count
+
+        segments = []
+        for value_index, size in self._segment_values:
+            if size == 0:
+                segments.append(columns[value_index])
+            else:
+                segment = [0] * count
+                for i in range(size):
+                    shift = i * 8
+                    segment = [v | (b << shift) for v, b in zip(segment, columns[value_index + i])]
+                segments.append(segment)
+
+        result = {}
+        for name, segment_index, shift, mask, sign_bit, whole in self._fields:
+            column = segments[segment_index]
+            if not whole:
+                column = [(v >> shift) & mask for v in column]
+            if sign_bit:
+                column = [v - mask - 1 if v & sign_bit else v for v in column]
+            result[name] = list(column)
+        return result
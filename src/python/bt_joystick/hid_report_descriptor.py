@@ -4,54 +4,82 @@
 # MIT License
 #
 
+# Elements are immutable: their encoded bytes are computed once, when they are created,
+# so bytes() and hex() of a descriptor don't walk the element tree again.
+
 
 class _Element:
+    __slots__ = ("_bytes", "_hex")
+
+    def __init__(self, encoded):
+        object.__setattr__(self, "_bytes", bytes(encoded))
+        object.__setattr__(self, "_hex", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Descriptor elements are immutable; cannot set " + name)
+
+    def __delattr__(self, name):
+        raise AttributeError("Descriptor elements are immutable; cannot delete " + name)
+
     def values(self):
-        raise NotImplemented
+        return iter(self._bytes)
 
     def __bytes__(self):
-        return bytes(self.values())
+        return self._bytes
 
+    def __len__(self):
+        return len(self._bytes)
 
-class _Elements(_Element):
-    def __init__(self, *elements):
-        self.elements = elements
+    def __eq__(self, other):
+        return isinstance(other, _Element) and self._bytes == other._bytes
 
-    def values(self):
-        for e in self.elements:
-            for b in e.values():
-                if b < 0 or b > 255:
-                    print("B=" + str(b))
-                yield b
+    def __hash__(self):
+        return hash(self._bytes)
+
+    def __copy__(self):
+        return self  # immutable - a copy would be no different
+
+    def __deepcopy__(self, memo):
+        return self
 
     def hex(self):
-        return "".join("{:02x}".format(x) for x in bytes(self))
+        if self._hex is None:
+            object.__setattr__(self, "_hex", self._bytes.hex())
+        return self._hex
+
+
+class _Elements(_Element):
+    __slots__ = ("elements", )
+
+    def __init__(self, *elements):
+        object.__setattr__(self, "elements", elements)
+        super(_Elements, self).__init__(b"".join(e._bytes for e in elements))
 
 
 class USBHIDReportDescriptor(_Elements):
+    __slots__ = ()
+
     def __init__(self, *args):
         super(USBHIDReportDescriptor, self).__init__(*args)
 
 
 class Collection(_Elements):
+    __slots__ = ("kind", )
+
     Physical = 0x00
     Application = 0x01
     Value_0x02 = 0x02
     Report = 0x03
 
     def __init__(self, kind, *elements):
-        super(Collection, self).__init__(*elements)
-        self.kind = kind
-
-    def values(self):
-        yield 0xA1
-        yield self.kind
-        for b in super(Collection, self).values():
-            yield b
-        yield 0xc0
+        object.__setattr__(self, "kind", kind)
+        object.__setattr__(self, "elements", elements)
+        _Element.__init__(self, b"".join([bytes((0xA1, kind))] + [e._bytes for e in elements] + [b"\xc0"]))
 
 
 class _SimpleElement(_Element):
+    __slots__ = ("code", "value", "size")
+
     UsagePage = 0x04
     Usage = 0x08
     UsageMinimum = 0x18
@@ -64,41 +92,78 @@ class _SimpleElement(_Element):
     ReportSize = 0x74
     Input = 0x80
     ReportID = 0x84
+    Output = 0x90
     ReportCount = 0x94
-
-    def __init__(self, code, value):
-        self.code = code
-        if -127 <= value < 0:
-            self.value = value + 256
-        elif -32768 <= value < -255:
-            self.value = value + 65536
-        elif -0x80000000 <= value < -32768:
-            self.value = value + 0x100000000
+    Feature = 0xB0
+
+    def __init__(self, code, value, size=None):
+        # value is kept as the item's data read as unsigned integer (negative values in two's complement of the item's size);
+        # size is the number of data bytes - 0, 1, 2 or 4 - the smallest one that holds the value if not supplied
+        # (as signed value for items with signed data, so LogicalMaximum(255) is 26 ff 00 and not 25 ff, which is -1)
+        if value is None:
+            size = 0
         else:
-            self.value = value
+            if size is None:
+                size = _signed_data_size(value) if code in _SIGNED_CODES else _data_size(value)
+                if size is None:
+                    raise ValueError("Value {} of item 0x{:02x} doesn't fit in 4 bytes".format(value, code))
+            elif size not in (1, 2, 4):
+                raise ValueError("Size of item 0x{:02x} must be 1, 2 or 4 bytes but got {}".format(code, size))
+            bits = size * 8
+            if not -(1 << (bits - 1)) <= value < 1 << bits:
+                raise ValueError("Value {} of item 0x{:02x} doesn't fit in {} bytes".format(value, code, size))
+            if value < 0:
+                value += 1 << bits
+
+        object.__setattr__(self, "code", code)
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "size", size)
+
+        # The first two bits of the code specify the size: 0, 1, 2 or 4 bytes (code is expected to have them zero)
+        if value is None:
+            encoded = bytes((code, ))
+        else:
+            encoded = bytes((code + (3 if size == 4 else size), )) + value.to_bytes(size, "little")
+        super(_SimpleElement, self).__init__(encoded)
 
-    def values(self):
-        # Handle two different sizes: 1 byte for -127..127, and 2 for -255..255
-        # (assuming the supplied code is for the first one, so adding 1 to it specifies the 2-byte version
-        # - the first two bits in the code actually specify the size)
+    def signed_value(self):
+        """
+        :return: value sign extended from the item's size (HID 6.2.2.7) - for items like LogicalMinimum which have signed data
+        """
         if self.value is None:
-            yield self.code
-        elif self.value > 65535:
-            yield self.code + 3
-            yield self.value & 255
-            yield (self.value >> 8) & 255
-            yield (self.value >> 16) & 255
-            yield (self.value >> 24) & 255
-        elif self.value > 255:
-            yield self.code + 2
-            yield self.value & 255
-            yield self.value >> 8
-        else:
-            yield self.code + 1
-            yield self.value
+            return 0
+        sign_bit = 1 << (self.size * 8 - 1)
+        return self.value - (sign_bit << 1) if self.value & sign_bit else self.value
+
+
+# Items whose data is signed (HID 6.2.2.7)
+_SIGNED_CODES = frozenset((_SimpleElement.LogicalMinimum, _SimpleElement.LogicalMaximum,
+                           _SimpleElement.PhysicalMinimum, _SimpleElement.PhysicalMaximum, 0x54))  # 0x54 - unit exponent
+
+
+def _signed_data_size(value):
+    if -128 <= value <= 127:
+        return 1
+    if -32768 <= value <= 32767:
+        return 2
+    if -0x80000000 <= value <= 0x7FFFFFFF:
+        return 4
+    return None
+
+
+def _data_size(value):
+    if -128 <= value <= 255:
+        return 1
+    if -32768 <= value <= 65535:
+        return 2
+    if -0x80000000 <= value <= 0xFFFFFFFF:
+        return 4
+    return None
 
 
 class UsagePage(_SimpleElement):
+    __slots__ = ()
+
     GenericDesktopCtrls = 0x01
     SimCtrl = 0x02
     VRCtrls = 0x03
@@ -121,6 +186,8 @@ class UsagePage(_SimpleElement):
 
 
 class Usage(_SimpleElement):
+    __slots__ = ()
+
     Pointer = 0x01
     Mouse = 0x02
     Value_0x03 = 0x03
@@ -194,6 +261,8 @@ class Usage(_SimpleElement):
 
 
 class ReportID(_SimpleElement):
+    __slots__ = ()
+
     InputReport = 0x01
     OutputReport = 0x02
     FeatureReport = 0x03
@@ -203,46 +272,64 @@ class ReportID(_SimpleElement):
 
 
 class UsageMinimum(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, value):
         super(UsageMinimum, self).__init__(_SimpleElement.UsageMinimum, value)  # TODO if value is less than -128 or over 127 it is code 0x1A and two bytes - little endian
 
 
 class UsageMaximum(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, value):
         super(UsageMaximum, self).__init__(_SimpleElement.UsageMaximum, value)  # TODO if value is less than -128 or over 127 it is code 0x2A and two bytes - little endian
 
 
 class LogicalMinimum(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, value):
-        super(LogicalMinimum, self).__init__(_SimpleElement.LogicalMinimum, value)  # TODO if value is less than -128 or over 127 it is code 0x16 and two bytes - little endian
+        super(LogicalMinimum, self).__init__(_SimpleElement.LogicalMinimum, value)
 
 
 class LogicalMaximum(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, value):
-        super(LogicalMaximum, self).__init__(_SimpleElement.LogicalMaximum, value)  # TODO if value is less than -128 or over 127 it is code 0x26 and two bytes - little endian
+        super(LogicalMaximum, self).__init__(_SimpleElement.LogicalMaximum, value)
 
 
 class PhysicalMinimum(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, value):
         super(PhysicalMinimum, self).__init__(_SimpleElement.PhysicalMinimum, value)
 
 
 class PhysicalMaximum(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, value):
         super(PhysicalMaximum, self).__init__(_SimpleElement.PhysicalMaximum, value)
 
 
 class ReportCount(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, count):
         super(ReportCount, self).__init__(_SimpleElement.ReportCount, count)
 
 
 class ReportSize(_SimpleElement):
+    __slots__ = ()
+
     def __init__(self, size):
         super(ReportSize, self).__init__(_SimpleElement.ReportSize, size)
 
 
 class Unit(_SimpleElement):
+    __slots__ = ()
+
     EnglishRotationDegrees = 0x14
     CM = 0x11
     SIRad = 0x21
@@ -252,6 +339,8 @@ class Unit(_SimpleElement):
 
 
 class Input(_SimpleElement):
+    __slots__ = ()
+
     Data = 0x00
     Const = 0x01
 
@@ -277,7 +366,104 @@ class Input(_SimpleElement):
         super(Input, self).__init__(_SimpleElement.Input, sum(options))
 
 
+class Output(_SimpleElement):
+    __slots__ = ()
+
+    def __init__(self, *options):
+        super(Output, self).__init__(_SimpleElement.Output, sum(options))  # same option bits as Input, plus 0x80 for Volatile
+
+
+class Feature(_SimpleElement):
+    __slots__ = ()
+
+    def __init__(self, *options):
+        super(Feature, self).__init__(_SimpleElement.Feature, sum(options))  # same option bits as Input, plus 0x80 for Volatile
+
+
+_ELEMENT_CLASSES = {
+    _SimpleElement.UsagePage: UsagePage,
+    _SimpleElement.Usage: Usage,
+    _SimpleElement.UsageMinimum: UsageMinimum,
+    _SimpleElement.UsageMaximum: UsageMaximum,
+    _SimpleElement.LogicalMinimum: LogicalMinimum,
+    _SimpleElement.LogicalMaximum: LogicalMaximum,
+    _SimpleElement.PhysicalMinimum: PhysicalMinimum,
+    _SimpleElement.PhysicalMaximum: PhysicalMaximum,
+    _SimpleElement.Unit: Unit,
+    _SimpleElement.ReportSize: ReportSize,
+    _SimpleElement.Input: Input,
+    _SimpleElement.ReportID: ReportID,
+    _SimpleElement.Output: Output,
+    _SimpleElement.ReportCount: ReportCount,
+    _SimpleElement.Feature: Feature,
+}
+
+_COLLECTION = 0xA0
+_END_COLLECTION = 0xC0
+_LONG_ITEM = 0xFE
+
+
+def parse_report_descriptor(data):
+    """
+    Parses USB HID report descriptor back into element tree.
+    :param data: descriptor bytes, or descriptor as hex string (as in HIDDescriptorList of SDP record)
+    :return: USBHIDReportDescriptor
+    """
+    if isinstance(data, str):
+        data = bytes.fromhex(data)
+    data = memoryview(bytes(data))
+
+    # Stack of (collection kind, elements) for currently open collections; top level has kind None
+    stack = [(None, [])]
+    i = 0
+    while i < len(data):
+        prefix = data[i]
+        if prefix == _LONG_ITEM:
+            if i + 2 >= len(data):
+                raise ValueError("Truncated long item at offset {}".format(i))
+            i += 3 + data[i + 1]  # long items are not defined for report descriptors; skipping
+            continue
+
+        size = (0, 1, 2, 4)[prefix & 0x03]
+        code = prefix & 0xFC
+        if i + 1 + size > len(data):
+            raise ValueError("Truncated item 0x{:02x} at offset {}".format(prefix, i))
+        value = int.from_bytes(data[i + 1:i + 1 + size], "little") if size > 0 else None
+        i += 1 + size
+
+        if code == _COLLECTION:
+            stack.append((value if value is not None else 0, []))
+        elif code == _END_COLLECTION:
+            if len(stack) == 1:
+                raise ValueError("End collection without collection at offset {}".format(i - 1 - size))
+            kind, elements = stack.pop()
+            stack[-1][1].append(Collection(kind, *elements))
+        else:
+            # element is created with the size it was read with, so the descriptor is written back the same
+            element = _SimpleElement.__new__(_ELEMENT_CLASSES.get(code, _SimpleElement) if value is not None else _SimpleElement)
+            _SimpleElement.__init__(element, code, value, size)
+            stack[-1][1].append(element)
+
+    if len(stack) != 1:
+        raise ValueError("Unterminated collection at the end of descriptor")
+
+    return USBHIDReportDescriptor(*stack[0][1])
+
+
+# Descriptors already built by create_joystick_report_descriptor - elements are immutable so they can be shared
+_joystick_report_descriptors = {}
+
+
 def create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), hat_switch=False, button_number=14):
+    key = (kind, tuple(axes) if axes is not None else None, hat_switch, button_number)
+    report = _joystick_report_descriptors.get(key)
+    if report is None:
+        report = _build_joystick_report_descriptor(kind, axes, hat_switch, button_number)
+        _joystick_report_descriptors[key] = report
+    return report
+
+
+def _build_joystick_report_descriptor(kind, axes, hat_switch, button_number):
     input_report = [ReportID(ReportID.InputReport)]
     input_report += [UsagePage(UsagePage.Button),
                      UsageMinimum(1),
@@ -331,8 +517,6 @@ def create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y
             Collection(Collection.Application, Collection(Collection.Report, *input_report))
         )
 
-    print(report.hex())
-
     return report
 
 
@@ -343,3 +527,4 @@ if __name__ == "__main__":
     descriptor = create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), button_number=14)
 
     print("Descriptor bytes: " + (descriptor.hex()))
+    print("Parsed back:      " + parse_report_descriptor(descriptor.hex()).hex())
@@ -0,0 +1,173 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Bluetooth HID Profile (HIDP) control channel messages
+
+# Transaction types (high nibble of the header byte)
+HANDSHAKE = 0x00
+HID_CONTROL = 0x10
+GET_REPORT = 0x40
+SET_REPORT = 0x50
+GET_PROTOCOL = 0x60
+SET_PROTOCOL = 0x70
+GET_IDLE = 0x80
+SET_IDLE = 0x90
+DATA = 0xA0
+DATC = 0xB0
+
+# HANDSHAKE result codes
+SUCCESSFUL = 0x00
+NOT_READY = 0x01
+ERR_INVALID_REPORT_ID = 0x02
+ERR_UNSUPPORTED_REQUEST = 0x03
+ERR_INVALID_PARAMETER = 0x04
+ERR_UNKNOWN = 0x0E
+ERR_FATAL = 0x0F
+
+# HID_CONTROL operations
+NOP = 0x00
+HARD_RESET = 0x01
+SOFT_RESET = 0x02
+SUSPEND = 0x03
+EXIT_SUSPEND = 0x04
+VIRTUAL_CABLE_UNPLUG = 0x05
+
+# Report types (low two bits of GET_REPORT/SET_REPORT/DATA parameter)
+REPORT_TYPE_OTHER = 0x00
+REPORT_TYPE_INPUT = 0x01
+REPORT_TYPE_OUTPUT = 0x02
+REPORT_TYPE_FEATURE = 0x03
+
+GET_REPORT_SIZE_FLAG = 0x08
+
+PROTOCOL_BOOT = 0x00
+PROTOCOL_REPORT = 0x01
+
+_HANDSHAKES = [bytes((HANDSHAKE | code, )) for code in range(16)]
+
+
+def handshake(code):
+    return _HANDSHAKES[code]
+
+
+class HIDPControlHandler:
+    """
+    Answers host requests coming over the control channel.
+
+    GET_REPORT is answered from the last report encoded by the report encoder, SET_REPORT is passed
+    to set_report_callback (if any), SET_PROTOCOL/SET_IDLE are acknowledged and HID_CONTROL suspend,
+    exit suspend and virtual cable unplug are recorded in suspended/unplugged flags
+    (and passed to hid_control_callback).
+    """
+    def __init__(self, report_encoder, boot_device=False, set_report_callback=None, hid_control_callback=None):
+        """
+        Constructor
+        :param report_encoder: ReportEncoder with HIDP header whose last report is returned for GET_REPORT
+        :param boot_device: does device support boot protocol
+        :param set_report_callback: function called with report type and report data (memoryview, without header) on SET_REPORT;
+                                    should return HANDSHAKE result code
+        :param hid_control_callback: function called with HID_CONTROL operation
+        """
+        self.report_encoder = report_encoder
+        self.boot_device = boot_device
+        self.set_report_callback = set_report_callback
+        self.hid_control_callback = hid_control_callback
+
+        self.protocol = PROTOCOL_REPORT
+        self.idle_rate = 0
+        self.suspended = False
+        self.unplugged = False
+
+        self._handlers = {
+            HID_CONTROL: self._hid_control,
+            GET_REPORT: self._get_report,
+            SET_REPORT: self._set_report,
+            GET_PROTOCOL: self._get_protocol,
+            SET_PROTOCOL: self._set_protocol,
+            GET_IDLE: self._get_idle,
+            SET_IDLE: self._set_idle,
+            DATA: self._data,
+        }
+
+    def handle(self, message):
+        """
+        Handles one control channel message.
+        :param message: bytes-like message as received from the control channel; it is not copied
+        :return: reply to be sent back over the control channel or None if there is nothing to reply
+        """
+        if len(message) == 0:
+            return None
+        message = memoryview(message)
+        header = message[0]
+        handler = self._handlers.get(header & 0xF0)
+        if handler is None:
+            return handshake(ERR_UNSUPPORTED_REQUEST)
+        return handler(header & 0x0F, message)
+
+    def _hid_control(self, operation, _message):
+        if operation == SUSPEND:
+            self.suspended = True
+        elif operation == EXIT_SUSPEND:
+            self.suspended = False
+        elif operation == VIRTUAL_CABLE_UNPLUG:
+            self.unplugged = True
+        elif operation not in (NOP, HARD_RESET, SOFT_RESET):
+            return handshake(ERR_INVALID_PARAMETER)
+
+        if self.hid_control_callback is not None:
+            self.hid_control_callback(operation)
+        return None  # HID_CONTROL is never acknowledged
+
+    def _get_report(self, parameter, message):
+        report_type = parameter & 0x03
+        if report_type != REPORT_TYPE_INPUT:
+            return handshake(ERR_INVALID_PARAMETER)
+
+        encoder = self.report_encoder
+        report_id = encoder.layout.report_id
+        position = 1
+        if report_id is not None:
+            if len(message) < 2:
+                return handshake(ERR_INVALID_PARAMETER)
+            if message[1] != report_id:
+                return handshake(ERR_INVALID_REPORT_ID)
+            position = 2
+
+        report = encoder.report
+        if parameter & GET_REPORT_SIZE_FLAG:
+            if len(message) < position + 2:
+                return handshake(ERR_INVALID_PARAMETER)
+            buffer_size = message[position] | (message[position + 1] << 8)
+            return bytes(report[:1 + buffer_size])
+        return bytes(report)
+
+    def _set_report(self, parameter, message):
+        if self.set_report_callback is None:
+            return handshake(SUCCESSFUL)
+        return handshake(self.set_report_callback(parameter & 0x03, message[1:]))
+
+    def _get_protocol(self, _parameter, _message):
+        return bytes((DATA | REPORT_TYPE_OTHER, self.protocol))
+
+    def _set_protocol(self, parameter, _message):
+        protocol = parameter & 0x01
+        if protocol == PROTOCOL_BOOT and not self.boot_device:
+            return handshake(ERR_INVALID_PARAMETER)
+        self.protocol = protocol
+        return handshake(SUCCESSFUL)
+
+    def _get_idle(self, _parameter, _message):
+        return bytes((DATA | REPORT_TYPE_OTHER, self.idle_rate))
+
+    def _set_idle(self, _parameter, message):
+        if len(message) < 2:
+            return handshake(ERR_INVALID_PARAMETER)
+        self.idle_rate = message[1]
+        return handshake(SUCCESSFUL)
+
+    def _data(self, _parameter, _message):
+        # DATA on control channel is deprecated - nothing to do with it
+        return None
@@ -0,0 +1,308 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Declarative description of a controller - its axes, named buttons and hat switch. Report descriptor,
+# SDP record and tables mapping joystick readings to report values are all derived from it,
+# so a new controller layout only needs a new description.
+
+from array import array
+from itertools import compress
+from operator import itemgetter
+
+from bt_joystick import hid_report_descriptor
+from bt_joystick import sdp_record
+
+from bt_joystick.change_detector import per_axis
+from bt_joystick.descriptor_cache import DescriptorCache
+from bt_joystick.hid_report_descriptor import Usage
+from bt_joystick.sdp_record import MinorDeviceClass
+
+# Values of all axes in the report descriptor
+AXIS_MINIMUM = -127
+AXIS_MAXIMUM = 127
+
+# Axis names usage of the axis can be derived from
+_AXIS_USAGES = {
+    'x': Usage.X, 'y': Usage.Y, 'z': Usage.Z,
+    'rx': Usage.Rx, 'ry': Usage.Ry, 'rz': Usage.Rz,
+    'slider': Usage.Slider, 'dial': Usage.Dial, 'wheel': Usage.Wheel
+}
+
+
+def _item_getter(names):
+    # itemgetter returns a single value instead of a tuple for one name
+    if len(names) == 0:
+        return lambda dictionary: ()
+    if len(names) == 1:
+        name = names[0]
+        return lambda dictionary: (dictionary[name], )
+    return itemgetter(*names)
+
+
+class Axis:
+    """
+    Axis as the joystick implementation reads it. Values between minimum and maximum are scaled
+    to the report's -127..127 range. With the default range values are sent as they are - except
+    values above 127, which are taken as unsigned bytes (200 is sent as -56).
+    """
+    def __init__(self, name, minimum=AXIS_MINIMUM, maximum=AXIS_MAXIMUM, usage=None):
+        """
+        Constructor
+        :param name: name of the axis in dictionary returned by Joystick.readAxis
+        :param minimum: value the joystick returns at one end of the axis
+        :param maximum: value the joystick returns at the other end of the axis
+        :param usage: Usage of the axis in the report descriptor; derived from the name if not supplied ('x' -> Usage.X, 'rx' -> Usage.Rx, ...)
+        """
+        if usage is None:
+            if name not in _AXIS_USAGES:
+                raise ValueError("Usage of axis '" + name + "' can't be derived from its name; it must be supplied")
+            usage = _AXIS_USAGES[name]
+        if minimum == maximum:
+            raise ValueError("Axis '" + name + "' minimum and maximum must differ")
+
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.usage = usage
+
+    def is_native(self):
+        return self.minimum == AXIS_MINIMUM and self.maximum == AXIS_MAXIMUM
+
+    def scale(self):
+        """
+        :return: (factor, offset) so that int(value * factor + offset) is the report value
+        """
+        factor = (AXIS_MAXIMUM - AXIS_MINIMUM) / (self.maximum - self.minimum)
+        return factor, AXIS_MINIMUM - self.minimum * factor
+
+    def __repr__(self):
+        return "Axis('{}', {}, {})".format(self.name, self.minimum, self.maximum)
+
+
+class JoystickDescription:
+    """
+    Describes controller: its axes (in order they are sent), buttons (in order of bits they are sent as) and
+    optional hat switch, as well as what kind of device it is advertised as.
+    """
+    def __init__(self, axes, buttons, hat_switch=None, button_number=None,
+                 kind=Usage.Gamepad, subclass=MinorDeviceClass.Gamepad,
+                 service_name="A Virtual Gamepad Controller", service_description="Keyboard > BT Gamepad", provider_name="GCC"):
+        """
+        Constructor
+        :param axes: list of Axis objects or axis names (with default range)
+        :param buttons: list of button names in dictionary returned by Joystick.readButtons; first one is sent as button 1
+        :param hat_switch: name of hat switch value in dictionary returned by Joystick.readAxis (1..8 for top, top right, ..., top left, 9 for the middle)
+        :param button_number: number of buttons in the report; number of named buttons if not supplied
+        :param kind: Usage.Gamepad or Usage.Joystick
+        :param subclass: MinorDeviceClass advertised in SDP record
+        :param service_name: service name in SDP record
+        :param service_description: service description in SDP record
+        :param provider_name: provider name in SDP record
+        """
+        self.axes = tuple(axis if isinstance(axis, Axis) else Axis(axis) for axis in axes)
+        self.buttons = tuple(buttons)
+        self.hat_switch = hat_switch
+        self.button_number = button_number if button_number is not None else len(self.buttons)
+        self.kind = kind
+        self.subclass = subclass
+        self.service_name = service_name
+        self.service_description = service_description
+        self.provider_name = provider_name
+
+        if len(self.buttons) > self.button_number:
+            raise ValueError("Description has " + str(len(self.buttons)) + " buttons but only " + str(self.button_number) + " are in the report")
+        names = [axis.name for axis in self.axes] + list(self.buttons) + ([hat_switch] if hat_switch is not None else [])
+        if len(set(names)) != len(names):
+            raise ValueError("Axis, button and hat switch names must be unique but got " + str(names))
+
+        self._mapping = None
+
+    def descriptor_parameters(self):
+        """
+        :return: keyword arguments for hid_report_descriptor.create_joystick_report_descriptor
+        """
+        return {
+            "kind": self.kind,
+            "axes": tuple(axis.usage for axis in self.axes),
+            "hat_switch": self.hat_switch is not None,
+            "button_number": self.button_number
+        }
+
+    def hid_descriptor(self):
+        return hid_report_descriptor.create_joystick_report_descriptor(**self.descriptor_parameters())
+
+    def service_record(self, hid_descriptor=None, reconnect_initiate=False):
+        """
+        :param hid_descriptor: descriptor to put in the record; hid_descriptor() if not supplied
+        :param reconnect_initiate: should the record say the device initiates reconnection
+        :return: SDPRecord
+        """
+        return sdp_record.create_simple_HID_SDP_Report(self.service_name, self.service_description, self.provider_name,
+                                                       hid_descriptor if hid_descriptor is not None else self.hid_descriptor(),
+                                                       subclass=self.subclass, reconnect_reinitiate=reconnect_initiate)
+
+    def configuration(self, reconnect_initiate=False, cache=None):
+        """
+        Descriptor, its layout and SDP record through descriptor cache - generated only on the first start
+        :param reconnect_initiate: should the record say the device initiates reconnection
+        :param cache: DescriptorCache; one in default cache directory if not supplied
+        :return: CachedConfiguration
+        """
+        if cache is None:
+            cache = DescriptorCache()
+        return cache.joystick_configuration(service_name=self.service_name, service_description=self.service_description,
+                                            provider_name=self.provider_name, subclass=self.subclass,
+                                            reconnect_initiate=reconnect_initiate, **self.descriptor_parameters())
+
+    def mapping(self):
+        """
+        :return: JoystickMapping for this description (built only once)
+        """
+        if self._mapping is None:
+            self._mapping = JoystickMapping(self)
+        return self._mapping
+
+    def __repr__(self):
+        return "JoystickDescription(axes={}, buttons={}, hat_switch={}, button_number={})".format(list(self.axes), list(self.buttons), self.hat_switch, self.button_number)
+
+
+class JoystickMapping:
+    """
+    Tables built from JoystickDescription that turn joystick readings to report values.
+
+    Values are axis values in order of the description's axes followed by the hat switch value (if any) -
+    hat switch is change detected as one more axis, without deadband and hysteresis.
+    """
+    def __init__(self, description):
+        self.description = description
+        self.axis_names = tuple(axis.name for axis in description.axes)
+        self.axis_count = len(self.axis_names)
+        self.value_names = self.axis_names + ((description.hat_switch, ) if description.hat_switch is not None else ())
+        self.value_count = len(self.value_names)
+        self.has_hat_switch = description.hat_switch is not None
+
+        # name -> bit of button / index of value, for anyone that needs to look up single entries
+        self.button_bit = {name: 1 << i for i, name in enumerate(description.buttons)}
+        self.value_index = {name: i for i, name in enumerate(self.value_names)}
+
+        # tables read_values and button_bits apply in one pass: all entries are fetched from the dictionary with one itemgetter call;
+        # native axes are taken as signed bytes, scaled axes are scaled with their factor and offset and clamped
+        native_axes = [(i, axis) for i, axis in enumerate(description.axes) if axis.is_native()]
+        scaled_axes = [(i, axis) for i, axis in enumerate(description.axes) if not axis.is_native()]
+        self._native_indices = tuple(i for i, _ in native_axes)
+        self._read_native = _item_getter([axis.name for _, axis in native_axes])
+        self._scaled_indices = tuple(i for i, _ in scaled_axes)
+        self._read_scaled = _item_getter([axis.name for _, axis in scaled_axes])
+        self._factors = tuple(axis.scale()[0] for _, axis in scaled_axes)
+        self._offsets = tuple(axis.scale()[1] for _, axis in scaled_axes)
+        self._hat_switch = description.hat_switch
+        self._bits = tuple(1 << i for i in range(len(description.buttons)))
+        self._read_buttons = _item_getter(description.buttons)
+
+    def read_values(self, joystick_axis, values):
+        """
+        Converts dictionary of axis (and hat switch) name to value returned by Joystick.readAxis to report values
+        :param joystick_axis: dictionary returned by Joystick.readAxis
+        :param values: list of value_count values the report values are stored in
+        :return: values
+        """
+        for i, value in zip(self._native_indices, self._read_native(joystick_axis)):
+            values[i] = ((value + 128) & 0xff) - 128
+        if self._scaled_indices:
+            for i, value, factor, offset in zip(self._scaled_indices, self._read_scaled(joystick_axis), self._factors, self._offsets):
+                value = int(value * factor + offset)
+                values[i] = AXIS_MINIMUM if value < AXIS_MINIMUM else AXIS_MAXIMUM if value > AXIS_MAXIMUM else value
+        if self._hat_switch is not None:
+            values[self.axis_count] = joystick_axis[self._hat_switch]
+        return values
+
+    def button_bits(self, joystick_buttons):
+        """
+        Converts dictionary of button name to state returned by Joystick.readButtons to button bitmap
+        """
+        return sum(compress(self._bits, self._read_buttons(joystick_buttons)))
+
+    def per_value(self, setting, hat_switch_setting=0):
+        """
+        Expands ChangeDetector setting given for axes (single value or one per axis) to all values
+        """
+        values = per_axis(setting, self.axis_count)
+        if self.has_hat_switch:
+            values.append(hat_switch_setting)
+        return values
+
+    def bit_remapper(self, source_buttons):
+        """
+        Compiles BitRemapper for joysticks that read all buttons at once as a bitmap
+        :param source_buttons: button names in order of the joystick's bitmap bits
+        """
+        return BitRemapper(source_buttons, self.button_bit)
+
+    def create_state(self):
+        """
+        :return: JoystickState with room for this mapping's axes and hat switch
+        """
+        return JoystickState(self.axis_count, 1 if self.has_hat_switch else 0)
+
+    def set_values(self, encoder, values):
+        """
+        Sets axis and hat switch values to ReportEncoder
+        """
+        encoder.set_axes(values)  # surplus hat switch value is ignored by set_axes
+        if self.has_hat_switch:
+            encoder.set_hat_switch(values[self.axis_count])
+
+
+class JoystickState:
+    """
+    Joystick state drivers fill in place on every read, without allocating anything:
+    signed axis values (-127..127, in order of the description's axes), button bitmap (bit 0 is the first button
+    of the description) and hat switch values.
+
+    Axes and hat switches are views of one array('h') of values, which is what change detection is given.
+    """
+    __slots__ = ("values", "axes", "hat_switches", "button_bits")
+
+    def __init__(self, axis_count, hat_switch_count=0):
+        self.values = array("h", [0] * (axis_count + hat_switch_count))
+        view = memoryview(self.values)
+        self.axes = view[:axis_count]
+        self.hat_switches = view[axis_count:]
+        self.button_bits = 0
+
+    def __repr__(self):
+        return "JoystickState(axes={}, hat_switches={}, button_bits=0x{:x})".format(self.axes.tolist(), self.hat_switches.tolist(), self.button_bits)
+
+
+class BitRemapper:
+    """
+    Maps button bitmap in a joystick's own bit order to report bit order with one table lookup per byte.
+    Source buttons that are not in the description are dropped.
+    """
+    def __init__(self, source_buttons, button_bit):
+        self.source_buttons = tuple(source_buttons)
+        self.identity = all(button_bit.get(name) == 1 << i for i, name in enumerate(self.source_buttons))
+
+        self._tables = []
+        for first in range(0, len(self.source_buttons), 8):
+            bits = [button_bit.get(name, 0) for name in self.source_buttons[first:first + 8]]
+            self._tables.append(tuple(sum(compress(bits, ((byte >> i) & 1 for i in range(len(bits))))) for byte in range(256)))
+
+    def remap(self, source_bits):
+        if self.identity:
+            return source_bits
+        result = 0
+        for table in self._tables:
+            result |= table[source_bits & 0xff]
+            source_bits >>= 8
+        return result
+
+
+# Buttons and axes joystick implementations have been read by before descriptions existed
+DEFAULT_JOYSTICK_DESCRIPTION = JoystickDescription(
+    axes=('x', 'y', 'rx', 'ry'),
+    buttons=('dpad_up', 'dpad_down', 'dpad_left', 'dpad_right', 'trigger', 'tl', 'tr', 'thumb', 'thumbl', 'thumbr'),
+    button_number=14)
@@ -7,108 +7,243 @@
 #
 
 
+import threading
 import time
 
-from dbus.mainloop.glib import DBusGMainLoop
-from bt_joystick import BTDevice
+from bt_joystick.change_detector import ChangeDetector
+from bt_joystick.hidp import HIDPControlHandler
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
+from bt_joystick.report_sender import CoalescingReportSender
+from bt_joystick.stats import PipelineStats
+from bt_joystick.scheduler import FixedRateScheduler
 
 # if not os.geteuid() == 0:
 #     sys.exit("Only root can run this script")
 
 
-class Joystick:
+# Joystick button names in order of bits they are sent as when joystick has no description
+JOYSTICK_BUTTONS = DEFAULT_JOYSTICK_DESCRIPTION.buttons
 
-    def __init__(self):
-        pass
 
-    def readAxis(self):
-        raise NotImplementedError()
+def joystick_button_bits(joystick_buttons):
+    """
+    Converts dictionary of button name to state returned by Joystick.readButtons to button bitmap
+    """
+    return DEFAULT_JOYSTICK_DESCRIPTION.mapping().button_bits(joystick_buttons)
 
-    def readButtons(self):
-        raise NotImplementedError()
 
-    # TODO Add way for Joystick implementation to pass 'description' to Main class
-    # so it can create appropriate SDP record and handle results
+def signed_axis(value):
+    # axis values are compared as signed; joystick implementations may return them as unsigned bytes
+    return value - 256 if value > 127 else value
 
 
-class BluetoothJoystickDeviceMain:
-    def __init__(self, joystick):
-        self.joystick = joystick
-
-    def run(self):
-        DBusGMainLoop(set_as_default=True)
+class Joystick:
+    # Optional threading.Event implementation can set (for instance on a button press) to have it read before next tick
+    wake_event = None
 
-        bt = BTDevice()
+    # Optional JoystickDescription of axes, buttons and hat switch the implementation reads;
+    # DEFAULT_JOYSTICK_DESCRIPTION if not set
+    description = None
 
-        while True:
-            re_start = False
+    # Optional button names in order of bits returned by readButtonBits(), if implementation has that method;
+    # buttons are then read as one bitmap instead of a dictionary
+    button_bit_names = None
 
-            print("Waiting for connections")
-            bt.listen()
+    # Implementations can, instead of readAxis and readButtons, define readState(state) filling
+    # JoystickState (created from the description's mapping) in place - nothing is allocated on each read then
 
-            button_bits_1 = 0
-            button_bits_2 = 0
+    def __init__(self):
+        pass
 
-            axis = [0, 0, 0, 0]
-            new_axis = [0, 0, 0, 0]
+    def readAxis(self):
+        raise NotImplementedError()
 
-            while not re_start:
-                time.sleep(0.1)
+    def readButtons(self):
+        raise NotImplementedError()
 
-                joystick_axis = self.joystick.readAxis()
-                joystick_buttons = self.joystick.readButtons()
 
-                new_axis[0] = joystick_axis['x']
-                new_axis[1] = joystick_axis['y']
-                new_axis[2] = joystick_axis['rx']
-                new_axis[3] = joystick_axis['ry']
+def joystick_description(joystick):
+    description = getattr(joystick, 'description', None)
+    return description if description is not None else DEFAULT_JOYSTICK_DESCRIPTION
 
-                new_button_bits_1 = 0
-                new_button_bits_2 = 0
 
-                # TODO this should really use Joystick description to determine which buttons are sent as which
-                # 'trigger', 'tl', 'tr', 'thumb', 'dpad_up', 'dpad_down', 'dpad_left', 'dpad_right', 'thumbl', 'thumbr'
-                if joystick_buttons['dpad_up']:
-                    new_button_bits_1 |= 1
-                if joystick_buttons['dpad_down']:
-                    new_button_bits_1 |= 2
-                if joystick_buttons['dpad_left']:
-                    new_button_bits_1 |= 4
-                if joystick_buttons['dpad_right']:
-                    new_button_bits_1 |= 8
+class DictJoystickAdapter:
+    """
+    Reads joystick that returns dictionaries from readAxis and readButtons (or a bitmap from readButtonBits)
+    into JoystickState, for joysticks that don't implement readState themselves.
+    """
+    def __init__(self, joystick, mapping):
+        self.read_axis = joystick.readAxis
+        self.read_values = mapping.read_values
 
-                if joystick_buttons['trigger']:
-                    new_button_bits_1 |= 16
-                if joystick_buttons['tl']:
-                    new_button_bits_1 |= 32
-                if joystick_buttons['tr']:
-                    new_button_bits_1 |= 64
-                if joystick_buttons['thumb']:
-                    new_button_bits_1 |= 128
+        read_button_bits = getattr(joystick, 'readButtonBits', None)
+        button_bit_names = getattr(joystick, 'button_bit_names', None)
+        if read_button_bits is not None and button_bit_names is not None:
+            remap = mapping.bit_remapper(button_bit_names).remap
+            self.read_button_bits = lambda: remap(read_button_bits())
+        else:
+            button_bits = mapping.button_bits
+            read_buttons = joystick.readButtons
+            self.read_button_bits = lambda: button_bits(read_buttons())
 
-                if joystick_buttons['thumbl']:
-                    new_button_bits_2 |= 1
-                if joystick_buttons['thumbr']:
-                    new_button_bits_2 |= 2
+    def readState(self, state):
+        self.read_values(self.read_axis(), state.values)
+        state.button_bits = self.read_button_bits()
 
-                has_changes = False
 
-                for i in range(0, 4):
-                    if axis[i] != new_axis[i]:
-                        axis[i] = new_axis[i]
-                        has_changes = True
+def state_reader(joystick, mapping):
+    """
+    Returns function filling JoystickState from the joystick - its own readState or one through DictJoystickAdapter
+    """
+    read_state = getattr(joystick, 'readState', None)
+    if read_state is not None:
+        return read_state
+    return DictJoystickAdapter(joystick, mapping).readState
 
-                if button_bits_1 != new_button_bits_1 or button_bits_2 != new_button_bits_2:
-                    button_bits_1 = new_button_bits_1
-                    button_bits_2 = new_button_bits_2
-                    has_changes = True
 
-                if has_changes:
-                    data = bytes((0xA1, 0x01, button_bits_1, button_bits_2, axis[0], axis[1], axis[2], axis[3]))
+class BluetoothJoystickDeviceMain:
+    LISTEN_TIMEOUT = 0.5
+
+    def __init__(self, joystick, rate=60, deadband=2, hysteresis=1, min_interval=0.0, device=None, reconnect_timeout=1.0, recorder=None):
+        """
+        Constructor
+        :param joystick: Joystick implementation to read axes and buttons from; its description defines the reports sent
+        :param rate: how many times a second joystick is read (and report sent if anything changed)
+        :param deadband: axis change ignored when the axis is at rest (single value or one per axis) - see ChangeDetector
+        :param hysteresis: axis change ignored when the axis is moving (single value or one per axis)
+        :param min_interval: minimum time between reports caused only by axis changes
+        :param device: HIDDevice to send reports through; if not supplied BTDevice is created when run
+        :param reconnect_timeout: how long to try reconnecting to the host after link is lost before waiting
+                                  for the host to connect again; 0 to only wait for the host
+        :param recorder: ReportRecorder every sent report is recorded to (given to the device); device's recorder if not supplied; closed when run() returns
+        """
+        self.joystick = joystick
+        self.description = joystick_description(joystick)
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.min_interval = min_interval
+        self.change_detector = None
+        self.device = device
+        self.reconnect_timeout = reconnect_timeout
+        self.recorder = recorder
+        self.running = False
+        self.scheduler = FixedRateScheduler(rate)
+        self.scheduler.wake_event = getattr(joystick, 'wake_event', None)
+
+    def stop(self):
+        self.running = False
 
-                    # print("Changing data " + str(["{:02x}".format(d) for d in data]))
+    def run(self):
+        if self.device is None:
+            from dbus.mainloop.glib import DBusGMainLoop
+            from bt_joystick.bt_device import BTDevice
+
+            DBusGMainLoop(set_as_default=True)
+            self.device = BTDevice(description=self.description, reconnect_initiate=self.reconnect_timeout > 0, recorder=self.recorder)
+        elif self.recorder is not None:
+            self.device.recorder = self.recorder
+
+        bt = self.device
+        self.running = True
+
+        # D-Bus methods of the device (GetStats, ...) are served from their own thread while reports are sent from this one
+        start_dbus_dispatch = getattr(bt, 'start_dbus_dispatch', None)
+        if start_dbus_dispatch is not None:
+            start_dbus_dispatch()
+
+        mapping = self.description.mapping()
+        read_state = state_reader(self.joystick, mapping)
+        state = mapping.create_state()
+
+        stats = bt.stats
+        if threading.current_thread() is threading.main_thread():
+            stats.install_signal_handler()
+        connected_before = False
+        link_lost = False
+
+        try:
+            while self.running:
+                re_start = False
+
+                reconnected = link_lost and self.reconnect_timeout > 0 and bt.reconnect(self.reconnect_timeout)
+                link_lost = False
+                if not reconnected:
+                    print("Waiting for connections")
+                    # listening with timeout so stop() is noticed while no host is connected
+                    while self.running and not bt.listen(timeout=self.LISTEN_TIMEOUT):
+                        pass
+                    if not self.running:
+                        break
+
+                if connected_before:
+                    stats.increment(PipelineStats.RECONNECTS)
+                connected_before = True
+
+                encoder = bt.report_encoder
+
+                control_handler = HIDPControlHandler(encoder)
+                control_thread = threading.Thread(target=bt.serve_control, args=(control_handler, ), daemon=True)
+                control_thread.start()
+
+                sender = CoalescingReportSender(bt.cinterrupt, stats=stats, recorder=bt.recorder)
+                report_id = encoder.layout.report_id
+
+                if reconnected:
+                    # reports were lost while the link was down - joystick is read again and its state sent straight away
+                    read_state(state)
+                    self.change_detector.reset(state.values, state.button_bits)
+                    encoder.set_buttons(self.change_detector.button_bits)
+                    mapping.set_values(encoder, self.change_detector.axis)
                     try:
-                        bt.send_message(data)
-                    except Exception as e:
+                        sender.submit(encoder.encode(), report_id)
+                    except OSError as e:
                         print("Failed to send data - disconnected " + str(e))
+                        stats.increment(PipelineStats.SEND_ERRORS)
+                        re_start = link_lost = True
+                else:
+                    self.change_detector = ChangeDetector(mapping.value_count,
+                                                          deadband=mapping.per_value(self.deadband),
+                                                          hysteresis=mapping.per_value(self.hysteresis),
+                                                          min_interval=self.min_interval, stats=stats)
+
+                self.scheduler.start()
+
+                while not re_start and self.running:
+                    self.scheduler.wait()
+
+                    read_started = time.monotonic()
+                    read_state(state)
+                    read_finished = time.monotonic()
+                    stats.record(PipelineStats.READ, read_finished - read_started)
+
+                    if control_handler.unplugged:
+                        print("Host unplugged virtual cable")
                         re_start = True
+                    elif not control_handler.suspended and self.change_detector.update(state.values, state.button_bits):
+                        encoder.set_buttons(self.change_detector.button_bits)
+                        mapping.set_values(encoder, self.change_detector.axis)
+                        report = encoder.encode()
+                        stats.record(PipelineStats.ENCODE, time.monotonic() - read_finished)
+
+                        # print("Changing data " + str(["{:02x}".format(d) for d in encoder.report]))
+                        try:
+                            sender.submit(report, report_id)
+                        except Exception as e:
+                            print("Failed to send data - disconnected " + str(e))
+                            print("Scheduler stats " + str(self.scheduler.stats()) + ", stats " + stats.json())
+                            stats.increment(PipelineStats.SEND_ERRORS)
+                            re_start = link_lost = True
+                    elif sender.pending:
+                        try:
+                            sender.flush()
+                        except Exception as e:
+                            print("Failed to send data - disconnected " + str(e))
+                            stats.increment(PipelineStats.SEND_ERRORS)
+                            re_start = link_lost = True
+
+        finally:
+            # recorded reports are written and the recording closed however the loop ends
+            if bt.recorder is not None:
+                bt.recorder.close()
+            if start_dbus_dispatch is not None:
+                bt.stop_dbus_dispatch()
@@ -0,0 +1,269 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import asyncio
+import json
+import re
+import signal
+import time
+
+from bt_joystick.async_bt_device import AsyncBTDevice
+from bt_joystick.change_detector import ChangeDetector
+from bt_joystick.hid_report import ReportEncoder
+from bt_joystick.hidp import HIDPControlHandler
+from bt_joystick.main import joystick_description, state_reader
+from bt_joystick.report_sender import CoalescingReportSender
+from bt_joystick.scheduler import FixedRateScheduler
+from bt_joystick.stats import PipelineStats
+from bt_joystick.transport import L2CAPTransport
+
+
+class VirtualDevice:
+    """
+    One logical controller served by MultiDeviceMain: joystick it reads, transport its host connects over
+    and descriptor its reports are encoded with. Each virtual device has its own scheduler, change detector and stats.
+
+    Axes and buttons are read from the joystick as its description defines, so devices with different
+    descriptions can be served side by side.
+
+    Over L2CAPTransport each device registers its own BlueZ profile with its SDP record while it runs.
+    """
+    PROFILE_DBUS_PATH = "/bluez/gcc/gcc_joy_profile_"  # followed by device name
+
+    def __init__(self, name, joystick, transport, hid_descriptor=None, rate=60, deadband=2, hysteresis=1, min_interval=0.0, recorder=None,
+                 service_record=None):
+        """
+        Constructor
+        :param name: name device's stats are reported under
+        :param joystick: Joystick implementation to read axes and buttons from
+        :param transport: Transport host connects over - for instance L2CAPTransport with adapter address
+        :param hid_descriptor: USBHIDReportDescriptor reports are encoded with (must have axes of joystick's description);
+                               created from joystick's description if not supplied
+        :param rate: how many times a second joystick is read (and report sent if anything changed)
+        :param deadband: see ChangeDetector
+        :param hysteresis: see ChangeDetector
+        :param min_interval: see ChangeDetector
+        :param recorder: ReportRecorder sent reports are recorded to; nothing recorded if None
+        :param service_record: SDPRecord registered for L2CAPTransport; created from joystick's description and hid_descriptor if not supplied
+        """
+        self.description = joystick_description(joystick)
+        if hid_descriptor is None:
+            hid_descriptor = self.description.hid_descriptor()
+
+        self.name = name
+        self.joystick = joystick
+        self.transport = transport
+        self.hid_descriptor = hid_descriptor
+        self.report_encoder = ReportEncoder(hid_descriptor)
+        self.report_layout = self.report_encoder.layout
+
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.min_interval = min_interval
+        self.recorder = recorder
+        self.service_record = service_record
+        self.profile_path = VirtualDevice.PROFILE_DBUS_PATH + re.sub("[^A-Za-z0-9_]", "_", name)
+
+        self.scheduler = FixedRateScheduler(rate)
+        self.stats = PipelineStats()
+        self.change_detector = None
+
+        self.device = None
+        self.running = False
+
+    async def run(self):
+        """
+        Accepts host connections and sends reports until stopped (or cancelled)
+        """
+        profile_registered = self._register_profile()
+        self.device = AsyncBTDevice.from_transport(self.transport, self.report_encoder)
+        self.running = True
+        connected_before = False
+        try:
+            while self.running:
+                print(self.name + ": waiting for connections")
+                await self.device.listen()
+
+                if connected_before:
+                    self.stats.increment(PipelineStats.RECONNECTS)
+                connected_before = True
+
+                control_handler = HIDPControlHandler(self.report_encoder)
+                control_task = asyncio.ensure_future(self.device.serve_control(control_handler))
+                try:
+                    await self._send_reports(control_handler, control_task)
+                finally:
+                    control_task.cancel()
+                    self.device.close_connection()
+        finally:
+            self.running = False
+            self.device.close()
+            if profile_registered:
+                self._unregister_profile()
+
+    def _register_profile(self):
+        # hosts find HID devices through their SDP records - only needed for Bluetooth
+        if not isinstance(self.transport, L2CAPTransport):
+            return False
+        from bt_joystick.bt_device import register_profile
+
+        if self.service_record is None:
+            self.service_record = self.description.service_record(self.hid_descriptor)
+        register_profile(self.profile_path, self.service_record)
+        return True
+
+    def _unregister_profile(self):
+        from bt_joystick.bt_device import unregister_profile
+
+        try:
+            unregister_profile(self.profile_path)
+        except Exception as e:
+            print(self.name + ": failed to unregister profile " + str(e))
+
+    async def _send_reports(self, control_handler, control_task):
+        stats = self.stats
+        encoder = self.report_encoder
+        report_id = encoder.layout.report_id
+        sender = CoalescingReportSender(self.device.cinterrupt, stats=stats, recorder=self.recorder)
+        mapping = self.description.mapping()
+        read_state = state_reader(self.joystick, mapping)
+
+        self.change_detector = ChangeDetector(mapping.value_count,
+                                              deadband=mapping.per_value(self.deadband),
+                                              hysteresis=mapping.per_value(self.hysteresis),
+                                              min_interval=self.min_interval, stats=stats)
+        state = mapping.create_state()
+
+        self.scheduler.start()
+        while self.running:
+            await self.scheduler.wait_async()
+
+            # joystick is read in the event loop thread - implementations must not block for long
+            read_started = time.monotonic()
+            read_state(state)
+            read_finished = time.monotonic()
+            stats.record(PipelineStats.READ, read_finished - read_started)
+
+            try:
+                if control_handler.unplugged or control_task.done():
+                    print(self.name + ": host disconnected")
+                    return
+                elif not control_handler.suspended and self.change_detector.update(state.values, state.button_bits):
+                    encoder.set_buttons(self.change_detector.button_bits)
+                    mapping.set_values(encoder, self.change_detector.axis)
+                    report = encoder.encode()
+                    stats.record(PipelineStats.ENCODE, time.monotonic() - read_finished)
+                    sender.submit(report, report_id)
+                elif sender.pending:
+                    sender.flush()
+            except OSError as e:
+                print(self.name + ": failed to send data - disconnected " + str(e))
+                stats.increment(PipelineStats.SEND_ERRORS)
+                return
+
+    def stop(self):
+        self.running = False
+
+
+class MultiDeviceMain:
+    """
+    Serves several virtual devices from one thread: accepting connections, control channels,
+    pacing and sending of all devices are multiplexed in a single asyncio event loop.
+
+    Every device needs its own transport. HID control and interrupt PSMs can be bound only once per adapter,
+    so there can be only one device per adapter: L2CAPTransport of each device must have a different adapter
+    address (adapters must be configured beforehand - see BluetoothAdapter). BlueZ publishes SDP records of all
+    devices on all adapters. LoopbackTransport has no such limit and is used for testing.
+    """
+    def __init__(self, devices, loop=None):
+        """
+        Constructor
+        :param devices: list of VirtualDevice objects; names must be unique
+        :param loop: event loop run() runs in; a new event loop if not supplied
+        """
+        names = [device.name for device in devices]
+        if len(set(names)) != len(names):
+            raise ValueError("Device names must be unique but got " + str(names))
+
+        adapters = [device.transport.address for device in devices if isinstance(device.transport, L2CAPTransport)]
+        if len(adapters) > 1 and None in adapters:
+            raise ValueError("With more than one Bluetooth device, every device must have an adapter address")
+        if len(set(adapters)) != len(adapters):
+            raise ValueError("Only one device per adapter is possible but got adapters " + str(adapters))
+
+        self.devices = list(devices)
+        self.loop = loop  # loop devices are served in - set when they are
+        self._tasks = []
+        self.failures = {}  # device name -> exception device failed with in the last serve()
+
+    def run(self):
+        """
+        Runs all devices until stop() is called
+        """
+        created = self.loop is None
+        loop = asyncio.new_event_loop() if created else self.loop
+        if loop.is_running():
+            raise RuntimeError("Event loop is already running - use serve() instead")
+
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, lambda: print(self.json()))
+        except (RuntimeError, ValueError):
+            pass  # not in main thread
+
+        try:
+            loop.run_until_complete(self.serve())
+        finally:
+            if created:
+                self.loop = None
+                loop.close()
+
+    async def serve(self):
+        """
+        Runs all devices in the current event loop until stop() is called
+        """
+        self.loop = asyncio.get_running_loop()
+        self.failures = {}
+        self._tasks = [asyncio.ensure_future(self._run_device(device)) for device in self.devices]
+        try:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._tasks = []
+
+    async def _run_device(self, device):
+        # a device that fails (its transport can't be bound, for instance) doesn't stop the others
+        try:
+            await device.run()
+        except Exception as e:
+            print(device.name + ": failed " + repr(e))
+            self.failures[device.name] = e
+
+    def stop(self):
+        """
+        Stops all devices; can be called from any thread
+        """
+        loop = self.loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self._stop)
+        else:
+            self._stop()
+
+    def _stop(self):
+        for device in self.devices:
+            device.stop()
+        for task in self._tasks:
+            task.cancel()
+
+    def device(self, name):
+        for device in self.devices:
+            if device.name == name:
+                return device
+        raise KeyError(name)
+
+    def snapshot(self):
+        return {device.name: device.stats.snapshot() for device in self.devices}
+
+    def json(self):
+        return json.dumps(self.snapshot())
@@ -0,0 +1,329 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# Recording of sent reports to a file of fixed size records and replaying them - for reproducing
+# sessions and for load tests without joystick hardware.
+#
+# File starts with a header (magic, version, record size, report size) followed by records:
+# send time (monotonic seconds as double), report length and report bytes padded to the report size.
+
+import argparse
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+
+MAGIC = b"BTJR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHH")  # magic, version, record size, report size, reserved
+RECORD_HEADER = struct.Struct("<dH")  # time, report length
+
+# Reports are HIDP DATA messages - a few bytes for a gamepad
+DEFAULT_REPORT_SIZE = 32
+
+
+class ReportRecorder:
+    """
+    Appends sent reports to a recording file. Reports are packed into a batch in memory and the batch is written
+    (and fsync-ed) by a writer thread when it has sync_every records or sync_interval has passed - the send loop
+    never waits for the disk.
+
+    Recording into an existing file appends to it, so one file can hold several sessions (times are monotonic
+    clock times, so there is a gap - or even a step back - between sessions).
+    """
+    def __init__(self, path, report_size=DEFAULT_REPORT_SIZE, sync_every=64, sync_interval=1.0, clock=time.monotonic):
+        """
+        Constructor
+        :param path: recording file
+        :param report_size: maximum report size (including HIDP header); longer reports are rejected
+        :param sync_every: number of records written and synced together
+        :param sync_interval: maximum time in seconds a record waits to be written
+        :param clock: monotonic clock returning seconds
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.clock = clock
+
+        self.file = open(path, "ab")
+        try:
+            if self.file.tell() == 0:
+                self.report_size = report_size
+                self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_HEADER.size + report_size, report_size, 0))
+                self.file.flush()
+            else:
+                with open(path, "rb") as f:
+                    record_size, self.report_size = _read_header(f.read(HEADER.size), path)
+                if self.report_size != report_size:
+                    raise ValueError("Recording " + path + " has report size " + str(self.report_size) + " but " + str(report_size) + " was requested")
+                # a record only partly written when the previous recording was interrupted is dropped so records stay aligned
+                size = self.file.tell()
+                aligned = HEADER.size + (size - HEADER.size) // record_size * record_size
+                if aligned != size:
+                    self.file.truncate(aligned)
+        except BaseException:
+            self.file.close()
+            raise
+
+        self.record_size = RECORD_HEADER.size + self.report_size
+        self._batch = bytearray(self.record_size * sync_every)
+        self._zeros = memoryview(bytes(self.report_size))
+        self._batch_records = 0
+        self._batch_started = None
+        # batch is filled by record() and taken by sync() and by the writer thread when it is due
+        self._lock = threading.Lock()
+
+        self.records = 0
+        self.syncs = 0
+        self.closed = False
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_batches, daemon=True)
+        self._writer.start()
+
+    def record(self, report, timestamp=None):
+        """
+        Records a report
+        :param report: report as sent (bytes, bytearray or memoryview)
+        :param timestamp: monotonic time report was sent at; now if not supplied
+        """
+        now = self.clock()
+        if timestamp is None:
+            timestamp = now
+        if len(report) > self.report_size:
+            raise ValueError("Report of " + str(len(report)) + " bytes doesn't fit recording's report size " + str(self.report_size))
+
+        with self._lock:
+            offset = self._batch_records * self.record_size
+            length = len(report)
+            RECORD_HEADER.pack_into(self._batch, offset, timestamp, length)
+            start = offset + RECORD_HEADER.size
+            self._batch[start:start + length] = report
+            self._batch[start + length:offset + self.record_size] = self._zeros[length:]  # batch buffer is reused
+            self._batch_records += 1
+            self.records += 1
+            if self._batch_started is None:
+                self._batch_started = now
+
+            if self._batch_records >= self.sync_every or now - self._batch_started >= self.sync_interval:
+                self._submit_batch()
+
+    def _submit_batch(self):
+        # called with the lock held
+        if self._batch_records > 0:
+            self._queue.put(bytes(self._batch[:self._batch_records * self.record_size]))
+            self._batch_records = 0
+            self._batch_started = None
+
+    def _due_in(self):
+        # seconds until records waiting in the batch must be written; sync_interval if there are none
+        with self._lock:
+            if self._batch_started is None:
+                return self.sync_interval
+            due_in = self._batch_started + self.sync_interval - self.clock()
+            if due_in <= 0:
+                self._submit_batch()
+                return 0
+            return due_in
+
+    def _write_batches(self):
+        while True:
+            try:
+                # records are written after sync_interval even when no more reports are recorded
+                batch = self._queue.get(timeout=self._due_in())
+            except queue.Empty:
+                continue
+            try:
+                if batch is None:
+                    return
+                self.file.write(batch)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.syncs += 1
+            except OSError as e:
+                print("Failed to write recording " + self.path + "; " + str(e))
+            finally:
+                self._queue.task_done()
+
+    def sync(self):
+        """
+        Writes all recorded reports to the disk and waits until they are written
+        """
+        with self._lock:
+            self._submit_batch()
+        self._queue.join()
+
+    def close(self):
+        """
+        Writes all recorded reports, stops writer thread and closes the file; can be called more than once
+        """
+        if self.closed:
+            return
+        self.sync()
+        self._queue.put(None)
+        self._writer.join()
+        self.file.close()
+        self.closed = True
+
+
+def _read_header(data, path):
+    if len(data) < HEADER.size:
+        raise ValueError(path + " is not a report recording - too short")
+    magic, version, record_size, report_size, _ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(path + " is not a report recording")
+    if version != VERSION:
+        raise ValueError("Recording " + path + " has unsupported version " + str(version))
+    if record_size != RECORD_HEADER.size + report_size:
+        raise ValueError("Recording " + path + " has inconsistent record size " + str(record_size))
+    return record_size, report_size
+
+
+class ReportReplayer:
+    """
+    Reads recording through memory mapped file - reports are memoryview slices of the mapping and nothing is copied
+    (see close()).
+    A record that was only partly written (recorder stopped while writing) is ignored.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+        self.record_size, self.report_size = _read_header(self._mmap[:HEADER.size], path)
+        self._view = memoryview(self._mmap)
+        self.count = (len(self._mmap) - HEADER.size) // self.record_size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """
+        :return: (time report was sent at, report as memoryview)
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Record " + str(index) + " out of range")
+        offset = HEADER.size + index * self.record_size
+        timestamp, length = RECORD_HEADER.unpack_from(self._mmap, offset)
+        start = offset + RECORD_HEADER.size
+        return timestamp, self._view[start:start + length]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def duration(self):
+        return self[-1][0] - self[0][0] if self.count > 0 else 0.0
+
+    def replay(self, send, speed=1.0, max_gap=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Sends recorded reports again
+        :param send: function sending a report - socket's send, HIDDevice.send_message, CoalescingReportSender.submit...
+        :param speed: 1.0 for original timing, 2.0 for twice as fast, etc.; 0 or None to send as fast as possible
+        :param max_gap: longest wait between two reports in recorded seconds (to skip pauses and gaps between sessions); not limited if None
+        :param clock: monotonic clock returning seconds
+        :param sleep: function to sleep given number of seconds
+        :return: dictionary with number of sent reports, elapsed time and maximum lateness against recorded timing
+        """
+        started = clock()
+        max_lateness = 0.0
+        offset = 0.0  # recorded time skipped by max_gap and steps back in time
+        previous = None
+        for timestamp, report in self:
+            if speed:
+                if previous is not None:
+                    gap = timestamp - previous
+                    if gap < 0:
+                        offset += gap
+                    elif max_gap is not None and gap > max_gap:
+                        offset += gap - max_gap
+                else:
+                    first = timestamp
+                previous = timestamp
+
+                due = started + (timestamp - first - offset) / speed
+                remaining = due - clock()
+                if remaining > 0:
+                    sleep(remaining)
+                elif -remaining > max_lateness:
+                    max_lateness = -remaining
+            send(report)
+
+        return {
+            "sent": self.count,
+            "elapsed": clock() - started,
+            "recorded": self.duration(),
+            "max_lateness": max_lateness
+        }
+
+    def close(self):
+        """
+        Unmaps the recording. Reports are slices of the mapping, so a report still referenced keeps the file
+        mapped until it is dropped - copy reports (bytes(report)) that are kept after closing.
+        """
+        self._view.release()
+        if isinstance(self._mmap, mmap.mmap):
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # reports are still referenced - mapping is closed when the last of them is released
+
+
+def _replay_over_loopback(replayer, speed, max_gap):
+    from bt_joystick.hid_device import HIDDevice
+    from bt_joystick.hidp import HIDPControlHandler
+    from bt_joystick.simulated_host import SimulatedHost
+    from bt_joystick.transport import LoopbackTransport
+
+    transport = LoopbackTransport()
+    device = HIDDevice(transport=transport)
+    host = SimulatedHost(transport, device.report_layout)
+
+    def serve():
+        device.listen()
+        device.serve_control(HIDPControlHandler(device.report_encoder))
+
+    try:
+        threading.Thread(target=serve, daemon=True).start()
+        host.connect()
+        host.start()
+        result = replayer.replay(device.send_message, speed=speed, max_gap=max_gap)
+        deadline = time.monotonic() + 5.0
+        while len(host.reports) < result["sent"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        result["received"] = len(host.reports)
+        return result
+    finally:
+        host.close()
+        device.close()
+        transport.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shows or replays report recording")
+    parser.add_argument("recording", help="recording file")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed (default 1.0 - original timing); 0 for as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=None, help="longest pause between reports in seconds")
+    parser.add_argument("--replay", action="store_true", help="replay over loopback transport to a simulated host")
+    args = parser.parse_args(argv)
+
+    replayer = ReportReplayer(args.recording)
+    try:
+        print("{}: {} reports over {:.3f}s, report size {}".format(args.recording, len(replayer), replayer.duration(), replayer.report_size))
+        if args.replay:
+            print(_replay_over_loopback(replayer, args.speed, args.max_gap))
+    finally:
+        replayer.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
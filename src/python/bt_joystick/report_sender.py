@@ -0,0 +1,127 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import socket
+import time
+
+from bt_joystick.stats import PipelineStats
+
+
+class CoalescingReportSender:
+    """
+    Sends reports over the interrupt channel without blocking, keeping only the newest pending report per report ID.
+
+    If the socket can't take a report (host or radio is slow), the report stays pending and is replaced
+    by any newer report with the same ID - intermediate states are dropped instead of being delivered late.
+    Pending reports are retried on next submit() or flush().
+    """
+    def __init__(self, sock, clock=time.monotonic, stats=None, recorder=None):
+        """
+        Constructor
+        :param sock: connected interrupt channel socket
+        :param clock: monotonic clock returning seconds
+        :param stats: PipelineStats to record queue wait and send latencies and sent/dropped reports to
+        :param recorder: ReportRecorder to record sent reports to (dropped reports are not recorded)
+        """
+        self.sock = sock
+        self.clock = clock
+        self.stats = stats
+        self.recorder = recorder
+
+        self._pending = {}  # report id -> bytearray with the newest report not sent yet
+        self._submitted = {}  # report id -> time pending report was submitted
+        self._buffers = {}  # report id -> preallocated bytearray reused for that report id
+        self._partial = None  # remainder of a report the socket accepted only part of (stream sockets)
+        self._blocked_since = None
+
+        self.sent = 0
+        self.dropped = 0
+        self.would_block = 0
+        self.blocked_time = 0.0
+
+    def submit(self, report, report_id=0):
+        """
+        Queues report (replacing the previous pending one with the same ID) and tries to send pending reports
+        :param report: report bytes; copied so the caller can reuse its buffer
+        :param report_id: ID used to coalesce reports - only the latest report with the same ID is kept
+        :return: True if nothing is left pending
+        """
+        if report_id in self._pending:
+            self.dropped += 1
+            if self.stats is not None:
+                self.stats.increment(PipelineStats.REPORTS_DROPPED)
+        else:
+            self._submitted[report_id] = self.clock()
+
+        buffer = self._buffers.get(report_id)
+        if buffer is None or len(buffer) != len(report):
+            buffer = bytearray(report)
+            self._buffers[report_id] = buffer
+        else:
+            buffer[:] = report
+        self._pending[report_id] = buffer
+
+        return self.flush()
+
+    def flush(self):
+        """
+        Sends as much of pending reports as the socket accepts without blocking
+        :return: True if nothing is left pending
+        """
+        try:
+            if self._partial is not None:
+                sent = self.sock.send(self._partial, socket.MSG_DONTWAIT)
+                self._partial = self._partial[sent:] if sent < len(self._partial) else None
+                if self._partial is not None:
+                    return False
+                self._sent()
+
+            while len(self._pending) > 0:
+                report_id = next(iter(self._pending))
+                report = self._pending.pop(report_id)
+                started = self.clock()
+                try:
+                    sent = self.sock.send(report, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    self._pending[report_id] = report
+                    raise
+                if self.recorder is not None:
+                    self.recorder.record(report, started)
+                if self.stats is not None:
+                    now = self.clock()
+                    self.stats.record(PipelineStats.QUEUE, started - self._submitted[report_id])
+                    self.stats.record(PipelineStats.SEND, now - started)
+                if sent < len(report):
+                    self._partial = memoryview(bytes(report))[sent:]
+                    return False
+                self._sent()
+        except BlockingIOError:
+            self.would_block += 1
+            if self._blocked_since is None:
+                self._blocked_since = self.clock()
+            return False
+
+        if self._blocked_since is not None:
+            self.blocked_time += self.clock() - self._blocked_since
+            self._blocked_since = None
+        return True
+
+    def _sent(self):
+        self.sent += 1
+        if self.stats is not None:
+            self.stats.increment(PipelineStats.REPORTS_SENT)
+
+    @property
+    def pending(self):
+        return len(self._pending) > 0 or self._partial is not None
+
+    def counters(self):
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "would_block": self.would_block,
+            "blocked_time": self.blocked_time
+        }
@@ -0,0 +1,114 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import asyncio
+import time
+
+
+class FixedRateScheduler:
+    """
+    Paces a loop at a fixed rate using monotonic deadlines.
+
+    Deadlines are computed from the start time (not from when the previous tick finished), so time spent
+    in the loop body doesn't accumulate as drift. If the loop body overruns one or more periods, the missed
+    deadlines are counted and skipped instead of being run back to back to 'catch up'.
+
+    If wake_event (a threading.Event) is set, waiting returns as soon as the event is set - for instance
+    on a button press - without moving the next deadline.
+    """
+    def __init__(self, rate=60, clock=time.monotonic, sleep=time.sleep):
+        """
+        Constructor
+        :param rate: target rate in ticks per second (Hz)
+        :param clock: monotonic clock returning seconds
+        :param sleep: function to sleep given number of seconds
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive but got " + str(rate))
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.clock = clock
+        self.sleep = sleep
+        self.wake_event = None
+
+        self.next_deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.missed_deadlines = 0
+        self.max_lateness = 0.0
+        self.wakeups = 0
+
+    def start(self):
+        self.next_deadline = self.clock() + self.period
+
+    def reset_counters(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.missed_deadlines = 0
+        self.max_lateness = 0.0
+        self.wakeups = 0
+
+    def wait(self):
+        """
+        Sleeps until the next deadline.
+        :return: how late this tick is in seconds (0 if the deadline was met)
+        """
+        remaining = self._remaining()
+        wake_event = self.wake_event
+        if remaining > 0:
+            if wake_event is None:
+                self.sleep(remaining)
+            elif wake_event.wait(remaining):
+                wake_event.clear()
+                self.wakeups += 1
+                return 0.0
+        elif wake_event is not None:
+            # this tick runs straight away anyway - an event set during the overrun must not wake the next wait
+            wake_event.clear()
+        return self._tick(remaining)
+
+    async def wait_async(self):
+        """
+        Same as wait() but sleeps in the event loop, so many schedulers can pace their loops in one thread.
+        wake_event is not used here.
+        :return: how late this tick is in seconds (0 if the deadline was met)
+        """
+        remaining = self._remaining()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        return self._tick(remaining)
+
+    def _remaining(self):
+        if self.next_deadline is None:
+            self.start()
+        return self.next_deadline - self.clock()
+
+    def _tick(self, remaining):
+        if remaining >= 0:
+            lateness = 0.0
+        else:
+            lateness = -remaining
+            self.overruns += 1
+            if lateness > self.max_lateness:
+                self.max_lateness = lateness
+            missed = int(lateness / self.period)
+            if missed > 0:
+                self.missed_deadlines += missed
+                self.next_deadline += missed * self.period
+
+        self.next_deadline += self.period
+        self.ticks += 1
+        return lateness
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "missed_deadlines": self.missed_deadlines,
+            "max_lateness": self.max_lateness,
+            "wakeups": self.wakeups
+        }
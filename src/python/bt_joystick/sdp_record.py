@@ -7,6 +7,8 @@
 # Protocol Identifiers; Channel Identifiers, Protocol and Service Multiplexers (PSMs)?
 
 
+import struct
+
 from functools import reduce
 
 
@@ -160,8 +162,59 @@ class MinorDeviceClass:
 
 
 class XMLElement:
+    """
+    Element of SDP record. Elements write themselves as XML (as BlueZ expects records) and
+    as binary SDP data elements (as they are sent over the air, so record size can be checked).
+
+    XML is written into a list of strings (out) which is joined only once, after the whole record is written.
+    """
+    # SDP data element types (Bluetooth Core Specification, Vol 3, Part B, 3.2)
+    NIL = 0
+    UNSIGNED_INT = 1
+    SIGNED_INT = 2
+    UUID = 3
+    TEXT = 4
+    BOOLEAN = 5
+    SEQUENCE = 6
+    ALTERNATIVE = 7
+    URL = 8
+
+    def write_xml(self, out, indent):
+        raise NotImplementedError()
+
     def xml(self, indent, xml):
-        raise NotImplemented()
+        out = [xml]
+        self.write_xml(out, indent)
+        return "".join(out)
+
+    def data(self):
+        """
+        Content of the data element (without its header)
+        """
+        raise NotImplementedError()
+
+    def data_type(self):
+        raise NotImplementedError()
+
+    def encoded_size(self):
+        """
+        Size of the element encoded as SDP data element, including its header
+        """
+        size = len(self.data())
+        return _header_size(self.data_type(), size) + size
+
+    def encode_into(self, buffer):
+        """
+        Appends the element, encoded as SDP data element, to the bytearray
+        """
+        data = self.data()
+        _write_header(buffer, self.data_type(), len(data))
+        buffer += data
+
+    def encode(self):
+        buffer = bytearray()
+        self.encode_into(buffer)
+        return bytes(buffer)
 
     @staticmethod
     def _indent(indent):
@@ -169,16 +222,65 @@ class XMLElement:
         return "\t" * indent
 
 
+# Size indexes of fixed size data elements
+_FIXED_SIZE_INDEXES = {1: 0, 2: 1, 4: 2, 8: 3, 16: 4}
+
+# Variable sized types (text, sequence, alternative, url) always use explicit length; others must be of fixed size
+_VARIABLE_SIZE_TYPES = (XMLElement.TEXT, XMLElement.SEQUENCE, XMLElement.ALTERNATIVE, XMLElement.URL)
+
+# '&' must be replaced first. (xml.sax.saxutils is not used because it pulls in urllib and makes importing this module slow)
+_ATTRIBUTE_ENTITIES = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ("\"", "&quot;"), ("\n", "&#10;"), ("\r", "&#13;"), ("\t", "&#9;"))
+
+
+def _escape(value):
+    for character, entity in _ATTRIBUTE_ENTITIES:
+        if character in value:
+            value = value.replace(character, entity)
+    return value
+
+
+def _header_size(data_type, size):
+    if data_type == XMLElement.NIL or data_type not in _VARIABLE_SIZE_TYPES:
+        return 1
+    if size < 0x100:
+        return 2
+    if size < 0x10000:
+        return 3
+    return 5
+
+
+def _write_header(buffer, data_type, size):
+    if data_type == XMLElement.NIL:
+        buffer.append(0)
+    elif data_type not in _VARIABLE_SIZE_TYPES:
+        if size not in _FIXED_SIZE_INDEXES:
+            raise ValueError("Data element of type {} cannot have size of {} bytes".format(data_type, size))
+        buffer.append(data_type << 3 | _FIXED_SIZE_INDEXES[size])
+    elif size < 0x100:
+        buffer += struct.pack(">BB", data_type << 3 | 5, size)
+    elif size < 0x10000:
+        buffer += struct.pack(">BH", data_type << 3 | 6, size)
+    else:
+        buffer += struct.pack(">BI", data_type << 3 | 7, size)
+
+
 class Attribute(XMLElement):
     def __init__(self, id, content):
         self.id = id
         self.content = content
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<attribute id=\"0x{:04x}\">\n".format(self.id)
-        xml = self.content.xml(indent + 1, xml)
-        xml += self._indent(indent) + "</attribute>\n"
-        return xml
+    def write_xml(self, out, indent):
+        out.append("{}<attribute id=\"0x{:04x}\">\n".format(self._indent(indent), self.id))
+        self.content.write_xml(out, indent + 1)
+        out.append(self._indent(indent) + "</attribute>\n")
+
+    def encoded_size(self):
+        # attribute id (as uint16 data element) followed by its value
+        return 3 + self.content.encoded_size()
+
+    def encode_into(self, buffer):
+        buffer += struct.pack(">BH", XMLElement.UNSIGNED_INT << 3 | 1, self.id)
+        self.content.encode_into(buffer)
 
 
 class Sequence(XMLElement):
@@ -186,12 +288,23 @@ class Sequence(XMLElement):
         super(Sequence, self).__init__()
         self.list = list
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<sequence>\n"
+    def write_xml(self, out, indent):
+        out.append(self._indent(indent) + "<sequence>\n")
         for element in self.list:
-            xml = element.xml(indent + 1, xml)
-        xml += self._indent(indent) + "</sequence>\n"
-        return xml
+            element.write_xml(out, indent + 1)
+        out.append(self._indent(indent) + "</sequence>\n")
+
+    def data_type(self):
+        return XMLElement.SEQUENCE
+
+    def encoded_size(self):
+        size = sum(element.encoded_size() for element in self.list)
+        return _header_size(XMLElement.SEQUENCE, size) + size
+
+    def encode_into(self, buffer):
+        _write_header(buffer, XMLElement.SEQUENCE, sum(element.encoded_size() for element in self.list))
+        for element in self.list:
+            element.encode_into(buffer)
 
 
 class UUID(XMLElement):
@@ -199,39 +312,51 @@ class UUID(XMLElement):
         super(UUID, self).__init__()
         self.value = value
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<uuid value=\"0x{:04x}\" />\n".format(self.value)
-        return xml
+    def write_xml(self, out, indent):
+        out.append("{}<uuid value=\"0x{:04x}\" />\n".format(self._indent(indent), self.value))
 
+    def data_type(self):
+        return XMLElement.UUID
 
-class UInt8(XMLElement):
-    def __init__(self, value):
-        super(UInt8, self).__init__()
-        self.value = value
+    def data(self):
+        if self.value <= 0xFFFF:
+            return struct.pack(">H", self.value)
+        if self.value <= 0xFFFFFFFF:
+            return struct.pack(">I", self.value)
+        return self.value.to_bytes(16, "big")
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<uint8 value=\"0x{:02x}\" />\n".format(self.value)
-        return xml
 
+class _UnsignedInteger(XMLElement):
+    FORMAT = None
+    STRUCT = None
 
-class UInt16(XMLElement):
     def __init__(self, value):
-        super(UInt16, self).__init__()
+        super(_UnsignedInteger, self).__init__()
         self.value = value
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<uint16 value=\"0x{:04x}\" />\n".format(self.value)
-        return xml
+    def write_xml(self, out, indent):
+        out.append(self.FORMAT.format(self._indent(indent), self.value))
 
+    def data_type(self):
+        return XMLElement.UNSIGNED_INT
 
-class UInt32(XMLElement):
-    def __init__(self, value):
-        super(UInt32, self).__init__()
-        self.value = value
+    def data(self):
+        return struct.pack(self.STRUCT, self.value)
+
+
+class UInt8(_UnsignedInteger):
+    FORMAT = "{}<uint8 value=\"0x{:02x}\" />\n"
+    STRUCT = ">B"
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<uint16 value=\"0x{:08x}\" />\n".format(self.value)
-        return xml
+
+class UInt16(_UnsignedInteger):
+    FORMAT = "{}<uint16 value=\"0x{:04x}\" />\n"
+    STRUCT = ">H"
+
+
+class UInt32(_UnsignedInteger):
+    FORMAT = "{}<uint32 value=\"0x{:08x}\" />\n"
+    STRUCT = ">I"
 
 
 class Bool8(XMLElement):
@@ -241,9 +366,14 @@ class Bool8(XMLElement):
             raise ValueError("Expected boolean but got " + str(type(value)))
         self.value = value
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<boolean value=\"" + str(self.value).lower() + "\" />\n"
-        return xml
+    def write_xml(self, out, indent):
+        out.append(self._indent(indent) + ("<boolean value=\"true\" />\n" if self.value else "<boolean value=\"false\" />\n"))
+
+    def data_type(self):
+        return XMLElement.BOOLEAN
+
+    def data(self):
+        return b"\x01" if self.value else b"\x00"
 
 
 class Text(XMLElement):
@@ -252,12 +382,19 @@ class Text(XMLElement):
         self.value = value
         self.encoding = encoding
 
-    def xml(self, indent, xml):
+    def write_xml(self, out, indent):
         if self.encoding is None:
-            xml += self._indent(indent) + "<text value=\"" + self.value + "\" />\n"
+            out.append(self._indent(indent) + "<text value=\"" + _escape(self.value) + "\" />\n")
         else:
-            xml += self._indent(indent) + "<text encoding=\"" + self.encoding + "\" value=\"" + self.value + "\" />\n"
-        return xml
+            out.append(self._indent(indent) + "<text encoding=\"" + _escape(self.encoding) + "\" value=\"" + _escape(self.value) + "\" />\n")
+
+    def data_type(self):
+        return XMLElement.TEXT
+
+    def data(self):
+        if self.encoding == "hex":
+            return bytes.fromhex(self.value)
+        return self.value.encode("utf-8")
 
 
 class URL(XMLElement):
@@ -265,9 +402,14 @@ class URL(XMLElement):
         super(URL, self).__init__()
         self.value = value
 
-    def xml(self, indent, xml):
-        xml += self._indent(indent) + "<url value=\"" + self.value + "\" />\n"
-        return xml
+    def write_xml(self, out, indent):
+        out.append(self._indent(indent) + "<url value=\"" + _escape(self.value) + "\" />\n")
+
+    def data_type(self):
+        return XMLElement.URL
+
+    def data(self):
+        return self.value.encode("utf-8")
 
 
 # Bluetooth Core Speficication: Universal Attributes
@@ -427,6 +569,8 @@ class HIDDescriptorList(Attribute):
         super(HIDDescriptorList, self).__init__(0x0206, None)
         if (report is None and physical_descriptor is None) or (report is not None and physical_descriptor is not None):
             raise ValueError("You need to supply at least and only one of 'report' or 'physical_descriptor' parameter")
+        self.encoding = encoding
+        self.descriptor = report if report is not None else physical_descriptor  # kept so it can be parsed back with parse_report_descriptor
         if report is not None:
             self.kind = self.Report
             self.content = Sequence(Sequence(UInt8(self.kind), Text(report, encoding=encoding)))
@@ -510,26 +654,84 @@ class SDPRecord:
         HIDVirtualCable,
     ]
 
+    # Default L2CAP MTU of SDP channel - larger records need continuation over several responses
+    SDP_DEFAULT_MTU = 672
+
     def __init__(self):
-        self.attributes = []
+        self._attributes = []
+        self._sorted = True
+
+    @property
+    def attributes(self):
+        # attributes are sorted by id once, when they are needed, instead of on every addition
+        if not self._sorted:
+            self._attributes.sort(key=lambda a: a.id)
+            self._sorted = True
+        return self._attributes
 
     def __add__(self, other):
         if not isinstance(other, Attribute):
             raise ValueError("Expected attribute but got " + str(type(other)))
-        self.attributes.append(other)
-        self.attributes = sorted(self.attributes, key=lambda a: a.id)
+        if len(self._attributes) > 0 and other.id < self._attributes[-1].id:
+            self._sorted = False
+        self._attributes.append(other)
         return self
 
     def add(self, other):
         return self.__add__(other)
 
-    def xml(self):
-        xml = "<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n\n<record>\n"
+    def write_xml(self, out):
+        out.append("<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n\n<record>\n")
         for attribute in self.attributes:
-            xml = attribute.xml(1, xml)
+            attribute.write_xml(out, 1)
+        out.append("</record>\n")
+
+    def xml(self):
+        out = []
+        self.write_xml(out)
+        return "".join(out)
+
+    def encoded_size(self):
+        """
+        Size of the record encoded as SDP data element sequence of attribute id/value pairs
+        """
+        size = sum(attribute.encoded_size() for attribute in self.attributes)
+        return _header_size(XMLElement.SEQUENCE, size) + size
 
-        xml += "</record>\n"
-        return xml
+    def encode(self):
+        """
+        Encodes the record as SDP data element sequence of attribute id/value pairs
+        """
+        attributes = self.attributes
+        buffer = bytearray()
+        _write_header(buffer, XMLElement.SEQUENCE, sum(attribute.encoded_size() for attribute in attributes))
+        for attribute in attributes:
+            attribute.encode_into(buffer)
+        return bytes(buffer)
+
+    def fits(self, mtu=SDP_DEFAULT_MTU):
+        """
+        Checks if the whole record fits in one SDP response (ServiceAttributeResponse header and byte count
+        take 7 bytes, continuation state 1 byte)
+        """
+        return self.encoded_size() + 8 <= mtu
+
+
+class PrecompiledSDPRecord:
+    """
+    SDP record already serialised to XML - for instance loaded from DescriptorCache.
+    """
+    def __init__(self, xml, hid_report_descriptor=None):
+        """
+        Constructor
+        :param xml: record XML
+        :param hid_report_descriptor: report descriptor bytes the record advertises; kept in attributes so it can be parsed back
+        """
+        self._xml = xml
+        self.attributes = [HIDDescriptorList(report=hid_report_descriptor.hex().lower(), encoding="hex")] if hid_report_descriptor is not None else []
+
+    def xml(self):
+        return self._xml
 
 
 def create_simple_HID_SDP_Report(service_name, service_description, provider_name, hid_report_descriptor,
@@ -580,3 +782,4 @@ if __name__ == "__main__":
                                           subclass=MinorDeviceClass.Gamepad)
 
     print("Record=\n" + record.xml())
+    print("Encoded record is " + str(record.encoded_size()) + " bytes; " + ("fits" if record.fits() else "doesn't fit") + " default SDP MTU")
@@ -0,0 +1,156 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import socket
+import threading
+import time
+
+from bt_joystick import hidp
+from bt_joystick.hid_report import ReportDecoder
+
+
+class SimulatedHost:
+    """
+    Plays the host side of a HID connection over LoopbackTransport: connects control and interrupt channels,
+    does the HIDP handshake (SET_PROTOCOL report protocol) and timestamps and decodes incoming reports.
+    """
+    INTERRUPT_MTU = 1024
+
+    def __init__(self, transport, hid_descriptor, clock=time.monotonic):
+        """
+        Constructor
+        :param transport: LoopbackTransport device is listening on
+        :param hid_descriptor: USBHIDReportDescriptor (or ReportLayout) reports are decoded with
+        :param clock: clock arrival times are taken from
+        """
+        self.transport = transport
+        self.decoder = ReportDecoder(hid_descriptor)
+        self.clock = clock
+
+        self.control = None
+        self.interrupt = None
+
+        self.arrival_times = []
+        self.reports = []
+
+        self._thread = None
+        self._server_sockets = None
+
+    def connect(self, timeout=5.0):
+        """
+        Connects to the device (retrying until it listens) and does the handshake
+        """
+        deadline = self.clock() + timeout
+        while True:
+            try:
+                self.control, self.interrupt = self.transport.connect_host()
+                break
+            except OSError:
+                if self.clock() > deadline:
+                    raise
+                time.sleep(0.01)
+
+        self.control.settimeout(timeout)
+        reply = self.request(bytes((hidp.SET_PROTOCOL | hidp.PROTOCOL_REPORT, )))
+        if reply != hidp.handshake(hidp.SUCCESSFUL):
+            raise ConnectionError("Device refused SET_PROTOCOL: " + reply.hex())
+
+    def accept(self, timeout=5.0):
+        """
+        Waits for the device to connect control and interrupt channels to this host (device initiated reconnection).
+        Host starts listening on the first call - call it with timeout 0 before the link is dropped
+        so the device finds the host listening.
+        :return: True if device connected
+        """
+        if self._server_sockets is None:
+            self._server_sockets = self.transport.listen_host()
+        scontrol, sinterrupt = self._server_sockets
+        if timeout == 0:
+            return False
+
+        try:
+            scontrol.settimeout(timeout)
+            control, _ = scontrol.accept()
+            sinterrupt.settimeout(timeout)
+            interrupt, _ = sinterrupt.accept()
+        except socket.timeout:
+            return False
+        control.settimeout(None)
+        interrupt.settimeout(None)
+        self.control, self.interrupt = control, interrupt
+        return True
+
+    def request(self, message):
+        """
+        Sends control channel request and returns device's reply
+        """
+        self.control.send(message)
+        return self.control.recv(self.INTERRUPT_MTU)
+
+    def get_report(self):
+        """
+        Asks device for the current input report with GET_REPORT
+        :return: dictionary of field name to value
+        """
+        report_id = self.decoder.layout.report_id
+        request = bytes((hidp.GET_REPORT | hidp.REPORT_TYPE_INPUT, )) if report_id is None else bytes((hidp.GET_REPORT | hidp.REPORT_TYPE_INPUT, report_id))
+        return self.decoder.decode(self.request(request))
+
+    def receive(self, count=None):
+        """
+        Receives reports from the interrupt channel until the channel is closed or given number of reports is received
+        """
+        received = 0
+        while count is None or received < count:
+            try:
+                report = self.interrupt.recv(self.INTERRUPT_MTU)
+            except OSError:
+                break
+            if len(report) == 0:
+                break
+            self.arrival_times.append(self.clock())
+            self.reports.append(report)
+            received += 1
+        return received
+
+    def start(self):
+        """
+        Receives reports in a background thread
+        """
+        self._thread = threading.Thread(target=self.receive, daemon=True)
+        self._thread.start()
+
+    def decoded(self):
+        """
+        Decodes all received reports
+        :return: dictionary of field name to list of values - see ReportDecoder.decode_many
+        """
+        return self.decoder.decode_many(b"".join(self.reports))
+
+    def unplug(self):
+        self.control.send(bytes((hidp.HID_CONTROL | hidp.VIRTUAL_CABLE_UNPLUG, )))
+
+    def disconnect(self):
+        """
+        Closes both channels without unplugging the virtual cable - as when the link is lost
+        """
+        for s in (self.control, self.interrupt):
+            if s is not None:
+                try:
+                    s.shutdown(socket.SHUT_RDWR)  # wakes up receiving thread
+                except OSError:
+                    pass
+                s.close()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def close(self):
+        self.disconnect()
+        if self._server_sockets is not None:
+            for s in self._server_sockets:
+                s.close()
+            self._server_sockets = None
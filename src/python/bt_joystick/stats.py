@@ -0,0 +1,117 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import json
+import signal
+
+
+class LatencyHistogram:
+    """
+    Fixed memory latency histogram with power of two microsecond buckets: bucket i counts
+    latencies below 2^i us (bucket 0 is below 1us); the last bucket counts everything from about a second up.
+    """
+    BUCKETS = 22
+
+    def __init__(self):
+        self.buckets = [0] * LatencyHistogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = int(seconds * 1000000.0).bit_length()
+        if index >= LatencyHistogram.BUCKETS:
+            index = LatencyHistogram.BUCKETS - 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """
+        Returns upper bound (in seconds) of the bucket given percentile falls in
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = self.count * percent / 100.0
+        running = 0
+        for i, bucket_count in enumerate(self.buckets):
+            running += bucket_count
+            if running >= threshold:
+                return min((1 << i) / 1000000.0, self.max)
+        return self.max
+
+    def reset(self):
+        for i in range(len(self.buckets)):
+            self.buckets[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count * 1000000.0 if self.count > 0 else 0.0,
+            "p50_us": self.percentile(50) * 1000000.0,
+            "p99_us": self.percentile(99) * 1000000.0,
+            "max_us": self.max * 1000000.0,
+            "buckets": list(self.buckets)
+        }
+
+
+class PipelineStats:
+    """
+    Latency histograms for stages of the send pipeline and counters of what happened to reports.
+    """
+    READ = "read"  # reading joystick
+    ENCODE = "encode"  # change detection and encoding report
+    QUEUE = "queue"  # time report waited to be sent
+    SEND = "send"  # socket send call
+
+    STAGES = (READ, ENCODE, QUEUE, SEND)
+
+    REPORTS_SENT = "reports_sent"
+    REPORTS_SUPPRESSED = "reports_suppressed"
+    REPORTS_DROPPED = "reports_dropped"
+    SEND_ERRORS = "send_errors"
+    RECONNECTS = "reconnects"
+
+    COUNTERS = (REPORTS_SENT, REPORTS_SUPPRESSED, REPORTS_DROPPED, SEND_ERRORS, RECONNECTS)
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in PipelineStats.STAGES}
+        self.counters = {counter: 0 for counter in PipelineStats.COUNTERS}
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def increment(self, counter, by=1):
+        self.counters[counter] += by
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        for counter in self.counters:
+            self.counters[counter] = 0
+
+    def snapshot(self):
+        return {
+            "counters": dict(self.counters),
+            "latency": {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
+        }
+
+    def json(self):
+        return json.dumps(self.snapshot())
+
+    def install_signal_handler(self, signal_number=signal.SIGUSR1, output=print):
+        """
+        Dumps stats (as JSON) when process receives given signal
+        """
+        def dump(_signum, _frame):
+            output(self.json())
+
+        signal.signal(signal_number, dump)
@@ -0,0 +1,219 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import socket
+import tempfile
+
+
+def peer_address(info):
+    # accept() returns (address, psm) tuple for L2CAP but just a (usually empty) path for UNIX sockets;
+    # a host binding its UNIX sockets binds both channels in one directory of its own, which stands for its address
+    return info[0] if isinstance(info, tuple) else os.path.dirname(info)
+
+
+class ChannelPairer:
+    """
+    Pairs control and interrupt channels a device accepts, in whichever order they arrive, by peer address -
+    so hosts connecting at the same time don't get each other's channels. A channel whose pair doesn't arrive
+    in time is closed.
+    """
+    def __init__(self):
+        self._half_open = {}  # peer address -> [control socket, interrupt socket, time first channel was accepted]
+
+    def add(self, channel, sock, address, now):
+        """
+        Adds accepted channel
+        :param channel: 0 for control, 1 for interrupt channel
+        :param sock: accepted socket
+        :param address: peer address - see peer_address
+        :param now: monotonic time in seconds
+        :return: tuple of control and interrupt sockets if the peer now has both channels connected; None otherwise
+        """
+        pending = self._half_open.get(address)
+        if pending is None:
+            pending = [None, None, now]
+            self._half_open[address] = pending
+        elif pending[channel] is not None:
+            pending[channel].close()  # host opened the same channel again - older one is stale
+        pending[channel] = sock
+
+        if pending[0] is None or pending[1] is None:
+            return None
+        del self._half_open[address]
+        return pending[0], pending[1]
+
+    def expire(self, now, pair_timeout):
+        """
+        Closes channels whose pair hasn't arrived within pair_timeout
+        :return: seconds until the next half open connection expires; None if there are none
+        """
+        wait = None
+        for address, pending in list(self._half_open.items()):
+            expires = pending[2] + pair_timeout
+            if expires <= now:
+                print("Closing half open connection from " + str(address))
+                self._close(address)
+            elif wait is None or expires - now < wait:
+                wait = expires - now
+        return wait
+
+    def close(self):
+        for address in list(self._half_open):
+            self._close(address)
+
+    def _close(self, address):
+        for s in self._half_open.pop(address)[:2]:
+            if s is not None:
+                s.close()
+
+    def __len__(self):
+        return len(self._half_open)
+
+
+class Transport:
+    """
+    Provides listening sockets for HID control and interrupt channels.
+    """
+    def listen_sockets(self, backlog=1):
+        """
+        Creates, binds and starts listening on control and interrupt server sockets
+        :return: tuple of control and interrupt listening sockets
+        """
+        raise NotImplementedError()
+
+    def connect_sockets(self, address, timeout=None):
+        """
+        Connects control and then interrupt channel to the host - for device initiated reconnection
+        :param address: host address
+        :param timeout: timeout in seconds for establishing each channel; None to wait as long as it takes
+        :return: tuple of connected control and interrupt sockets
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+def _connect_pair(create_socket, control_address, interrupt_address, timeout):
+    control = create_socket()
+    interrupt = create_socket()
+    try:
+        for s, address in ((control, control_address), (interrupt, interrupt_address)):
+            s.settimeout(timeout)
+            s.connect(address)
+            s.settimeout(None)
+    except OSError:
+        control.close()
+        interrupt.close()
+        raise
+    return control, interrupt
+
+
+class L2CAPTransport(Transport):
+    """
+    Bluetooth L2CAP sockets on HID control and interrupt PSMs.
+    """
+    P_CTRL = 17  # Service port - must match port configured in SDP record
+    P_INTR = 19  # Service port - must match port configured in SDP record
+
+    def __init__(self, address=None, control_psm=P_CTRL, interrupt_psm=P_INTR):
+        """
+        Constructor
+        :param address: adapter address to bind to; None for any adapter
+        :param control_psm: control channel PSM
+        :param interrupt_psm: interrupt channel PSM
+        """
+        self.address = address
+        self.control_psm = control_psm
+        self.interrupt_psm = interrupt_psm
+
+    def listen_sockets(self, backlog=1):
+        address = self.address if self.address is not None else socket.BDADDR_ANY
+
+        scontrol = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
+        sinterrupt = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
+
+        scontrol.bind((address, self.control_psm))
+        sinterrupt.bind((address, self.interrupt_psm))
+
+        scontrol.listen(backlog)
+        sinterrupt.listen(backlog)
+
+        return scontrol, sinterrupt
+
+    def connect_sockets(self, address, timeout=None):
+        def create_socket():
+            s = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
+            if self.address is not None:
+                s.bind((self.address, 0))
+            return s
+
+        return _connect_pair(create_socket, (address, self.control_psm), (address, self.interrupt_psm), timeout)
+
+
+class LoopbackTransport(Transport):
+    """
+    UNIX sequential packet sockets (message boundaries are kept, like with L2CAP) standing in for
+    Bluetooth channels, so everything can run on any Linux box without an adapter.
+    Hosts connect with connect_host() - see SimulatedHost. For device initiated connections
+    host listens with listen_host() and device connects with connect_sockets() (address is ignored).
+    """
+    def __init__(self, directory=None):
+        """
+        Constructor
+        :param directory: directory for socket files; new temporary directory if not supplied
+        """
+        self._own_directory = directory is None
+        self.directory = directory if directory is not None else tempfile.mkdtemp(prefix="bt_joystick_")
+        self.control_path = os.path.join(self.directory, "control")
+        self.interrupt_path = os.path.join(self.directory, "interrupt")
+        self.host_control_path = os.path.join(self.directory, "host_control")
+        self.host_interrupt_path = os.path.join(self.directory, "host_interrupt")
+
+    def listen_sockets(self, backlog=1):
+        return self._listen(self.control_path, self.interrupt_path, backlog)
+
+    def listen_host(self, backlog=1):
+        """
+        Creates host's listening sockets device connects to with connect_sockets()
+        :return: tuple of control and interrupt listening sockets
+        """
+        return self._listen(self.host_control_path, self.host_interrupt_path, backlog)
+
+    @staticmethod
+    def _listen(control_path, interrupt_path, backlog):
+        sockets = []
+        for path in (control_path, interrupt_path):
+            if os.path.exists(path):
+                os.unlink(path)
+            s = LoopbackTransport._create_socket()
+            s.bind(path)
+            s.listen(backlog)
+            sockets.append(s)
+
+        return sockets[0], sockets[1]
+
+    def connect_host(self):
+        """
+        Connects control and then interrupt channel as a host would
+        :return: tuple of connected control and interrupt sockets
+        """
+        return _connect_pair(LoopbackTransport._create_socket, self.control_path, self.interrupt_path, None)
+
+    def connect_sockets(self, address, timeout=None):
+        return _connect_pair(LoopbackTransport._create_socket, self.host_control_path, self.host_interrupt_path, timeout)
+
+    @staticmethod
+    def _create_socket():
+        return socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+    def close(self):
+        for path in (self.control_path, self.interrupt_path, self.host_control_path, self.host_interrupt_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        if self._own_directory and os.path.isdir(self.directory):
+            os.rmdir(self.directory)
@@ -13,7 +13,7 @@ setup(
     author='Daniel Sendula, Pal Denes',
     author_email='bt_joystick@mail-list-of-some-kind',
     license='MIT',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests']),
     # install_requires=['evdev==1.1.2'],
     include_package_data=True,
     test_suite='nose.collector',
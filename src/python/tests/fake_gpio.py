@@ -0,0 +1,60 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# In-process stand-in for RPi.GPIO: pins are inputs with pull ups (high when not pressed) and
+# edge callbacks are called straight away, from the thread changing the level.
+
+
+class FakeGPIO:
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.mode = None
+        self.levels = {}
+        self.callbacks = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels.setdefault(pin, FakeGPIO.HIGH)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        if pin in self.callbacks:
+            raise RuntimeError("Conflicting edge detection already enabled for GPIO channel " + str(pin))
+        self.callbacks[pin] = (edge, callback)
+
+    def set_level(self, pin, level, edge=True):
+        """
+        Changes level of a pin
+        :param edge: call the edge callback; False simulates an edge the library missed
+        """
+        previous = self.levels[pin]
+        self.levels[pin] = level
+        if edge and previous != level and pin in self.callbacks:
+            detected, callback = self.callbacks[pin]
+            if detected == FakeGPIO.BOTH or detected == (FakeGPIO.RISING if level else FakeGPIO.FALLING):
+                callback(pin)
+
+    def press(self, pin):
+        self.set_level(pin, FakeGPIO.LOW)
+
+    def release(self, pin):
+        self.set_level(pin, FakeGPIO.HIGH)
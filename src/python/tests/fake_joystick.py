@@ -0,0 +1,37 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import threading
+
+from bt_joystick import Joystick
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
+
+
+class SettableJoystick(Joystick):
+    """
+    Joystick reporting whatever state tests set - axis values in order of the description's axes and button bitmap
+    """
+    def __init__(self, description=DEFAULT_JOYSTICK_DESCRIPTION):
+        super(SettableJoystick, self).__init__()
+        self.description = description
+        self.values = [0] * description.mapping().value_count
+        self.button_bits = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def set(self, values=None, button_bits=None):
+        with self.lock:
+            if values is not None:
+                self.values = list(values)
+            if button_bits is not None:
+                self.button_bits = button_bits
+
+    def readState(self, state):
+        with self.lock:
+            for i, value in enumerate(self.values):
+                state.values[i] = value
+            state.button_bits = self.button_bits
+            self.reads += 1
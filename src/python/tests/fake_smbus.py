@@ -0,0 +1,134 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+# In-process stand-in for SMBus with an ADS1015 on it, modelling conversion timing on a simulated clock:
+# I2C transactions take time, conversions take 1/data rate (times oscillator factor) and the conversion
+# register changes only when a conversion finishes. Reads return the register as it is at the end of
+# the transaction, which is the latest moment the ADC could be sampling it.
+
+
+class FakeADS1015Bus:
+    DATA_RATES = {0: 128, 1: 250, 2: 490, 3: 920, 4: 1600, 5: 2400, 6: 3300, 7: 3300}
+
+    def __init__(self, codes, oscillator=1.0, read_time=0.0005, write_time=0.0003):
+        """
+        Constructor
+        :param codes: 12 bit code each channel converts to - dictionary of channel to code or function of time returning it
+        :param oscillator: conversion time factor - 1.1 for the slowest ADC, 0.9 for the fastest one
+        :param read_time: time reading two bytes of a register takes
+        :param write_time: time writing two bytes of a register takes
+        """
+        self.codes = codes
+        self.oscillator = oscillator
+        self.read_time = read_time
+        self.write_time = write_time
+
+        self.now = 0.0
+        self.config = 0x8583  # power-up default: single shot, powered down, comparator disabled
+        self.conversion = 0
+        self.thresholds = {2: 0x8000, 3: 0x7FFF}
+        self.in_progress = None  # (channel, time conversion finishes)
+        self.conversions = []  # (channel, time conversion finished)
+        self.alert_callback = None
+        self.reads = 0
+        self.writes = 0
+
+    # clock and sleep for the code under test
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(self.now + seconds)
+
+    def _continuous(self):
+        return not self.config & 0x0100
+
+    def _channel(self):
+        return ((self.config >> 12) & 0x07) - 4  # single ended inputs only
+
+    def _conversion_time(self):
+        return self.oscillator / FakeADS1015Bus.DATA_RATES[(self.config >> 5) & 0x07]
+
+    def _start_conversion(self, at):
+        self.in_progress = (self._channel(), at + self._conversion_time())
+
+    def _alert_rdy(self):
+        return self.config & 0x0003 != 0x0003 and self.thresholds[3] & 0x8000 and not self.thresholds[2] & 0x8000
+
+    def next_conversion_end(self):
+        return self.in_progress[1] if self.in_progress is not None else None
+
+    def advance(self, to):
+        while self.in_progress is not None and self.in_progress[1] <= to:
+            channel, finished = self.in_progress
+            self.now = finished
+            code = self.codes[channel]
+            if callable(code):
+                code = code(finished)
+            self.conversion = (code & 0xFFF) << 4
+            self.conversions.append((channel, finished))
+            self.in_progress = None
+            if self._continuous():
+                self._start_conversion(finished)
+            if self.alert_callback is not None and self._alert_rdy():
+                self.alert_callback(None)
+        if to > self.now:
+            self.now = to
+
+    # SMBus
+
+    def write_i2c_block_data(self, address, register, data):
+        self.advance(self.now + self.write_time)
+        self.writes += 1
+        value = (data[0] << 8) | data[1]
+        if register == 0x01:
+            self.config = value & 0x7FFF
+            if self._continuous():
+                if self.in_progress is None:
+                    self._start_conversion(self.now)
+                # otherwise conversion in progress finishes with the previous channel
+            elif value & 0x8000 and self.in_progress is None:
+                self._start_conversion(self.now)
+        elif register in self.thresholds:
+            self.thresholds[register] = value
+
+    def read_i2c_block_data(self, address, register, length=32):
+        self.advance(self.now + self.read_time)
+        self.reads += 1
+        if register == 0x00:
+            value = self.conversion
+        elif register == 0x01:
+            value = self.config | (0x8000 if self.in_progress is None else 0)
+        else:
+            value = self.thresholds[register]
+        return [(value >> 8) & 0xFF, value & 0xFF] + [0] * (length - 2)
+
+
+class FakeReadyEvent:
+    """
+    threading.Event for ALERT/RDY edges of FakeADS1015Bus - waiting advances the bus' clock to the end of
+    conversion in progress (which calls alert callback) or by the timeout
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self.flag = False
+
+    def set(self):
+        self.flag = True
+
+    def clear(self):
+        self.flag = False
+
+    def is_set(self):
+        return self.flag
+
+    def wait(self, timeout=None):
+        if not self.flag:
+            deadline = self.bus.now + timeout
+            end = self.bus.next_conversion_end()
+            self.bus.advance(end if end is not None and end <= deadline else deadline)
+        return self.flag
@@ -0,0 +1,171 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import contextlib
+import io
+import unittest
+
+from bt_joystick.acquisition import BackgroundAcquisition
+from tests.fake_joystick import SettableJoystick
+from tests.test_scheduler import FakeClock
+
+
+class FailingJoystick(SettableJoystick):
+    def __init__(self):
+        super(FailingJoystick, self).__init__()
+        self.failures = 0
+
+    def readState(self, state):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("I2C error")
+        super(FailingJoystick, self).readState(state)
+
+
+class SwappingState:
+    # JoystickState whose values are assigned to while acquisition publishes a new sample - as if the acquisition
+    # thread swapped buffers while readState was copying
+    def __init__(self, acquisition, mapping):
+        self.acquisition = acquisition
+        self.state = mapping.create_state()
+        self.button_bits = 0
+        self.swaps = 1
+        outer = self
+
+        class Values:
+            def __setitem__(self, key, value):
+                outer.state.values[key] = value
+                if outer.swaps > 0:
+                    outer.swaps -= 1
+                    outer.acquisition.joystick.set([9, 9, 9, 9])
+                    outer.acquisition.sample()
+
+        self.values = Values()
+
+
+class TestBackgroundAcquisition(unittest.TestCase):
+    def acquisition(self, joystick=None, **kwargs):
+        self.clock = FakeClock()
+        self.joystick = joystick if joystick is not None else SettableJoystick()
+        return BackgroundAcquisition(self.joystick, clock=self.clock, sleep=self.clock.sleep, autostart=False, **kwargs)
+
+    def read(self, acquisition):
+        state = acquisition.description.mapping().create_state()
+        acquisition.readState(state)
+        return state
+
+    def samples(self, acquisition, values):
+        for value in values:
+            self.joystick.set([value, -value, value, 0])
+            self.assertTrue(acquisition.sample())
+
+    def test_no_filter(self):
+        acquisition = self.acquisition(filter=BackgroundAcquisition.FILTER_NONE)
+        self.samples(acquisition, [5, 100])
+        self.assertEqual([100, -100, 100, 0], self.read(acquisition).values.tolist())
+
+    def test_median_removes_spikes(self):
+        acquisition = self.acquisition(filter=BackgroundAcquisition.FILTER_MEDIAN, window=5)
+        self.samples(acquisition, [10, 10, 120, 10, 10])
+        self.assertEqual([10, -10, 10, 0], self.read(acquisition).values.tolist())
+        self.samples(acquisition, [50])
+        self.assertEqual(10, self.read(acquisition).values[0])
+        self.samples(acquisition, [50])  # now most of the window
+        self.assertEqual(50, self.read(acquisition).values[0])
+
+    def test_mean(self):
+        acquisition = self.acquisition(filter=BackgroundAcquisition.FILTER_MEAN, window=4)
+        self.samples(acquisition, [0])  # first sample fills the window
+        self.assertEqual(0, self.read(acquisition).values[0])
+        self.samples(acquisition, [10, 20, 30])
+        self.assertEqual([15, -15, 15, 0], self.read(acquisition).values.tolist())
+        self.samples(acquisition, [40])
+        self.assertEqual(25, self.read(acquisition).values[0])
+
+    def test_ema(self):
+        acquisition = self.acquisition(filter=BackgroundAcquisition.FILTER_EMA, ema_alpha=0.5)
+        self.samples(acquisition, [0, 100])
+        self.assertEqual([50, -50, 50, 0], self.read(acquisition).values.tolist())
+        self.samples(acquisition, [100])
+        self.assertEqual(75, self.read(acquisition).values[0])
+
+    def test_button_press_is_latched_until_read(self):
+        acquisition = self.acquisition()
+        self.joystick.set(button_bits=0b01)
+        acquisition.sample()
+        self.joystick.set(button_bits=0b10)
+        acquisition.sample()
+        self.joystick.set(button_bits=0)
+        acquisition.sample()
+        self.assertEqual(0b11, self.read(acquisition).button_bits)
+
+        # read - released buttons are reported released after the next sample
+        self.assertEqual(0b11, self.read(acquisition).button_bits)
+        acquisition.sample()
+        self.assertEqual(0, self.read(acquisition).button_bits)
+
+    def test_button_change_sets_wake_event(self):
+        acquisition = self.acquisition()
+        acquisition.sample()
+        self.assertFalse(acquisition.wake_event.is_set())
+        self.joystick.set(button_bits=0b100)
+        acquisition.sample()
+        self.assertTrue(acquisition.wake_event.is_set())
+
+    def test_read_is_retried_when_buffers_are_swapped_while_copying(self):
+        acquisition = self.acquisition(filter=BackgroundAcquisition.FILTER_NONE)
+        self.samples(acquisition, [1])
+        state = SwappingState(acquisition, acquisition.description.mapping())
+        acquisition.readState(state)
+        self.assertEqual(1, acquisition.retries)
+        self.assertEqual([9, 9, 9, 9], state.state.values.tolist())
+
+    def test_failed_reads_keep_last_state_and_are_logged_once(self):
+        joystick = FailingJoystick()
+        acquisition = self.acquisition(joystick, filter=BackgroundAcquisition.FILTER_NONE)
+        self.samples(acquisition, [7])
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            joystick.failures = 50
+            for _ in range(50):
+                self.assertFalse(acquisition.sample())
+            self.assertEqual(7, self.read(acquisition).values[0])
+            self.samples(acquisition, [8])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(2, len(lines), lines)
+        self.assertIn("I2C error", lines[0])
+        self.assertIn("recovered after 50 failed reads", lines[1])
+        self.assertEqual((50, 2, 0), (acquisition.errors, acquisition.samples, acquisition.failing))
+        self.assertEqual(8, self.read(acquisition).values[0])
+
+    def test_thread_samples_at_rate_on_injected_clock(self):
+        acquisition = self.acquisition(rate=100)
+        reads = []
+
+        def read_state(state):
+            reads.append(self.clock())
+            if len(reads) == 10:
+                acquisition.running = False
+
+        acquisition._read_state = read_state
+        acquisition.start()
+        acquisition._thread.join(5.0)
+        self.assertEqual(10, acquisition.samples)
+        self.assertEqual(10, acquisition.scheduler.ticks)
+        self.assertEqual(0, acquisition.scheduler.overruns)
+        for i, t in enumerate(reads):
+            self.assertAlmostEqual(100.0 + (i + 1) * 0.01, t)
+        acquisition.stop()
+
+    def test_read_starts_thread_only_with_autostart(self):
+        acquisition = self.acquisition()
+        self.read(acquisition)
+        self.assertFalse(acquisition.running)
+
+
+if __name__ == "__main__":
+    unittest.main()
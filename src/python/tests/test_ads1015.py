@@ -0,0 +1,122 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import sys
+import unittest
+
+from tests.fake_smbus import FakeADS1015Bus, FakeReadyEvent
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "examples"))
+
+from ads1015 import ADS1015  # noqa: E402
+
+
+CODES = {0: 100, 1: 700, 2: 1200, 3: 1650}
+CHANNELS = (2, 1, 3, 0)
+EXPECTED = [CODES[channel] for channel in CHANNELS]
+
+OSCILLATORS = (0.9, 1.0, 1.1)
+
+
+def _adc(bus, ready=False, **kwargs):
+    ready_event = FakeReadyEvent(bus) if ready else None
+    adc = ADS1015(bus, channels=CHANNELS, raw=True, ready_event=ready_event, clock=bus.clock, sleep=bus.sleep, **kwargs)
+    if ready:
+        bus.alert_callback = adc.alert_rdy_callback
+    return adc
+
+
+class TestADS1015(unittest.TestCase):
+    def check_reads(self, reads=5, **kwargs):
+        for oscillator in OSCILLATORS:
+            for ready in (False, True):
+                bus = FakeADS1015Bus(CODES, oscillator=oscillator)
+                adc = _adc(bus, ready=ready, **kwargs)
+                for i in range(reads):
+                    self.assertEqual(EXPECTED, adc.read_channels(), "oscillator {}, ready {}, read {}".format(oscillator, ready, i))
+                    bus.advance(bus.now + 0.004)  # rest of the loop
+                yield bus, adc
+
+    def test_single_shot_at_1600_is_not_pipelined(self):
+        self.assertFalse(_adc(FakeADS1015Bus(CODES)).pipelined)
+        for _ in self.check_reads():
+            pass
+
+    def test_overlapping_reads_at_1600_would_read_next_channel(self):
+        # what pipelining at this data rate does with the fastest oscillator - shows the fake models the timing
+        bus = FakeADS1015Bus(CODES, oscillator=0.9, read_time=0.0006)
+        adc = _adc(bus)
+        adc.pipelined = True
+        adc.read_channels()
+        self.assertNotEqual(EXPECTED, adc.read_channels())
+
+    def test_pipelined_at_low_data_rate(self):
+        self.assertTrue(_adc(FakeADS1015Bus(CODES), samples_per_second=490).pipelined)
+        for bus, adc in self.check_reads(samples_per_second=490):
+            self.assertTrue(adc.pipelined)
+
+    def test_pipelining_saves_time(self):
+        durations = []
+        for pipelined in (False, True):
+            bus = FakeADS1015Bus(CODES)
+            adc = _adc(bus, samples_per_second=490)
+            adc.pipelined = pipelined
+            adc.read_channels()
+            started = bus.now
+            adc.read_channels()
+            durations.append(bus.now - started)
+        self.assertLess(durations[1], durations[0] - 3 * 0.0005)
+
+    def test_continuous_multiple_channels(self):
+        for bus, adc in self.check_reads(continuous=True):
+            self.assertFalse(adc.pipelined)
+
+    def test_continuous_channel_change_skips_conversion_in_progress(self):
+        for ready in (False, True):
+            bus = FakeADS1015Bus(CODES)
+            adc = _adc(bus, continuous=True, ready=ready)
+            adc.read_channels()
+            adc._conversions_needed = 1  # result read after the first conversion is of the previous channel
+            self.assertNotEqual(EXPECTED, adc.read_channels())
+
+    def test_continuous_single_channel(self):
+        bus = FakeADS1015Bus({0: lambda t: int(t * 1000)})
+        adc = ADS1015(bus, channels=(0, ), raw=True, continuous=True, clock=bus.clock, sleep=bus.sleep)
+        first = adc.read_channels()[0]
+        bus.advance(bus.now + 0.1)
+        reads_before = bus.reads
+        second = adc.read_channels()[0]
+        self.assertEqual(reads_before + 1, bus.reads)
+        self.assertGreater(second, first + 90)
+
+    def test_missed_ready_edge_falls_back_to_timed_wait(self):
+        bus = FakeADS1015Bus(CODES)
+        adc = _adc(bus, ready=True)
+        bus.alert_callback = None  # edges never arrive
+        self.assertEqual(EXPECTED, adc.read_channels())
+
+    def test_voltages(self):
+        bus = FakeADS1015Bus(CODES)
+        adc = ADS1015(bus, channels=CHANNELS, clock=bus.clock, sleep=bus.sleep)
+        for value, code in zip(adc.read_channels(), EXPECTED):
+            self.assertAlmostEqual(code * 3.0 / 1000.0, value)
+
+    def test_samples_per_second_achieved(self):
+        bus = FakeADS1015Bus(CODES)
+        adc = _adc(bus, ready=True)
+        adc.samples_per_second_achieved()
+        for _ in range(10):
+            adc.read_channels()
+        achieved = adc.samples_per_second_achieved()
+        self.assertEqual(set(CHANNELS), set(achieved))
+        for channel in CHANNELS:
+            self.assertGreater(achieved[channel], 150)
+            self.assertLess(achieved[channel], 1600 / 4.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import asyncio
+import socket
+import unittest
+
+from bt_joystick import hidp
+from bt_joystick.async_bt_device import AsyncBTDevice
+from bt_joystick.hid_report import ReportDecoder, ReportEncoder
+from bt_joystick.hid_report_descriptor import Usage, create_joystick_report_descriptor
+from bt_joystick.hidp import HIDPControlHandler
+from bt_joystick.transport import LoopbackTransport
+
+
+DESCRIPTOR = create_joystick_report_descriptor(axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), hat_switch=True, button_number=14)
+
+
+def _socketpair():
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+
+class TestAsyncBTDevice(unittest.TestCase):
+    def setUp(self):
+        # device side of both channels is connected over socket pairs; listening sockets are not used
+        self.listening = [_socketpair() for _ in range(2)]
+        self.device = AsyncBTDevice(self.listening[0][0], self.listening[1][0], report_encoder=ReportEncoder(DESCRIPTOR))
+        self.device.ccontrol, self.host_control = _socketpair()
+        self.device.cinterrupt, self.host_interrupt = _socketpair()
+        for s in (self.device.ccontrol, self.device.cinterrupt):
+            s.setblocking(False)
+        self.host_control.settimeout(5)
+        self.host_interrupt.settimeout(5)
+        self.decoder = ReportDecoder(DESCRIPTOR)
+
+    def tearDown(self):
+        self.device.close()
+        for s in [self.host_control, self.host_interrupt, self.listening[0][1], self.listening[1][1]]:
+            s.close()
+
+    def test_send_values(self):
+        asyncio.run(self.device.send_values(0b101, [1, -2, 3, -4], 2))
+        decoded = self.decoder.decode(self.host_interrupt.recv(64))
+        self.assertEqual((1, 0, 1), (decoded["button_1"], decoded["button_2"], decoded["button_3"]))
+        self.assertEqual([1, -2, 3, -4, 2], [decoded[name] for name in ("x", "y", "rx", "ry", "hat_switch")])
+
+    def test_concurrent_send_values_send_their_own_values(self):
+        async def send_all():
+            await asyncio.gather(*[self.device.send_values(i, [i, i, i, i], 0) for i in range(20)])
+
+        asyncio.run(send_all())
+        received = sorted(self.decoder.decode(self.host_interrupt.recv(64))["x"] for _ in range(20))
+        self.assertEqual(list(range(20)), received)
+
+    def test_send_values_without_encoder(self):
+        self.device.report_encoder = None
+        with self.assertRaises(ValueError):
+            asyncio.run(self.device.send_values(0, [0, 0, 0, 0], 0))
+
+    def test_serve_control(self):
+        handler = HIDPControlHandler(self.device.report_encoder)
+
+        async def serve():
+            task = asyncio.ensure_future(self.device.serve_control(handler))
+            loop = asyncio.get_running_loop()
+            replies = []
+            for request in (bytes((hidp.SET_PROTOCOL | hidp.PROTOCOL_REPORT, )), bytes((hidp.GET_REPORT | hidp.REPORT_TYPE_INPUT, 1))):
+                await loop.sock_sendall(self.host_control, request)
+                replies.append(await loop.sock_recv(self.host_control, 64))
+            await loop.sock_sendall(self.host_control, bytes((hidp.HID_CONTROL | hidp.VIRTUAL_CABLE_UNPLUG, )))
+            await asyncio.wait_for(task, 5)
+            return replies
+
+        self.host_control.setblocking(False)
+        replies = asyncio.run(serve())
+        self.assertEqual(hidp.handshake(hidp.SUCCESSFUL), replies[0])
+        self.assertEqual(9, self.decoder.decode(replies[1])["hat_switch"])
+        self.assertTrue(handler.unplugged)
+        self.assertIsNone(self.device.ccontrol)
+
+    def test_receive_control_returns_none_when_host_closes(self):
+        self.host_control.close()
+        self.assertIsNone(asyncio.run(self.device.receive_control()))
+
+
+class TestAsyncBTDeviceListen(unittest.TestCase):
+    def test_listen_over_loopback(self):
+        transport = LoopbackTransport()
+        device = AsyncBTDevice.from_transport(transport, ReportEncoder(DESCRIPTOR))
+
+        async def connect():
+            listen = asyncio.ensure_future(device.listen())
+            loop = asyncio.get_running_loop()
+            control, interrupt = await loop.run_in_executor(None, transport.connect_host)
+            await asyncio.wait_for(listen, 5)
+            await device.send(b"\xa1\x01")
+            interrupt.settimeout(5)
+            data = interrupt.recv(64)
+            control.close()
+            interrupt.close()
+            return data
+
+        try:
+            self.assertEqual(b"\xa1\x01", asyncio.run(connect()))
+        finally:
+            device.close()
+            transport.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import subprocess
+import unittest
+
+try:
+    import dbus
+    import dbusmock
+    from dbus.mainloop.glib import DBusGMainLoop
+except ImportError:
+    dbusmock = None
+
+
+@unittest.skipIf(dbusmock is None, "dbus-python, PyGObject and python-dbusmock are needed")
+class TestBluetoothAdapter(dbusmock.DBusTestCase if dbusmock is not None else unittest.TestCase):
+    """
+    BluetoothAdapter against dbusmock's BlueZ template - it emits PropertiesChanged when a property is set
+    """
+    @classmethod
+    def setUpClass(cls):
+        DBusGMainLoop(set_as_default=True)
+        cls.start_system_bus()
+        cls.bus = cls.get_dbus(system_bus=True)
+
+    def setUp(self):
+        self.bluez, self.bluez_mock = self.spawn_server_template("bluez5", {}, stdout=subprocess.PIPE)
+        self.bluez_mock.AddAdapter("hci0", "test-computer")
+        self.bluez_mock.AddAdapter("hci1", "other-computer")
+
+        from bt_joystick.bt_adapter import BluetoothAdapter
+
+        self.adapter = BluetoothAdapter(bus=self.bus, adapter="hci0")
+
+    def tearDown(self):
+        self.bluez.terminate()
+        self.bluez.wait()
+
+    def test_finds_adapter_by_name_and_address(self):
+        from bt_joystick.bt_adapter import find_adapter
+
+        self.assertEqual("hci0", self.adapter.name)
+        self.assertEqual("/org/bluez/hci0", find_adapter(self.bus, self.adapter.address))
+        self.assertEqual("/org/bluez/hci1", find_adapter(self.bus, "hci1"))
+        with self.assertRaises(ValueError):
+            find_adapter(self.bus, "hci7")
+
+    def test_set_waits_for_properties_changed(self):
+        self.adapter.set("Alias", dbus.String("gcc-bt-joystick"), timeout=5.0)
+        self.assertEqual("gcc-bt-joystick", str(self.adapter.get("Alias")))
+
+        self.adapter.set("Discoverable", dbus.Boolean(True), timeout=5.0)
+        self.assertTrue(bool(self.adapter.get("Discoverable")))
+
+    def test_set_to_current_value_does_not_wait(self):
+        alias = self.adapter.get("Alias")
+        self.adapter.set("Alias", alias, timeout=0.001)
+
+    def test_set_times_out_without_properties_changed(self):
+        from bt_joystick.bt_adapter import ADAPTER_INTERFACE, BLUEZ_SERVICE, PROPERTIES_INTERFACE
+
+        # property is set on the other adapter, so PropertiesChanged of this adapter's path never comes
+        self.adapter.properties = dbus.Interface(self.bus.get_object(BLUEZ_SERVICE, "/org/bluez/hci1"), PROPERTIES_INTERFACE)
+        with self.assertRaises(TimeoutError):
+            self.adapter.set("Alias", dbus.String("never-confirmed"), timeout=0.2)
+        self.assertEqual("never-confirmed", str(self.adapter.properties.Get(ADAPTER_INTERFACE, "Alias")))
+
+        # timeout source was removed when it fired - the next set still works
+        self.adapter.properties = dbus.Interface(self.bus.get_object(BLUEZ_SERVICE, "/org/bluez/hci0"), PROPERTIES_INTERFACE)
+        self.adapter.set("Alias", dbus.String("confirmed"), timeout=5.0)
+
+    def test_configure(self):
+        device_class = int(self.adapter.get("Class"))  # matching class, so hciconfig isn't run
+        elapsed = self.adapter.configure("gcc-bt-joystick", device_class, timeout=5.0)
+        self.assertGreaterEqual(elapsed, 0.0)
+        self.assertTrue(bool(self.adapter.get("Powered")))
+        self.assertTrue(bool(self.adapter.get("Pairable")))
+        self.assertEqual(0, int(self.adapter.get("DiscoverableTimeout")))
+        self.assertEqual("gcc-bt-joystick", str(self.adapter.get("Alias")))
+
+
+if __name__ == "__main__":
+    unittest.main()
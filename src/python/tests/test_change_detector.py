@@ -0,0 +1,105 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import unittest
+
+from bt_joystick.change_detector import ChangeDetector, per_axis
+from bt_joystick.stats import PipelineStats
+from tests.test_scheduler import FakeClock
+
+
+class TestChangeDetector(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = PipelineStats()
+
+    def detector(self, **kwargs):
+        return ChangeDetector(2, clock=self.clock, stats=self.stats, **kwargs)
+
+    def test_deadband(self):
+        detector = self.detector(deadband=2, hysteresis=1)
+        self.assertFalse(detector.update([2, -2], 0))
+        self.assertEqual([0, 0], detector.axis)
+        self.assertEqual(1, detector.suppressed)
+        self.assertEqual(1, self.stats.counters[PipelineStats.REPORTS_SUPPRESSED])
+
+        self.assertTrue(detector.update([3, -2], 0))
+        # only the axis that moved takes its new value
+        self.assertEqual([3, 0], detector.axis)
+
+    def test_unchanged_values_are_not_suppressed_reports(self):
+        detector = self.detector()
+        self.assertFalse(detector.update([0, 0], 0))
+        self.assertEqual(0, detector.suppressed)
+
+    def test_per_axis_deadband(self):
+        detector = self.detector(deadband=[0, 5])
+        self.assertTrue(detector.update([1, 5], 0))
+        self.assertEqual([1, 0], detector.axis)
+        with self.assertRaises(ValueError):
+            self.detector(deadband=[1, 2, 3])
+
+    def test_hysteresis_while_moving(self):
+        detector = self.detector(deadband=2, hysteresis=1)
+        self.assertTrue(detector.update([3, 0], 0))
+        # while moving, changes bigger than hysteresis are reported
+        self.assertTrue(detector.update([5, 0], 0))
+        self.assertEqual([5, 0], detector.axis)
+
+        # small move back is jitter - axis is at rest again
+        self.assertFalse(detector.update([4, 0], 0))
+        self.assertEqual([5, 0], detector.axis)
+        # and has to move more than deadband again
+        self.assertFalse(detector.update([7, 0], 0))
+        self.assertTrue(detector.update([8, 0], 0))
+        self.assertEqual([8, 0], detector.axis)
+
+    def test_min_interval_holds_and_later_sends_pending_change(self):
+        detector = self.detector(deadband=0, hysteresis=0, min_interval=0.1)
+        self.assertTrue(detector.update([10, 0], 0))
+
+        self.clock.now += 0.05
+        self.assertFalse(detector.update([20, 0], 0))
+        self.assertEqual([10, 0], detector.axis)
+        self.assertEqual(1, detector.suppressed)
+
+        # value doesn't change any more, but the held back change is reported once interval has passed
+        self.clock.now += 0.06
+        self.assertTrue(detector.update([20, 0], 0))
+        self.assertEqual([20, 0], detector.axis)
+        self.assertFalse(detector.update([20, 0], 0))
+        self.assertEqual(2, detector.sent)
+
+    def test_buttons_bypass_deadband_and_min_interval(self):
+        detector = self.detector(deadband=2, hysteresis=1, min_interval=0.1)
+        self.assertTrue(detector.update([1, 0], 0b01))
+        self.assertEqual(0b01, detector.button_bits)
+        # axis jitter is not sent along with the buttons
+        self.assertEqual([0, 0], detector.axis)
+
+        self.assertTrue(detector.update([1, 0], 0b11))
+        self.assertEqual(0b11, detector.button_bits)
+        self.assertEqual(2, detector.sent)
+
+    def test_reset(self):
+        detector = self.detector(deadband=2, min_interval=0.1)
+        self.assertTrue(detector.update([10, 0], 0))
+        detector.reset([50, 1], 0b1)
+        self.assertEqual([50, 1], detector.axis)
+        self.assertEqual(0b1, detector.button_bits)
+        self.assertFalse(detector.update([51, 1], 0b1))
+
+
+class TestPerAxis(unittest.TestCase):
+    def test_per_axis(self):
+        self.assertEqual([2, 2, 2], per_axis(2, 3))
+        self.assertEqual([1, 2], per_axis((1, 2), 2))
+        with self.assertRaises(ValueError):
+            per_axis([1, 2], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
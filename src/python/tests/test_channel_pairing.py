@@ -0,0 +1,155 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import asyncio
+import os
+import socket
+import unittest
+
+from bt_joystick.async_bt_device import AsyncBTDevice
+from bt_joystick.hid_device import HIDDevice
+from bt_joystick.transport import LoopbackTransport
+
+
+class Host:
+    """
+    Host connecting channels one at a time; its sockets are bound in a directory of its own, which is its peer address
+    """
+    def __init__(self, transport, name):
+        self.transport = transport
+        self.address = os.path.join(transport.directory, name)
+        os.mkdir(self.address)
+        self.sockets = [None, None]
+
+    def connect(self, channel):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        s.bind(os.path.join(self.address, ("control", "interrupt")[channel]))
+        s.connect((self.transport.control_path, self.transport.interrupt_path)[channel])
+        self.sockets[channel] = s
+
+    def disconnect(self, channel):
+        self.sockets[channel].close()
+        self.sockets[channel] = None
+        os.unlink(os.path.join(self.address, ("control", "interrupt")[channel]))
+
+    def close(self):
+        for channel, s in enumerate(self.sockets):
+            if s is not None:
+                self.disconnect(channel)
+        os.rmdir(self.address)
+
+
+class ChannelPairingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.hosts = []
+
+    def tearDown(self):
+        for host in self.hosts:
+            host.close()
+        self.transport.close()
+
+    def host(self, name):
+        host = Host(self.transport, name)
+        self.hosts.append(host)
+        return host
+
+    def assertConnectedTo(self, host, control, interrupt):
+        host.sockets[0].send(b"control")
+        host.sockets[1].send(b"interrupt")
+        control.settimeout(1.0)
+        interrupt.settimeout(1.0)
+        self.assertEqual(b"control", control.recv(64))
+        self.assertEqual(b"interrupt", interrupt.recv(64))
+
+
+class TestHIDDeviceListen(ChannelPairingTestCase):
+    def setUp(self):
+        super(TestHIDDeviceListen, self).setUp()
+        self.device = HIDDevice(transport=self.transport)
+        self.assertFalse(self.device.listen(timeout=0))  # starts listening
+
+    def tearDown(self):
+        self.device.close()
+        super(TestHIDDeviceListen, self).tearDown()
+
+    def test_interleaved_hosts(self):
+        a = self.host("a")
+        b = self.host("b")
+        a.connect(0)
+        b.connect(0)
+        b.connect(1)
+
+        self.assertTrue(self.device.listen(timeout=2.0))
+        self.assertEqual(b.address, self.device.host_address)
+        self.assertConnectedTo(b, self.device.ccontrol, self.device.cinterrupt)
+
+        a.connect(1)
+        self.assertTrue(self.device.listen(timeout=2.0))
+        self.assertEqual(a.address, self.device.host_address)
+        self.assertConnectedTo(a, self.device.ccontrol, self.device.cinterrupt)
+
+    def test_half_open_connection_is_closed(self):
+        a = self.host("a")
+        a.connect(0)
+        a.disconnect(0)
+
+        self.assertFalse(self.device.listen(timeout=0.3, pair_timeout=0.1))
+        self.assertEqual(0, len(self.device._pairer))
+
+        b = self.host("b")
+        b.connect(1)
+        b.connect(0)
+        self.assertTrue(self.device.listen(timeout=2.0))
+        self.assertConnectedTo(b, self.device.ccontrol, self.device.cinterrupt)
+
+
+class TestAsyncBTDeviceListen(ChannelPairingTestCase):
+    def setUp(self):
+        super(TestAsyncBTDeviceListen, self).setUp()
+        self.device = AsyncBTDevice.from_transport(self.transport)
+
+    def tearDown(self):
+        self.device.close()
+        super(TestAsyncBTDeviceListen, self).tearDown()
+
+    def listen(self, timeout=2.0, pair_timeout=5.0):
+        asyncio.run(asyncio.wait_for(self.device.listen(pair_timeout), timeout))
+
+    def test_interleaved_hosts(self):
+        a = self.host("a")
+        b = self.host("b")
+        a.connect(0)
+        b.connect(0)
+        b.connect(1)
+
+        self.listen()
+        self.assertEqual(b.address, self.device.peer)
+        self.assertConnectedTo(b, self.device.ccontrol, self.device.cinterrupt)
+
+        a.connect(1)
+        self.listen()
+        self.assertEqual(a.address, self.device.peer)
+        self.assertConnectedTo(a, self.device.ccontrol, self.device.cinterrupt)
+
+    def test_half_open_connection_is_closed(self):
+        a = self.host("a")
+        a.connect(0)
+        a.disconnect(0)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.listen(timeout=0.3, pair_timeout=0.1)
+        self.assertEqual(0, len(self.device._pairer))
+
+        b = self.host("b")
+        b.connect(1)
+        b.connect(0)
+        self.listen()
+        self.assertConnectedTo(b, self.device.ccontrol, self.device.cinterrupt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from bt_joystick import conditioning
+from bt_joystick.conditioning import CALIBRATION_VERSION, AxisCalibration, InputConditioner, build_axis_table, build_radial_tables
+
+
+class TestAxisTables(unittest.TestCase):
+    def test_unsigned_linear_table(self):
+        table = build_axis_table(AxisCalibration(0, 2048, 4095), 12, signed=False)
+        self.assertEqual(4096, len(table))
+        self.assertEqual((-127, 0, 127), (table[0], table[2048], table[4095]))
+        self.assertEqual(-64, table[1024])
+        self.assertEqual(sorted(table), list(table))
+
+    def test_signed_table_is_indexed_with_both_signed_and_unsigned_codes(self):
+        table = build_axis_table(AxisCalibration(-1000, 0, 1000), 12, signed=True)
+        self.assertEqual((-127, 0, 127), (table[-1000], table[0], table[1000]))
+        self.assertEqual(table[-500], table[0x1000 - 500])
+        self.assertEqual(-64, table[-500])
+        # codes beyond calibration read as full deflection
+        self.assertEqual((-127, 127), (table[-2048], table[2047]))
+
+    def test_dead_zone(self):
+        table = build_axis_table(AxisCalibration(0, 1000, 2000), 11, signed=False, dead_zone=0.1)
+        self.assertEqual([0] * 201, list(table[900:1101]))
+        self.assertEqual((1, -1), (table[1105], table[895]))
+        # rest of the range is scaled to full output
+        self.assertEqual((127, -127), (table[2000], table[0]))
+        self.assertEqual(64, table[1550])
+
+    def test_response_curve(self):
+        linear = build_axis_table(AxisCalibration(0, 1000, 2000), 11, signed=False)
+        quadratic = build_axis_table(AxisCalibration(0, 1000, 2000), 11, signed=False, curve=2)
+        self.assertEqual(64, linear[1500])
+        self.assertEqual(32, quadratic[1500])
+        self.assertEqual(-32, quadratic[500])
+        self.assertEqual(127, quadratic[2000])
+
+    def test_radial_dead_zone(self):
+        table_x, table_y = build_radial_tables(dead_zone=0.2)
+        index = lambda x, y: ((x & 0xff) << 8) | (y & 0xff)
+        self.assertEqual((0, 0), (table_x[index(17, -17)], table_y[index(17, -17)]))
+        self.assertEqual((127, 0), (table_x[index(127, 0)], table_y[index(127, 0)]))
+        self.assertEqual((0, -127), (table_x[index(0, -127)], table_y[index(0, -127)]))
+        x, y = table_x[index(40, 40)], table_y[index(40, 40)]
+        self.assertEqual(x, y)
+        self.assertTrue(0 < x < 40)
+
+
+class TestInputConditioner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="bt_joystick_calibration_")
+        self.path = os.path.join(self.directory, "test.calibration.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def conditioner(self, signed=True, **kwargs):
+        calibration = (-1000, 0, 1000) if signed else (0, 2048, 4095)
+        return InputConditioner(("x", "y"), calibration, bits=12, signed=signed, path=self.path, **kwargs)
+
+    def test_condition(self):
+        conditioner = self.conditioner()
+        out = [0, 0]
+        self.assertIs(out, conditioner.condition([1000, -500], out))
+        self.assertEqual([127, -64], out)
+
+    def test_unsigned_register_values_of_negative_codes_do_not_recalibrate(self):
+        conditioner = self.conditioner()
+        out = [0, 0]
+        self.assertEqual([0, -64], conditioner.condition([0xfff, 0x1000 - 500], out))
+        self.assertEqual(0, conditioner.table_builds)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_codes_that_do_not_fit_are_clamped(self):
+        conditioner = self.conditioner(auto_calibrate=False)
+        out = [0, 0]
+        self.assertEqual([127, -127], conditioner.condition([5000, -5000], out))
+
+        conditioner = self.conditioner(signed=False, auto_calibrate=False)
+        self.assertEqual([127, -127], conditioner.condition([0x1000, -1], out))
+
+    def test_widening_calibration(self):
+        conditioner = self.conditioner(recalibration_threshold=0.02)
+        out = [0, 0]
+        conditioner.condition([1030, 0], out)  # within threshold
+        self.assertEqual(0, conditioner.table_builds)
+        self.assertEqual(127, out[0])
+
+        conditioner.condition([1500, -1200], out)
+        self.assertEqual([AxisCalibration(-1000, 0, 1500), AxisCalibration(-1200, 0, 1000)], conditioner.calibrations)
+        self.assertEqual([127, -127], out)
+
+        conditioner.wait_saved()
+        self.assertEqual(2, conditioner.table_builds)
+        self.assertEqual(85, conditioner.condition([1000, 0], out)[0])
+        with open(self.path) as f:
+            saved = json.load(f)
+        self.assertEqual({"version": CALIBRATION_VERSION, "axes": {"x": [-1000, 0, 1500], "y": [-1200, 0, 1000]}}, saved)
+
+    def test_tables_are_regenerated_in_background(self):
+        threads = []
+        original = conditioning.build_axis_table
+
+        def build_axis_table(*args):
+            threads.append(threading.current_thread())
+            return original(*args)
+
+        conditioning.build_axis_table = build_axis_table
+        try:
+            conditioner = self.conditioner()
+            del threads[:]
+            conditioner.condition([1500, 0], [0, 0])
+            conditioner.wait_saved()
+        finally:
+            conditioning.build_axis_table = original
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.main_thread(), threads[0])
+
+    def test_load_and_save_round_trip(self):
+        conditioner = self.conditioner()
+        self.assertFalse(conditioner.calibrated)
+        conditioner.calibrate_centre([100, 0xfff])
+        self.assertTrue(conditioner.calibrated)
+        self.assertEqual([AxisCalibration(-1000, 100, 1000), AxisCalibration(-1000, -1, 1000)], conditioner.calibrations)
+
+        loaded = self.conditioner()
+        self.assertTrue(loaded.calibrated)
+        self.assertEqual(conditioner.calibrations, loaded.calibrations)
+        self.assertEqual([0, 0], loaded.condition([100, -1], [1, 1]))
+
+    def test_saved_calibration_of_other_axes_is_kept_default(self):
+        with open(self.path, "w") as f:
+            json.dump({"version": CALIBRATION_VERSION, "axes": {"x": [-500, 10, 500], "z": [0, 1, 2]}}, f)
+        conditioner = self.conditioner()
+        self.assertTrue(conditioner.calibrated)
+        self.assertEqual([AxisCalibration(-500, 10, 500), AxisCalibration(-1000, 0, 1000)], conditioner.calibrations)
+
+    def test_unusable_saved_calibration_is_ignored(self):
+        for content in ('{"version": 0, "axes": {}}', '{"version": 1, "axes": {"x": [5, 0, 1]}}', 'not json'):
+            with open(self.path, "w") as f:
+                f.write(content)
+            conditioner = self.conditioner()
+            self.assertFalse(conditioner.calibrated, content)
+            self.assertEqual(AxisCalibration(-1000, 0, 1000), conditioner.calibrations[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import json
+import os
+import unittest
+
+try:
+    import dbus
+    import dbus.service
+    import dbusmock
+    from dbus.mainloop.glib import DBusGMainLoop
+except ImportError:
+    dbusmock = None
+
+from bt_joystick.stats import PipelineStats
+
+
+@unittest.skipIf(dbusmock is None, "dbus-python, PyGObject and python-dbusmock are needed")
+class TestPipelineStatsService(dbusmock.DBusTestCase if dbusmock is not None else unittest.TestCase):
+    BUS_NAME = "org.gcc.btservice.test"
+    PATH = "/org/gcc/btservice"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.start_session_bus()
+        DBusGMainLoop(set_as_default=True)
+
+    def setUp(self):
+        from bt_joystick.bt_device import GLibMainLoopThread, PipelineStatsService
+
+        class StatsObject(PipelineStatsService):
+            def __init__(self, stats, bus_name, path):
+                self.stats = stats
+                PipelineStatsService.__init__(self, bus_name, path)
+
+        self.stats = PipelineStats()
+        self.bus = self.get_dbus(system_bus=False)
+        self.bus_name = dbus.service.BusName(self.BUS_NAME, bus=self.bus)
+        self.service = StatsObject(self.stats, self.bus_name, self.PATH)
+        self.main_loop = GLibMainLoopThread().start()
+
+        # client has its own connection, so its calls go through the bus to the main loop thread
+        self.client = dbus.bus.BusConnection(os.environ["DBUS_SESSION_BUS_ADDRESS"])
+        self.proxy = dbus.Interface(self.client.get_object(self.BUS_NAME, self.PATH), PipelineStatsService.DBUS_INTERFACE)
+
+    def tearDown(self):
+        self.main_loop.stop()
+        self.service.remove_from_connection()
+        self.client.close()
+
+    def test_get_stats(self):
+        self.stats.increment(PipelineStats.REPORTS_SENT)
+        self.stats.record(PipelineStats.SEND, 0.0002)
+        snapshot = json.loads(str(self.proxy.GetStats(timeout=5)))
+        self.assertEqual(self.stats.snapshot(), snapshot)
+
+    def test_reset_stats(self):
+        self.stats.increment(PipelineStats.REPORTS_SENT)
+        self.proxy.ResetStats(timeout=5)
+        self.assertEqual(PipelineStats().snapshot(), json.loads(str(self.proxy.GetStats(timeout=5))))
+
+
+if __name__ == "__main__":
+    unittest.main()
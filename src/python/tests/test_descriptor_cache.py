@@ -0,0 +1,99 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bt_joystick import descriptor_cache
+from bt_joystick.descriptor_cache import DescriptorCache, _layout_to_json, generator_version, sources_hash
+from bt_joystick.hid_device import HIDDevice
+from bt_joystick.hid_report import compile_report_layout
+from bt_joystick.hid_report_descriptor import Usage, create_joystick_report_descriptor
+from bt_joystick.transport import LoopbackTransport
+
+
+class TestDescriptorCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="bt_joystick_cache_")
+        self.cache = DescriptorCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit_returns_what_was_generated(self):
+        generated = self.cache.joystick_configuration(hat_switch=True, button_number=20)
+        cached = DescriptorCache(self.directory).joystick_configuration(hat_switch=True, button_number=20)
+
+        descriptor = create_joystick_report_descriptor(kind=Usage.Gamepad, axes=(Usage.X, Usage.Y, Usage.Rx, Usage.Ry), hat_switch=True, button_number=20)
+        self.assertEqual(bytes(descriptor), generated.descriptor)
+        self.assertEqual(generated.descriptor, cached.descriptor)
+        self.assertEqual(_layout_to_json(compile_report_layout(descriptor)), _layout_to_json(cached.layout))
+        self.assertEqual(generated.service_record.xml(), cached.service_record.xml())
+
+    def test_device_keeps_descriptor_and_layout_apart(self):
+        self.cache.joystick_configuration()
+        configuration = DescriptorCache(self.directory).joystick_configuration()
+        transport = LoopbackTransport()
+        try:
+            device = HIDDevice(configuration.descriptor, transport, report_layout=configuration.layout)
+            self.assertEqual(configuration.descriptor, device.hid_descriptor)
+            self.assertIs(configuration.layout, device.report_layout)
+            self.assertIs(configuration.layout, device.report_encoder.layout)
+
+            # layout is compiled from descriptor bytes when it is not supplied
+            device = HIDDevice(configuration.descriptor, transport)
+            self.assertEqual(_layout_to_json(configuration.layout), _layout_to_json(device.report_layout))
+        finally:
+            transport.close()
+
+    def test_corrupted_entry_is_regenerated(self):
+        self.cache.joystick_configuration()
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name), "r+") as f:
+                f.seek(20)
+                f.write("00")
+        cache = DescriptorCache(self.directory)
+        cache.joystick_configuration()
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+
+
+class TestGeneratorVersion(unittest.TestCase):
+    def test_changes_with_generator_sources(self):
+        directory = tempfile.mkdtemp(prefix="bt_joystick_sources_")
+        try:
+            path = os.path.join(directory, "generator.py")
+            with open(path, "w") as f:
+                f.write("VALUE = 1\n")
+            before = sources_hash([path])
+            with open(path, "w") as f:
+                f.write("VALUE = 2\n")
+            self.assertNotEqual(before, sources_hash([path]))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_covers_descriptor_sdp_and_layout_generators(self):
+        paths = [module.__file__ for module in descriptor_cache._GENERATOR_MODULES]
+        self.assertEqual(sources_hash(paths), generator_version())
+        self.assertEqual({"hid_report_descriptor.py", "sdp_record.py", "hid_report.py"}, {os.path.basename(path) for path in paths})
+
+    def test_entries_of_other_generator_version_are_not_used(self):
+        directory = tempfile.mkdtemp(prefix="bt_joystick_cache_")
+        saved = descriptor_cache._generator_version
+        try:
+            DescriptorCache(directory).joystick_configuration()
+            descriptor_cache._generator_version = "changed"
+            cache = DescriptorCache(directory)
+            cache.joystick_configuration()
+            self.assertEqual((0, 1), (cache.hits, cache.misses))
+        finally:
+            descriptor_cache._generator_version = saved
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import sys
+import unittest
+
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
+from tests.fake_gpio import FakeGPIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "examples"))
+
+from explorer_phat_joystick import ExplorerPHatJoystick  # noqa: E402
+
+
+class CalibratedConditioner:
+    calibrated = True
+
+    def condition(self, raw_values, out):
+        for i, value in enumerate(raw_values):
+            out[i] = value
+        return out
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestExplorerPHatJoystickButtons(unittest.TestCase):
+    def setUp(self):
+        self.gpio = FakeGPIO()
+        self.clock = FakeClock()
+        self.joystick = ExplorerPHatJoystick(gpio=self.gpio, i2c=object(), conditioner=CalibratedConditioner(), clock=self.clock)
+        self.names = self.joystick.button_bit_names
+
+    def bit(self, name):
+        return 1 << self.names.index(name)
+
+    def test_edge_detection_on_all_buttons(self):
+        self.assertEqual(set(ExplorerPHatJoystick.BUTTON_PINS.values()), set(self.gpio.callbacks))
+        for edge, _ in self.gpio.callbacks.values():
+            self.assertEqual(FakeGPIO.BOTH, edge)
+
+    def test_press_and_release(self):
+        self.gpio.press(ExplorerPHatJoystick.TRIGGER)
+        self.assertTrue(self.joystick.wake_event.is_set())
+        self.assertEqual(self.bit('trigger'), self.joystick.readButtonBits())
+        self.assertEqual(self.bit('trigger'), self.joystick.readButtonBits())  # still held
+
+        self.clock.now += 0.1
+        self.gpio.release(ExplorerPHatJoystick.TRIGGER)
+        self.assertEqual(0, self.joystick.readButtonBits())
+
+    def test_press_shorter_than_read_interval_is_latched(self):
+        self.gpio.press(ExplorerPHatJoystick.TL)
+        self.clock.now += 0.002
+        self.gpio.release(ExplorerPHatJoystick.TL)
+        self.assertEqual(self.bit('tl'), self.joystick.readButtonBits())
+        self.assertEqual(0, self.joystick.readButtonBits())  # reported only once
+
+    def test_release_soon_after_press_is_not_lost(self):
+        self.gpio.press(ExplorerPHatJoystick.THUMB)
+        self.clock.now += 0.001  # well within debounce time
+        self.gpio.release(ExplorerPHatJoystick.THUMB)
+        self.joystick.readButtonBits()
+        self.assertEqual(0, self.joystick.readButtonBits())
+
+    def test_release_bounce_is_not_a_new_press(self):
+        pin = ExplorerPHatJoystick.DOWN
+        self.gpio.press(pin)
+        self.clock.now += 0.1
+        self.assertEqual(self.bit('dpad_down'), self.joystick.readButtonBits())
+        for _ in range(3):
+            self.gpio.release(pin)
+            self.clock.now += 0.001
+            self.gpio.press(pin)
+            self.clock.now += 0.001
+        self.gpio.release(pin)
+        self.assertEqual(0, self.joystick.readButtonBits())
+
+        self.clock.now += 0.1
+        self.gpio.press(pin)  # after debounce time it is a new press
+        self.gpio.release(pin)
+        self.assertEqual(self.bit('dpad_down'), self.joystick.readButtonBits())
+
+    def test_press_bounce_ends_pressed(self):
+        pin = ExplorerPHatJoystick.UP
+        self.gpio.press(pin)
+        self.gpio.release(pin)
+        self.gpio.press(pin)
+        self.joystick.readButtonBits()
+        self.assertEqual(self.bit('dpad_up'), self.joystick.readButtonBits())
+
+    def test_level_is_read_again_in_callback(self):
+        # release edge missed by the library, next (bounce) callback reads the settled level
+        pin = ExplorerPHatJoystick.RIGHT
+        self.gpio.press(pin)
+        self.clock.now += 0.1
+        self.gpio.set_level(pin, FakeGPIO.HIGH, edge=False)
+        self.joystick._button_edge(pin)
+        self.joystick.readButtonBits()
+        self.assertEqual(0, self.joystick.readButtonBits())
+
+    def test_button_held_at_start(self):
+        gpio = FakeGPIO()
+        gpio.setup(ExplorerPHatJoystick.LB, FakeGPIO.IN)
+        gpio.levels[ExplorerPHatJoystick.LB] = FakeGPIO.LOW
+        joystick = ExplorerPHatJoystick(gpio=gpio, i2c=object(), conditioner=CalibratedConditioner())
+        self.assertEqual(1 << joystick.button_bit_names.index('thumbl'), joystick.readButtonBits())
+
+    def test_read_buttons(self):
+        self.gpio.press(ExplorerPHatJoystick.RB)
+        buttons = self.joystick.readButtons()
+        self.assertTrue(buttons['thumbr'])
+        self.assertEqual(1, sum(1 for pressed in buttons.values() if pressed))
+
+    def test_button_bits_are_remapped_for_state(self):
+        self.gpio.press(ExplorerPHatJoystick.TR)
+        bits = self.joystick._remap_buttons(self.joystick.readButtonBits())
+        self.assertEqual(DEFAULT_JOYSTICK_DESCRIPTION.mapping().button_bit['tr'], bits)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import unittest
+
+from bt_joystick.hid_report import HIDP_DATA_INPUT, ReportDecoder, ReportEncoder, compile_report_layout
+from bt_joystick.hid_report_descriptor import Usage, create_joystick_report_descriptor
+
+
+AXES = (Usage.X, Usage.Y, Usage.Rx, Usage.Ry)
+
+
+def _encoder(button_number, hat_switch=False, axes=AXES):
+    descriptor = create_joystick_report_descriptor(kind=Usage.Gamepad, axes=axes, hat_switch=hat_switch, button_number=button_number)
+    return ReportEncoder(descriptor), ReportDecoder(descriptor)
+
+
+class TestReportEncoder(unittest.TestCase):
+    def test_report_size(self):
+        for button_number, size in ((14, 2 + 2 + 4), (20, 2 + 3 + 4), (40, 2 + 5 + 4)):
+            encoder, _ = _encoder(button_number)
+            self.assertEqual(size, len(encoder.encode()), str(button_number) + " buttons")
+            self.assertEqual(HIDP_DATA_INPUT, encoder.report[0])
+            self.assertEqual(1, encoder.report[1])  # report ID
+
+    def test_buttons(self):
+        for button_number in (14, 20, 40):
+            encoder, decoder = _encoder(button_number)
+            for bits in (0, 1, 1 << (button_number - 1), (1 << button_number) - 1, 0x5555555555 & ((1 << button_number) - 1)):
+                encoder.set_buttons(bits)
+                decoded = decoder.decode(encoder.encode())
+                for i in range(button_number):
+                    self.assertEqual((bits >> i) & 1, decoded["button_" + str(i + 1)], "button {} of {} with 0x{:x}".format(i + 1, button_number, bits))
+
+    def test_buttons_beyond_report_are_ignored(self):
+        encoder, decoder = _encoder(14)
+        encoder.set_buttons(0xffffffff)
+        self.assertEqual(b"\xff\x3f", bytes(encoder.encode()[2:4]))
+
+    def test_axes(self):
+        for button_number in (14, 20, 40):
+            encoder, decoder = _encoder(button_number)
+            encoder.set_buttons((1 << button_number) - 1)
+            encoder.set_axes([-127, 127, 0, -1])
+            decoded = decoder.decode(encoder.encode())
+            self.assertEqual([-127, 127, 0, -1], [decoded["x"], decoded["y"], decoded["rx"], decoded["ry"]])
+            self.assertEqual(1, decoded["button_" + str(button_number)])
+
+    def test_hat_switch_starts_in_null_state(self):
+        encoder, decoder = _encoder(14, hat_switch=True)
+        field = encoder.layout.hat_switches[0]
+        self.assertEqual(0, field.logical_minimum)
+        self.assertEqual(8, field.logical_maximum)
+        self.assertEqual([9], encoder.hat_switch_nulls)
+        self.assertEqual(9, decoder.decode(encoder.encode())["hat_switch"])
+
+    def test_hat_switch(self):
+        for button_number in (14, 20, 40):
+            encoder, decoder = _encoder(button_number, hat_switch=True)
+            encoder.set_buttons((1 << button_number) - 1)
+            encoder.set_axes([1, 2, 3, 4])
+            for value in range(10):
+                encoder.set_hat_switch(value)
+                decoded = decoder.decode(encoder.encode())
+                self.assertEqual(value, decoded["hat_switch"])
+                self.assertEqual(4, decoded["ry"])
+                self.assertEqual(1, decoded["button_" + str(button_number)])
+
+    def test_encode_reuses_buffer(self):
+        encoder, _ = _encoder(14)
+        self.assertIs(encoder.encode(), encoder.encode())
+
+    def test_layout(self):
+        layout = compile_report_layout(create_joystick_report_descriptor(axes=AXES, hat_switch=True, button_number=20))
+        self.assertEqual(20, len(layout.buttons))
+        self.assertEqual(["x", "y", "rx", "ry"], [f.name for f in layout.axes])
+        self.assertEqual(["hat_switch"], [f.name for f in layout.hat_switches])
+
+
+if __name__ == "__main__":
+    unittest.main()
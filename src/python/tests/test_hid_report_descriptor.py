@@ -0,0 +1,102 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import copy
+import unittest
+
+from bt_joystick.hid_report import compile_report_layout
+from bt_joystick.hid_report_descriptor import LogicalMaximum, LogicalMinimum, PhysicalMaximum, Usage, UsageMaximum, UsagePage, \
+    create_joystick_report_descriptor, parse_report_descriptor
+
+
+# Report with one 16 bit axis; logical minimum and maximum items are given as hex, so their sizes can be varied
+def _descriptor(logical_minimum, logical_maximum):
+    return ("05010905a101"  # UsagePage(GenericDesktopCtrls), Usage(Gamepad), Collection(Application)
+            "8501"  # ReportID(1)
+            "0930" + logical_minimum + logical_maximum +  # Usage(X), LogicalMinimum, LogicalMaximum
+            "75109501"  # ReportSize(16), ReportCount(1)
+            "8102"  # Input(Data, Var, Abs)
+            "c0")  # End collection
+
+
+class TestParseReportDescriptor(unittest.TestCase):
+    def test_round_trip_of_generated_descriptors(self):
+        for axes in ((Usage.X, Usage.Y), (Usage.X, Usage.Y, Usage.Rx, Usage.Ry, Usage.Z, Usage.Rz)):
+            for hat_switch in (False, True):
+                for button_number in (1, 8, 14, 20, 40):
+                    descriptor = create_joystick_report_descriptor(axes=axes, hat_switch=hat_switch, button_number=button_number)
+                    self.assertEqual(descriptor.hex(), parse_report_descriptor(descriptor.hex()).hex())
+                    self.assertEqual(bytes(descriptor), bytes(parse_report_descriptor(bytes(descriptor))))
+
+    def test_round_trip_keeps_item_sizes(self):
+        for logical_minimum, logical_maximum, expected in (
+                ("1581", "257f", (-127, 127)),  # 1 byte items
+                ("1500", "26ff00", (0, 255)),  # 2 byte maximum that would fit 1 byte unsigned
+                ("168000", "26ff7f", (128, 32767)),  # 2 byte minimum with high bit of the first byte set
+                ("160080", "26ff7f", (-32768, 32767)),
+                ("17ffffffff", "2701000000", (-1, 1)),  # 4 byte items of small values
+                ("1700000080", "27ffffff7f", (-0x80000000, 0x7fffffff))):
+            data = _descriptor(logical_minimum, logical_maximum)
+            descriptor = parse_report_descriptor(data)
+            self.assertEqual(data, descriptor.hex())
+            field = compile_report_layout(descriptor).field("x")
+            self.assertEqual(expected, (field.logical_minimum, field.logical_maximum), logical_minimum + " " + logical_maximum)
+
+    def test_items_are_sign_extended_from_their_size(self):
+        elements = parse_report_descriptor("1680ff" "1580" "168000" "26ff00" "25ff").elements
+        self.assertEqual([2, 1, 2, 2, 1], [e.size for e in elements])
+        self.assertEqual([-128, -128, 128, 255, -1], [e.signed_value() for e in elements])
+        self.assertIsInstance(elements[0], LogicalMinimum)
+        self.assertIsInstance(elements[3], LogicalMaximum)
+
+    def test_unsigned_maximum_after_non_negative_minimum(self):
+        field = compile_report_layout(parse_report_descriptor(_descriptor("1500", "25ff"))).field("x")
+        self.assertEqual((0, 255), (field.logical_minimum, field.logical_maximum))
+
+    def test_truncated_item(self):
+        with self.assertRaises(ValueError):
+            parse_report_descriptor("2601")
+
+    def test_unterminated_collection(self):
+        with self.assertRaises(ValueError):
+            parse_report_descriptor("a101")
+
+    def test_element_sizes(self):
+        self.assertEqual("0509", UsagePage(UsagePage.Button).hex())
+        self.assertEqual("1581", LogicalMinimum(-127).hex())
+        self.assertEqual("463b01", PhysicalMaximum(315).hex())
+        self.assertEqual("16ff7f", LogicalMinimum(32767).hex())
+
+    def test_signed_items_take_size_from_signed_range(self):
+        self.assertEqual("257f", LogicalMaximum(127).hex())
+        self.assertEqual("26ff00", LogicalMaximum(255).hex())
+        self.assertEqual("25ff", LogicalMaximum(-1).hex())
+        self.assertEqual("167fff", LogicalMinimum(-129).hex())
+        self.assertEqual("2700800000", LogicalMaximum(32768).hex())
+        self.assertEqual("46ff00", PhysicalMaximum(255).hex())
+        self.assertEqual(255, LogicalMaximum(255).signed_value())
+        # unsigned items still use the smallest size
+        self.assertEqual("29ff", UsageMaximum(255).hex())
+
+    def test_signed_items_out_of_range(self):
+        with self.assertRaises(ValueError):
+            LogicalMaximum(0x80000000)
+
+
+class TestElements(unittest.TestCase):
+    def test_elements_are_immutable(self):
+        with self.assertRaises(AttributeError):
+            LogicalMaximum(1).value = 2
+
+    def test_copies_are_the_same_element(self):
+        descriptor = create_joystick_report_descriptor(axes=(Usage.X, Usage.Y), button_number=4)
+        self.assertIs(descriptor, copy.copy(descriptor))
+        self.assertIs(descriptor, copy.deepcopy(descriptor))
+        self.assertEqual([descriptor], copy.deepcopy([descriptor]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import subprocess
+import sys
+import unittest
+
+from bt_joystick.bench import IMPORT_BUDGET_MS, PURE_MODULES, bench_import
+
+
+SOURCE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _imported_modules(statement):
+    # modules imported by the statement in a fresh interpreter
+    script = "import sys\n" + statement + "\nprint(' '.join(sorted(sys.modules)))"
+    environment = dict(os.environ, PYTHONPATH=SOURCE_PATH + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.check_output([sys.executable, "-c", script], env=environment, universal_newlines=True).split()
+
+
+class TestImport(unittest.TestCase):
+    def test_pure_modules_do_not_import_dbus(self):
+        modules = _imported_modules("import " + ", ".join(PURE_MODULES))
+        for module in PURE_MODULES:
+            self.assertIn(module, modules)
+        self.assertNotIn("dbus", modules)
+        self.assertNotIn("gi", modules)
+
+    def test_package_names_are_imported_lazily(self):
+        modules = _imported_modules("import bt_joystick\nbt_joystick.JoystickDescription")
+        self.assertIn("bt_joystick.joystick_description", modules)
+        self.assertNotIn("bt_joystick.bt_device", modules)
+        self.assertNotIn("dbus", modules)
+
+    def test_pure_modules_import_within_budget(self):
+        result = bench_import(5)[0]
+        self.assertFalse(result["params"]["dbus_imported"])
+        self.assertLessEqual(result["p50_us"], IMPORT_BUDGET_MS * 1000.0, result)
+        self.assertTrue(result["within_budget"])
+
+
+if __name__ == "__main__":
+    unittest.main()
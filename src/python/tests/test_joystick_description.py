@@ -0,0 +1,112 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import unittest
+
+from bt_joystick.hid_report_descriptor import Usage
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION, Axis, BitRemapper, JoystickDescription
+
+
+BUTTONS = tuple("button" + str(i) for i in range(20))
+
+
+class TestJoystickMapping(unittest.TestCase):
+    def test_native_axes(self):
+        mapping = DEFAULT_JOYSTICK_DESCRIPTION.mapping()
+        values = [0] * mapping.value_count
+        self.assertIs(values, mapping.read_values({'x': 10, 'y': -127, 'rx': 200, 'ry': 255}, values))
+        # values above 127 are unsigned bytes
+        self.assertEqual([10, -127, -56, -1], values)
+
+    def test_hat_switch_is_passed_as_it_is(self):
+        mapping = JoystickDescription(axes=('x', 'y'), buttons=('a', ), hat_switch='hat').mapping()
+        self.assertEqual(('x', 'y', 'hat'), mapping.value_names)
+        self.assertEqual([1, 2, 9], mapping.read_values({'x': 1, 'y': 2, 'hat': 9}, [0, 0, 0]))
+
+    def test_scaled_axes(self):
+        mapping = JoystickDescription(axes=(Axis('x', 0, 4095), Axis('y', 4095, 0), 'rx'), buttons=()).mapping()
+        values = [0, 0, 0]
+        self.assertEqual([-127, 127, 5], mapping.read_values({'x': 0, 'y': 0, 'rx': 5}, values))
+        self.assertEqual([127, -127, 5], mapping.read_values({'x': 4095, 'y': 4095, 'rx': 5}, values))
+        mapping.read_values({'x': 2048, 'y': 2048, 'rx': 0}, values)
+        self.assertEqual([0, 0], values[:2])
+
+    def test_scaled_axes_are_clamped(self):
+        mapping = JoystickDescription(axes=(Axis('x', 0, 4095), Axis('y', -10, 10)), buttons=()).mapping()
+        self.assertEqual([-127, 127], mapping.read_values({'x': -500, 'y': 11}, [0, 0]))
+        self.assertEqual([127, -127], mapping.read_values({'x': 70000, 'y': -1000}, [0, 0]))
+
+    def test_names_needing_quotes(self):
+        mapping = JoystickDescription(axes=(Axis("it's", usage=Usage.X), ), buttons=('"b"', 'a\\b')).mapping()
+        self.assertEqual([3], mapping.read_values({"it's": 3}, [0]))
+        self.assertEqual(0b10, mapping.button_bits({'"b"': False, 'a\\b': True}))
+
+    def test_button_bits(self):
+        mapping = JoystickDescription(axes=('x', ), buttons=BUTTONS).mapping()
+        self.assertEqual(0, mapping.button_bits({name: False for name in BUTTONS}))
+        self.assertEqual((1 << 20) - 1, mapping.button_bits({name: True for name in BUTTONS}))
+        # any true value is a press
+        self.assertEqual(1 | 1 << 19, mapping.button_bits({name: 1 if name in ("button0", "button19") else 0 for name in BUTTONS}))
+
+    def test_one_button(self):
+        mapping = JoystickDescription(axes=('x', ), buttons=('a', )).mapping()
+        self.assertEqual(1, mapping.button_bits({'a': True}))
+        self.assertEqual(0, mapping.button_bits({'a': False}))
+
+    def test_button_bits_without_buttons(self):
+        self.assertEqual(0, JoystickDescription(axes=('x', ), buttons=()).mapping().button_bits({}))
+
+    def test_missing_button(self):
+        with self.assertRaises(KeyError):
+            DEFAULT_JOYSTICK_DESCRIPTION.mapping().button_bits({})
+
+
+class TestBitRemapper(unittest.TestCase):
+    def setUp(self):
+        self.mapping = JoystickDescription(axes=('x', ), buttons=BUTTONS).mapping()
+
+    def test_identity(self):
+        remapper = self.mapping.bit_remapper(BUTTONS)
+        self.assertTrue(remapper.identity)
+        self.assertEqual(0xabcde, remapper.remap(0xabcde))
+
+    def test_reversed_order(self):
+        remapper = self.mapping.bit_remapper(tuple(reversed(BUTTONS)))
+        self.assertFalse(remapper.identity)
+        for bit in range(20):
+            self.assertEqual(1 << (19 - bit), remapper.remap(1 << bit))
+        self.assertEqual(1 << 19 | 1 << 11 | 1, remapper.remap(1 | 1 << 8 | 1 << 19))
+
+    def test_more_than_eight_buttons(self):
+        # every source byte is remapped into other bytes of the report
+        order = BUTTONS[12:] + BUTTONS[:12]
+        remapper = self.mapping.bit_remapper(order)
+        for source_bit, name in enumerate(order):
+            self.assertEqual(1 << BUTTONS.index(name), remapper.remap(1 << source_bit))
+        self.assertEqual((1 << 20) - 1, remapper.remap((1 << 20) - 1))
+
+    def test_unknown_buttons_are_dropped(self):
+        remapper = BitRemapper(("button1", "unknown", "button0"), self.mapping.button_bit)
+        self.assertEqual(0b11, remapper.remap(0b111))
+        self.assertEqual(0, remapper.remap(0b010))
+
+
+class TestAxis(unittest.TestCase):
+    def test_usage_from_name(self):
+        self.assertEqual(Usage.Rx, Axis('rx').usage)
+        self.assertEqual(Usage.Slider, Axis('slider').usage)
+        with self.assertRaises(ValueError):
+            Axis('throttle_lever')
+
+    def test_usage_only_from_axis_names(self):
+        # other generic desktop usages are not axes
+        for name in ('hat_switch', 'gamepad', 'joystick'):
+            with self.assertRaises(ValueError):
+                Axis(name)
+
+
+if __name__ == "__main__":
+    unittest.main()
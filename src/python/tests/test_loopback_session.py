@@ -0,0 +1,145 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import threading
+import time
+import unittest
+
+from bt_joystick import hidp
+from bt_joystick.hid_device import HIDDevice
+from bt_joystick.main import BluetoothJoystickDeviceMain
+from bt_joystick.simulated_host import SimulatedHost
+from bt_joystick.stats import PipelineStats
+from bt_joystick.transport import LoopbackTransport
+from tests.fake_joystick import SettableJoystick
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def axes(decoded, index=-1):
+    return [decoded[name][index] for name in ("x", "y", "rx", "ry")]
+
+
+class LoopbackSessionTestCase(unittest.TestCase):
+    reconnect_timeout = 0
+
+    def setUp(self):
+        self.transport = LoopbackTransport()
+        self.joystick = SettableJoystick()
+        self.device = HIDDevice(self.joystick.description.hid_descriptor(), self.transport)
+        self.main = BluetoothJoystickDeviceMain(self.joystick, rate=200, deadband=0, hysteresis=0,
+                                                device=self.device, reconnect_timeout=self.reconnect_timeout,
+                                                recorder=self.create_recorder())
+        self.thread = threading.Thread(target=self.main.run, daemon=True)
+        self.thread.start()
+
+        self.host = SimulatedHost(self.transport, self.device.report_layout)
+        self.host.connect()
+        self.host.start()
+
+    def create_recorder(self):
+        return None
+
+    def tearDown(self):
+        self.main.stop()
+        self.thread.join(5.0)
+        self.host.close()
+        self.device.close()
+        self.transport.close()
+        self.assertFalse(self.thread.is_alive())
+
+    def received(self, count):
+        self.assertTrue(wait_until(lambda: len(self.host.reports) >= count), "received " + str(len(self.host.reports)) + " reports")
+        return self.host.decoded()
+
+
+class TestLoopbackSession(LoopbackSessionTestCase):
+    def test_reports_follow_joystick(self):
+        self.joystick.set([10, -20, 30, -127], 0b1)
+        decoded = self.received(1)
+        self.assertEqual([10, -20, 30, -127], axes(decoded))
+        self.assertEqual(1, decoded["button_1"][-1])
+
+        self.joystick.set([0, 0, 0, 0], 0b10 | 1 << 13)
+        decoded = self.received(2)
+        self.assertEqual([0, 0, 0, 0], axes(decoded))
+        self.assertEqual((0, 1, 1), (decoded["button_1"][-1], decoded["button_2"][-1], decoded["button_14"][-1]))
+
+    def test_unchanged_state_is_not_sent_again(self):
+        self.joystick.set([5, 5, 5, 5])
+        self.received(1)
+        reads = self.joystick.reads
+        self.assertTrue(wait_until(lambda: self.joystick.reads > reads + 10))
+        self.assertEqual(1, len(self.host.reports))
+
+    def test_get_report(self):
+        self.joystick.set([1, 2, 3, 4], 0b100)
+        self.received(1)
+        report = self.host.get_report()
+        self.assertEqual([1, 2, 3, 4], [report[name] for name in ("x", "y", "rx", "ry")])
+        self.assertEqual(1, report["button_3"])
+
+    def test_get_report_with_unknown_report_id(self):
+        reply = self.host.request(bytes((hidp.GET_REPORT | hidp.REPORT_TYPE_INPUT, 7)))
+        self.assertEqual(hidp.handshake(hidp.ERR_INVALID_REPORT_ID), reply)
+
+    def test_unplug_and_connect_again(self):
+        self.joystick.set([1, 1, 1, 1])
+        self.received(1)
+        self.host.unplug()
+        self.host.disconnect()
+
+        self.host = SimulatedHost(self.transport, self.device.report_layout)
+        self.host.connect()
+        self.host.start()
+        self.joystick.set([2, 2, 2, 2])
+        self.assertEqual([2, 2, 2, 2], axes(self.received(1)))
+        self.assertTrue(wait_until(lambda: self.device.stats.counters[PipelineStats.RECONNECTS] == 1))
+
+
+class TestLoopbackReconnect(LoopbackSessionTestCase):
+    reconnect_timeout = 2.0
+
+    def test_device_reconnects_after_link_is_lost(self):
+        self.joystick.set([3, 3, 3, 3])
+        self.received(1)
+
+        # joystick moves on while the device is reconnecting
+        connect_sockets = self.transport.connect_sockets
+
+        def reconnect(address, timeout=None):
+            self.joystick.set([7, -7, 7, -7], 0b11)
+            return connect_sockets(address, timeout)
+
+        self.transport.connect_sockets = reconnect
+
+        self.host.accept(timeout=0)  # host listens before the link is dropped
+        self.host.disconnect()
+        self.host.reports = []
+        self.joystick.set([4, 4, 4, 4])  # sending this fails and makes the device reconnect
+
+        self.assertTrue(self.host.accept(timeout=5.0))
+        self.host.start()
+        decoded = self.received(1)
+        # the first report after reconnecting has the state joystick had then, not the state before the link was lost
+        self.assertEqual([7, -7, 7, -7], axes(decoded, 0))
+        self.assertEqual((1, 1), (decoded["button_1"][0], decoded["button_2"][0]))
+        self.assertEqual(1, self.device.stats.counters[PipelineStats.RECONNECTS])
+        self.assertGreaterEqual(self.device.stats.counters[PipelineStats.SEND_ERRORS], 1)
+
+        self.joystick.set([0, 0, 0, 0], 0)
+        self.assertEqual([0, 0, 0, 0], axes(self.received(2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import threading
+import unittest
+
+from bt_joystick.bench import run_multi_device
+from bt_joystick.multi_device import MultiDeviceMain, VirtualDevice
+from bt_joystick.simulated_host import SimulatedHost
+from bt_joystick.transport import L2CAPTransport, LoopbackTransport
+from tests.fake_joystick import SettableJoystick
+
+
+class TestMultiDeviceMain(unittest.TestCase):
+    def test_one_device_per_adapter(self):
+        devices = [VirtualDevice("a", SettableJoystick(), L2CAPTransport("00:11:22:33:44:55")),
+                   VirtualDevice("b", SettableJoystick(), L2CAPTransport("00:11:22:33:44:55"))]
+        with self.assertRaises(ValueError):
+            MultiDeviceMain(devices)
+
+    def test_devices_need_adapter_addresses(self):
+        devices = [VirtualDevice("a", SettableJoystick(), L2CAPTransport()),
+                   VirtualDevice("b", SettableJoystick(), L2CAPTransport("00:11:22:33:44:55"))]
+        with self.assertRaises(ValueError):
+            MultiDeviceMain(devices)
+
+    def test_devices_on_different_adapters(self):
+        devices = [VirtualDevice("a", SettableJoystick(), L2CAPTransport("00:11:22:33:44:55")),
+                   VirtualDevice("b", SettableJoystick(), L2CAPTransport("00:11:22:33:44:66")),
+                   VirtualDevice("c", SettableJoystick(), LoopbackTransport()),
+                   VirtualDevice("d", SettableJoystick(), LoopbackTransport())]
+        try:
+            self.assertEqual(4, len(MultiDeviceMain(devices).devices))
+        finally:
+            devices[2].transport.close()
+            devices[3].transport.close()
+
+    def test_profile_path_per_device(self):
+        device = VirtualDevice("seat 1", SettableJoystick(), L2CAPTransport("00:11:22:33:44:55"))
+        self.assertEqual("/bluez/gcc/gcc_joy_profile_seat_1", device.profile_path)
+
+    def test_eight_devices_at_250hz(self):
+        result = run_multi_device(8, 250, 1.0)
+        # every host receives (nearly) every report - leaving room for a loaded test machine
+        self.assertGreaterEqual(result["min_received_rate"], 200, result)
+
+    def test_failed_device_does_not_stop_others(self):
+        good = VirtualDevice("good", SettableJoystick(), LoopbackTransport(), rate=250)
+        broken = VirtualDevice("broken", SettableJoystick(), LoopbackTransport(os.path.join(good.transport.directory, "missing")))
+        main = MultiDeviceMain([broken, good])
+        thread = threading.Thread(target=main.run, daemon=True)
+        thread.start()
+        host = SimulatedHost(good.transport, good.report_layout)
+        try:
+            host.connect()
+            host.start()
+            good.joystick.set(button_bits=1)
+            self.assertIsNotNone(host.get_report())
+            self.assertIsInstance(main.failures["broken"], OSError)
+            self.assertNotIn("good", main.failures)
+        finally:
+            main.stop()
+            thread.join(5.0)
+            host.close()
+            good.transport.close()
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bt_joystick.recording import HEADER, ReportRecorder, ReportReplayer
+from tests.test_loopback_session import LoopbackSessionTestCase, wait_until
+
+
+def _open_files():
+    return len(os.listdir("/proc/self/fd"))
+
+
+class RecordingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="bt_joystick_recording_")
+        self.path = os.path.join(self.directory, "session.btjr")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def replay(self):
+        replayer = ReportReplayer(self.path)
+        try:
+            return [(timestamp, bytes(report)) for timestamp, report in replayer]
+        finally:
+            replayer.close()
+
+
+class TestReportRecorder(RecordingTestCase):
+    def test_record_and_replay(self):
+        recorder = ReportRecorder(self.path, report_size=8, sync_every=2)
+        for i in range(5):
+            recorder.record(bytes([0xa1, i] * (i % 4 + 1))[:8], timestamp=10.0 + i)
+        recorder.close()
+        recorder.close()  # closing again does nothing
+
+        self.assertEqual([(10.0 + i, bytes([0xa1, i] * (i % 4 + 1))[:8]) for i in range(5)], self.replay())
+        self.assertEqual(5, recorder.records)
+
+    def test_idle_batch_is_written_after_sync_interval(self):
+        recorder = ReportRecorder(self.path, report_size=8, sync_every=64, sync_interval=0.05)
+        try:
+            recorder.record(b"\xa1\x01", timestamp=1.0)
+            recorder.record(b"\xa1\x02", timestamp=2.0)
+            # no more reports are recorded and nothing calls sync
+            self.assertTrue(wait_until(lambda: recorder.syncs == 1, timeout=2.0))
+            self.assertEqual([(1.0, b"\xa1\x01"), (2.0, b"\xa1\x02")], self.replay())
+        finally:
+            recorder.close()
+
+    def test_appending_drops_partly_written_record(self):
+        recorder = ReportRecorder(self.path, report_size=8)
+        recorder.record(b"\xa1\x01", timestamp=1.0)
+        recorder.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\x00\x01\x02")
+
+        recorder = ReportRecorder(self.path, report_size=8)
+        recorder.record(b"\xa1\x02", timestamp=2.0)
+        recorder.close()
+        self.assertEqual([(1.0, b"\xa1\x01"), (2.0, b"\xa1\x02")], self.replay())
+
+    def test_report_longer_than_report_size(self):
+        recorder = ReportRecorder(self.path, report_size=4)
+        try:
+            with self.assertRaises(ValueError):
+                recorder.record(b"\xa1\x01\x02\x03\x04")
+        finally:
+            recorder.close()
+
+    def test_file_is_closed_when_header_is_invalid(self):
+        ReportRecorder(self.path, report_size=8).close()
+        open_files = _open_files()
+        with self.assertRaises(ValueError):
+            ReportRecorder(self.path, report_size=16)
+        self.assertEqual(open_files, _open_files())
+
+        with open(self.path, "wb") as f:
+            f.write(b"not a recording" + bytes(HEADER.size))
+        with self.assertRaises(ValueError):
+            ReportRecorder(self.path)
+        self.assertEqual(open_files, _open_files())
+
+
+class TestReportReplayer(RecordingTestCase):
+    def setUp(self):
+        super(TestReportReplayer, self).setUp()
+        recorder = ReportRecorder(self.path, report_size=8)
+        recorder.record(b"\xa1\x01", timestamp=1.0)
+        recorder.record(b"\xa1\x02", timestamp=2.0)
+        recorder.close()
+
+    def test_close(self):
+        replayer = ReportReplayer(self.path)
+        self.assertEqual([b"\xa1\x01", b"\xa1\x02"], [bytes(report) for _, report in replayer])
+        replayer.close()
+        self.assertTrue(replayer._mmap.closed)
+        replayer.close()  # closing again does nothing
+
+    def test_close_while_reports_are_referenced(self):
+        replayer = ReportReplayer(self.path)
+        _, report = replayer[1]
+        replayer.close()
+        # mapping stays until the report is dropped
+        self.assertEqual(b"\xa1\x02", bytes(report))
+        self.assertFalse(replayer._mmap.closed)
+
+
+class TestRecordingSession(LoopbackSessionTestCase):
+    def create_recorder(self):
+        self.directory = tempfile.mkdtemp(prefix="bt_joystick_recording_")
+        self.path = os.path.join(self.directory, "session.btjr")
+        self.recorder = ReportRecorder(self.path, sync_interval=60.0)
+        return self.recorder
+
+    def test_recorder_is_closed_when_device_stops(self):
+        try:
+            self.joystick.set([1, 2, 3, 4])
+            self.received(1)
+            self.joystick.set([5, 6, 7, 8])
+            self.received(2)
+            self.main.stop()
+            self.thread.join(5.0)
+
+            self.assertTrue(self.recorder.closed)
+            self.assertTrue(self.recorder.file.closed)
+            self.assertFalse(self.recorder._writer.is_alive())
+            replayer = ReportReplayer(self.path)
+            try:
+                self.assertEqual(list(self.host.reports), [bytes(report) for _, report in replayer])
+            finally:
+                replayer.close()
+        finally:
+            shutil.rmtree(self.directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
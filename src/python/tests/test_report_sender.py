@@ -0,0 +1,125 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import socket
+import unittest
+
+from bt_joystick.report_sender import CoalescingReportSender
+from bt_joystick.stats import PipelineStats
+
+
+class ListRecorder:
+    def __init__(self):
+        self.reports = []
+
+    def record(self, report, timestamp=None):
+        self.reports.append(bytes(report))
+
+
+class ShortSendSocket:
+    """
+    Socket accepting at most limit bytes per send - as stream sockets do when their buffer is nearly full
+    """
+    def __init__(self, sock, limit):
+        self.sock = sock
+        self.limit = limit
+
+    def send(self, data, flags=0):
+        return self.sock.send(data[:self.limit], flags)
+
+
+class TestCoalescingReportSender(unittest.TestCase):
+    def setUp(self):
+        self.device, self.host = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.host.setblocking(False)
+        self.stats = PipelineStats()
+        self.recorder = ListRecorder()
+        self.sender = CoalescingReportSender(self.device, stats=self.stats, recorder=self.recorder)
+
+    def tearDown(self):
+        self.device.close()
+        self.host.close()
+
+    def fill(self):
+        filler = []
+        try:
+            while True:
+                self.device.send(b"\x00", socket.MSG_DONTWAIT)
+                filler.append(b"\x00")
+        except BlockingIOError:
+            pass
+        return filler
+
+    def receive_all(self):
+        received = []
+        try:
+            while True:
+                received.append(self.host.recv(64))
+        except BlockingIOError:
+            pass
+        return received
+
+    def test_send(self):
+        report = bytearray(b"\xa1\x01\x02")
+        self.assertTrue(self.sender.submit(report))
+        report[1] = 5  # caller can reuse its buffer
+        self.assertTrue(self.sender.submit(report))
+
+        self.assertEqual([b"\xa1\x01\x02", b"\xa1\x05\x02"], self.receive_all())
+        self.assertEqual([b"\xa1\x01\x02", b"\xa1\x05\x02"], self.recorder.reports)
+        self.assertEqual(2, self.sender.sent)
+        self.assertEqual(2, self.stats.counters[PipelineStats.REPORTS_SENT])
+        self.assertFalse(self.sender.pending)
+
+    def test_would_block_keeps_newest_report_per_id(self):
+        filler = self.fill()
+
+        self.assertFalse(self.sender.submit(b"\xa1\x01", report_id=1))
+        self.assertFalse(self.sender.submit(b"\xa2\x01", report_id=2))
+        self.assertFalse(self.sender.submit(b"\xa1\x02", report_id=1))
+        self.assertFalse(self.sender.submit(b"\xa1\x03", report_id=1))
+        self.assertTrue(self.sender.pending)
+        self.assertEqual(4, self.sender.would_block)
+        self.assertEqual(2, self.sender.dropped)
+        self.assertEqual(2, self.stats.counters[PipelineStats.REPORTS_DROPPED])
+        self.assertEqual([], self.recorder.reports)
+
+        self.assertEqual(filler, self.receive_all())
+        self.assertTrue(self.sender.flush())
+        self.assertFalse(self.sender.pending)
+        self.assertGreater(self.sender.blocked_time, 0.0)
+
+        # only the newest report of each ID is sent and recorded - dropped ones are not
+        self.assertEqual([b"\xa1\x03", b"\xa2\x01"], sorted(self.receive_all()))
+        self.assertEqual([b"\xa1\x03", b"\xa2\x01"], sorted(self.recorder.reports))
+        self.assertEqual(2, self.sender.sent)
+
+    def test_partial_send(self):
+        self.tearDown()
+        self.device, self.host = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.host.setblocking(False)
+        sock = ShortSendSocket(self.device, 2)
+        sender = CoalescingReportSender(sock, stats=self.stats, recorder=self.recorder)
+
+        self.assertFalse(sender.submit(b"\xa1\x01\x02\x03\x04"))
+        self.assertTrue(sender.pending)
+        self.assertEqual(0, sender.sent)
+        # the report is recorded once, when sending it starts
+        self.assertEqual([b"\xa1\x01\x02\x03\x04"], self.recorder.reports)
+
+        # remainder of the report goes before the next pending report
+        self.assertFalse(sender.submit(b"\xa1\x05", report_id=1))
+        self.assertEqual(0, sender.sent)
+        self.assertTrue(sender.flush())
+        self.assertEqual(2, sender.sent)
+        self.assertFalse(sender.pending)
+
+        self.assertEqual(b"\xa1\x01\x02\x03\x04\xa1\x05", b"".join(self.receive_all()))
+        self.assertEqual([b"\xa1\x01\x02\x03\x04", b"\xa1\x05"], self.recorder.reports)
+
+
+if __name__ == "__main__":
+    unittest.main()
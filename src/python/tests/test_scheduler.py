@@ -0,0 +1,116 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import threading
+import unittest
+
+from bt_joystick.scheduler import FixedRateScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeEvent:
+    # threading.Event that is already set or times out straight away on the fake clock
+    def __init__(self, clock):
+        self.clock = clock
+        self.flag = False
+        self.waits = 0
+
+    def set(self):
+        self.flag = True
+
+    def clear(self):
+        self.flag = False
+
+    def is_set(self):
+        return self.flag
+
+    def wait(self, timeout):
+        self.waits += 1
+        if not self.flag:
+            self.clock.now += timeout
+        return self.flag
+
+
+class TestFixedRateScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = FixedRateScheduler(100, clock=self.clock, sleep=self.clock.sleep)
+        self.scheduler.start()
+
+    def test_deadlines_do_not_drift(self):
+        for i in range(5):
+            self.clock.now += 0.003  # loop body
+            self.assertEqual(0.0, self.scheduler.wait())
+        self.assertAlmostEqual(100.05, self.clock.now)
+        self.assertEqual(5, self.scheduler.ticks)
+        self.assertEqual(0, self.scheduler.overruns)
+
+    def test_overrun_skips_missed_deadlines(self):
+        self.clock.now += 0.035
+        self.assertAlmostEqual(0.025, self.scheduler.wait())
+        self.assertEqual(1, self.scheduler.overruns)
+        self.assertEqual(2, self.scheduler.missed_deadlines)
+        self.scheduler.wait()
+        self.assertAlmostEqual(100.04, self.clock.now)
+
+    def test_deadline_met_exactly_is_not_overrun(self):
+        self.clock.now += 0.01
+        self.assertEqual(0.0, self.scheduler.wait())
+        self.assertEqual(0, self.scheduler.overruns)
+        self.assertEqual(0.0, self.scheduler.max_lateness)
+
+    def test_wake_event(self):
+        event = FakeEvent(self.clock)
+        self.scheduler.wake_event = event
+        event.set()
+        self.assertEqual(0.0, self.scheduler.wait())
+        self.assertEqual(1, self.scheduler.wakeups)
+        self.assertFalse(event.is_set())
+        self.assertEqual(100.0, self.clock.now)
+
+        self.scheduler.wait()  # deadline isn't moved by the wakeup
+        self.assertAlmostEqual(100.01, self.clock.now)
+
+    def test_event_set_during_overrun_is_cleared(self):
+        event = FakeEvent(self.clock)
+        self.scheduler.wake_event = event
+        self.clock.now += 0.015
+        event.set()
+        self.scheduler.wait()
+        self.assertFalse(event.is_set())
+        self.assertEqual(1, self.scheduler.overruns)
+
+        self.scheduler.wait()  # no spurious wakeup - waits for the next deadline
+        self.assertEqual(0, self.scheduler.wakeups)
+        self.assertAlmostEqual(100.02, self.clock.now)
+
+    def test_real_event(self):
+        scheduler = FixedRateScheduler(1)
+        scheduler.wake_event = threading.Event()
+        scheduler.start()
+        scheduler.wake_event.set()
+        self.assertEqual(0.0, scheduler.wait())
+        self.assertEqual(1, scheduler.wakeups)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            FixedRateScheduler(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
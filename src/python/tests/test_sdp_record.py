@@ -0,0 +1,87 @@
+#
+# Copyright 2019 Games Creators Club
+#
+# MIT License
+#
+
+import unittest
+
+from bt_joystick.joystick_description import DEFAULT_JOYSTICK_DESCRIPTION
+from bt_joystick.sdp_record import Attribute, Bool8, SDPRecord, Sequence, ServiceClassIDList, Text, UInt8, UInt16, UInt32, URL, UUID, \
+    create_simple_HID_SDP_Report
+
+
+class TestDataElements(unittest.TestCase):
+    def test_fixed_size_elements(self):
+        self.assertEqual(b"\x08\x05", UInt8(5).encode())
+        self.assertEqual(b"\x09\x11\x24", UInt16(0x1124).encode())
+        self.assertEqual(b"\x0a\x00\x01\x00\x00", UInt32(0x10000).encode())
+        self.assertEqual(b"\x28\x01", Bool8(True).encode())
+        self.assertEqual(b"\x28\x00", Bool8(False).encode())
+
+    def test_uuids(self):
+        self.assertEqual(b"\x19\x11\x24", UUID(0x1124).encode())
+        self.assertEqual(b"\x1a\x00\x01\x11\x24", UUID(0x11124).encode())
+        self.assertEqual(b"\x1c" + bytes(11) + b"\x01\x00\x00\x00\x01", UUID(0x100000001).encode())
+
+    def test_text_and_url(self):
+        self.assertEqual(b"\x25\x03abc", Text("abc").encode())
+        self.assertEqual(b"\x25\x02\x05\x01", Text("0501", encoding="hex").encode())
+        self.assertEqual(b"\x26\x01\x2c" + b"a" * 300, Text("a" * 300).encode())
+        self.assertEqual(b"\x45\x0ahttp://gcc", URL("http://gcc").encode())
+
+    def test_sequences(self):
+        self.assertEqual(b"\x35\x03\x19\x11\x24", Sequence(UUID(0x1124)).encode())
+        self.assertEqual(b"\x35\x07\x35\x03\x19\x01\x00\x08\x01", Sequence(Sequence(UUID(0x0100)), UInt8(1)).encode())
+        self.assertEqual(b"\x09\x00\x01\x35\x03\x19\x11\x24", ServiceClassIDList(0x1124).encode())
+
+    def test_encoded_size(self):
+        for element in (UInt8(5), UInt32(7), UUID(0x11124), Text("a" * 300), Text("a" * 0x10000),
+                        Sequence(Text("abc"), Sequence()), ServiceClassIDList(0x1124, 0x1200)):
+            self.assertEqual(len(element.encode()), element.encoded_size(), element)
+
+
+class TestSDPRecord(unittest.TestCase):
+    def test_encode(self):
+        record = SDPRecord()
+        record += Attribute(0x0200, UInt16(0x0100))
+        record += ServiceClassIDList(0x1124)
+        # attributes are encoded in order of their ids
+        self.assertEqual(b"\x35\x0e" + b"\x09\x00\x01\x35\x03\x19\x11\x24" + b"\x09\x02\x00\x09\x01\x00", record.encode())
+        self.assertEqual(len(record.encode()), record.encoded_size())
+
+    def test_hid_record_encoded_size(self):
+        record = create_simple_HID_SDP_Report("Name", "Description", "Provider", DEFAULT_JOYSTICK_DESCRIPTION.hid_descriptor())
+        self.assertEqual(len(record.encode()), record.encoded_size())
+        self.assertTrue(record.fits())
+
+    def test_fits_at_the_limit(self):
+        # record header (3 bytes), attribute id (3 bytes) and text header (3 bytes) plus 8 bytes of the response
+        record = SDPRecord() + Attribute(0x0100, Text("a" * 655))
+        self.assertEqual(SDPRecord.SDP_DEFAULT_MTU - 8, record.encoded_size())
+        self.assertTrue(record.fits())
+
+        record = SDPRecord() + Attribute(0x0100, Text("a" * 656))
+        self.assertFalse(record.fits())
+        self.assertTrue(record.fits(SDPRecord.SDP_DEFAULT_MTU + 1))
+
+
+class TestXML(unittest.TestCase):
+    def test_escaping(self):
+        record = SDPRecord() + Attribute(0x0100, Text("<a & \"b\">"))
+        self.assertIn("<text value=\"&lt;a &amp; &quot;b&quot;&gt;\" />", record.xml())
+
+    def test_ampersand_is_escaped_first(self):
+        record = SDPRecord() + Attribute(0x0100, URL("&lt;"))
+        self.assertIn("<url value=\"&amp;lt;\" />", record.xml())
+
+    def test_uint32(self):
+        record = SDPRecord() + Attribute(0x0002, UInt32(0x10000))
+        self.assertIn("<uint32 value=\"0x00010000\" />", record.xml())
+
+    def test_element_xml(self):
+        self.assertEqual("\t<uint16 value=\"0x0100\" />\n", UInt16(0x0100).xml(1, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()